@@ -0,0 +1,192 @@
+# -*- coding:utf-8 -*-
+"""
+批量回合分析: 将一批长度不同的权益曲线(env.portfolio_value_logs)与订单
+(env.ledger.orders)对齐为[episode, step]的数组, 对所有回合一次向量化计算
+年化收益率, 波动率, Sharpe, Sortino, 最大回撤及其持续天数, 换手率, 交易费拖累,
+胜率, 以及与Market.indexs_history中指数的比较
+NOTE(wen): 回合结束之后的位置用最后的权益填充(收益率为0), 统计时按回合长度
+    排除这些位置
+"""
+import numpy as np
+
+from tgym.ledger import ORDER_DTYPE
+
+# 一年的交易日数
+PERIODS = 252
+
+
+def pad_curves(curves, investment=100000.0):
+    """
+    curves: [回合的每步权益], 长度可以不同
+    investment: 初始资金, 单个值或每回合一个
+    返回: values: [episode, max_len + 1], 第0列为初始资金, 回合结束之后为最后
+        的权益; lengths: [episode], 每回合的步数
+    """
+    n = len(curves)
+    lengths = np.fromiter((len(c) for c in curves), np.int64, n)
+    width = int(lengths.max()) + 1 if n else 1
+    values = np.empty((n, width))
+    values[:, 0] = investment
+    if lengths.sum() > 0:
+        flat = np.concatenate([np.asarray(c, dtype=np.float64)
+                               for c in curves])
+        rows = np.repeat(np.arange(n), lengths)
+        offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        values[rows, np.arange(len(flat)) - offsets + 1] = flat
+    cols = np.minimum(np.arange(width), lengths[:, None])
+    return np.take_along_axis(values, cols, axis=1), lengths
+
+
+def masked_mean_std(x, mask, n):
+    # 每行mask为True的元素的均值与标准差(ddof=1), 不足2个元素时标准差为nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(mask, x, 0).sum(axis=1) / n
+        var = (np.where(mask, x - mean[:, None], 0) ** 2).sum(axis=1) / (
+            n - 1)
+    return mean, np.sqrt(np.where(n > 1, var, np.nan))
+
+
+class EpisodeBatch:
+    """
+    curves: [portfolio_value_logs], 每回合每步收盘之后的总权益
+    orders: [ledger.orders], 与curves一一对应, 为None时不计算换手率与交易费
+    start_ids: [episode], 每回合第一步的time_id(在market.open_dates中的位置),
+        与指数比较时需要
+    investment: 初始资金, 单个值或每回合一个
+    """
+
+    def __init__(self, curves, orders=None, start_ids=None,
+                 investment=100000.0):
+        self.values, self.lengths = pad_curves(curves, investment)
+        self.n = len(self.lengths)
+        self.mask = np.arange(self.values.shape[1] - 1) < \
+            self.lengths[:, None]
+        self.returns = self.get_returns(self.values)
+        self.start_ids = None if start_ids is None else np.asarray(start_ids)
+        self.traded_amount, self.fees = None, None
+        if orders is not None:
+            sizes = np.fromiter((len(o) for o in orders), np.int64,
+                                len(orders))
+            episodes = np.repeat(np.arange(len(orders)), sizes)
+            orders = np.concatenate(orders) if len(orders) else \
+                np.zeros(0, dtype=ORDER_DTYPE)
+            self.traded_amount = np.bincount(
+                episodes, orders["price"] * orders["volume"],
+                minlength=self.n)
+            self.fees = np.bincount(episodes, orders["fee"],
+                                    minlength=self.n)
+
+    @classmethod
+    def from_store(cls, store, investment=100000.0):
+        """
+        从TrajectoryStore(见tgym/trajectory.py)读取所有回合
+        """
+        starts = store.episodes["start"][1:]
+        curves = np.split(np.asarray(store.steps["portfolio_value"]), starts)
+        order_starts = np.searchsorted(store.orders["step"], starts)
+        orders = np.split(np.asarray(store.orders), order_starts)
+        return cls(curves, orders, store.episodes["time_id"], investment)
+
+    def get_returns(self, values):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            returns = values[:, 1:] / values[:, :-1] - 1
+        return np.where(self.mask, returns, 0.0)
+
+    def annualize(self, x, periods):
+        # 按回合长度年化
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return x * periods / self.lengths
+
+    def metrics(self, periods=PERIODS, risk_free=0.0):
+        """
+        periods: 一年的交易日数; risk_free: 年化无风险利率
+        返回: dict, 指标名 -> [episode]数组:
+            total_return, annual_return, volatility, sharpe, sortino,
+            max_drawdown, max_drawdown_days(最长的低于前高的天数), hit_rate
+            (收益率不为0的天中盈利天数的比例); 有订单时还有turnover(年化的
+            成交额/平均权益), fee_drag(年化的交易费/平均权益)
+        """
+        values, returns, mask, n = (self.values, self.returns, self.mask,
+                                    self.lengths)
+        total_return = values[:, -1] / values[:, 0] - 1
+        mean, std = masked_mean_std(returns, mask, n)
+        excess = mean - risk_free / periods
+        downside = np.where(mask, np.minimum(returns - risk_free / periods,
+                                             0), 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            annual_return = (1 + total_return) ** (periods / n) - 1
+            sharpe = excess / std * np.sqrt(periods)
+            downside_std = np.sqrt((downside ** 2).sum(axis=1) / n)
+            sortino = excess / downside_std * np.sqrt(periods)
+            hit_rate = ((returns > 0) & mask).sum(axis=1) / \
+                ((returns != 0) & mask).sum(axis=1)
+
+        peaks = np.maximum.accumulate(values, axis=1)
+        steps = np.arange(values.shape[1])
+        last_peak = np.maximum.accumulate(
+            np.where(values >= peaks, steps, 0), axis=1)
+        # 回合结束之后不再计入低于前高的天数
+        below_days = np.where(steps <= n[:, None], steps - last_peak, 0)
+        result = {
+            "total_return": total_return,
+            "annual_return": annual_return,
+            "volatility": std * np.sqrt(periods),
+            "sharpe": sharpe,
+            "sortino": sortino,
+            "max_drawdown": (1 - values / peaks).max(axis=1),
+            "max_drawdown_days": below_days.max(axis=1),
+            "hit_rate": hit_rate}
+        if self.traded_amount is not None:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean_value = np.where(mask, values[:, 1:], 0).sum(axis=1) / n
+            result["turnover"] = self.annualize(
+                self.traded_amount / mean_value, periods)
+            result["fee_drag"] = self.annualize(self.fees / mean_value,
+                                                periods)
+        return result
+
+    def get_index_curves(self, market, index="000001.SH"):
+        """
+        与values对齐的指数收盘价: 第0列为每回合第一步前一开市日的收盘价
+        """
+        if self.start_ids is None:
+            raise Exception(u"与指数比较需要每回合第一步的start_ids")
+        if index not in market.indexs_history:
+            raise Exception(u"Market中没有指数%s的数据" % index)
+        closes = market.indexs_history[index]["close"].reindex(
+            market.open_dates).ffill().to_numpy()
+        cols = np.minimum(np.arange(self.values.shape[1]),
+                          self.lengths[:, None])
+        ids = self.start_ids[:, None] - 1 + cols
+        return closes[np.clip(ids, 0, len(closes) - 1)]
+
+    def compare_index(self, market, index="000001.SH", periods=PERIODS):
+        """
+        与同期指数比较, 返回: dict, 指标名 -> [episode]数组:
+            index_return, index_annual_return, excess_annual_return, beta,
+            tracking_error, information_ratio
+        """
+        index_values = self.get_index_curves(market, index)
+        index_returns = self.get_returns(index_values)
+        mask, n = self.mask, self.lengths
+        index_return = index_values[:, -1] / index_values[:, 0] - 1
+        active = self.returns - index_returns
+        active_mean, active_std = masked_mean_std(active, mask, n)
+        mean, _ = masked_mean_std(self.returns, mask, n)
+        index_mean, index_std = masked_mean_std(index_returns, mask, n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = np.where(mask, (self.returns - mean[:, None]) *
+                           (index_returns - index_mean[:, None]),
+                           0).sum(axis=1) / (n - 1)
+            index_annual_return = (1 + index_return) ** (periods / n) - 1
+            annual_return = (self.values[:, -1] / self.values[:, 0]) ** (
+                periods / n) - 1
+            beta = cov / index_std ** 2
+            information_ratio = active_mean / active_std * np.sqrt(periods)
+        return {
+            "index_return": index_return,
+            "index_annual_return": index_annual_return,
+            "excess_annual_return": annual_return - index_annual_return,
+            "beta": beta,
+            "tracking_error": active_std * np.sqrt(periods),
+            "information_ratio": information_ratio}
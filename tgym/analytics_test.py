@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tgym.analytics import EpisodeBatch, pad_curves
+from tgym.envs.average import AverageEnv
+from tgym.generator import generate_market
+from tgym.trajectory import TrajectoryRecorder, TrajectoryStore
+
+logging.root.setLevel(logging.ERROR)
+
+
+def run_episodes(env, n_episodes, n_steps, seed=0):
+    # 返回每回合的权益曲线, 订单与第一步的time_id
+    rng = np.random.RandomState(seed)
+    curves, orders, start_ids = [], [], []
+    for i in range(n_episodes):
+        env.reset()
+        start_ids.append(env.current_time_id)
+        for _ in range(n_steps + i):
+            env.step(rng.uniform(-1, 1, env.action_size).tolist())
+        curves.append(list(env.portfolio_value_logs))
+        orders.append(env.ledger.orders.copy())
+    return curves, orders, start_ids
+
+
+class TestAnalytics(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.m = generate_market("20190101", "20191231",
+                                 ["000001.SZ", "600000.SH"], seed=2,
+                                 suspend_prob=0.0)
+        self.env = AverageEnv(self.m, look_back_days=5,
+                              reward_fn="daily_return")
+        self.curves, self.orders, self.start_ids = run_episodes(
+            self.env, 4, 30)
+        self.batch = EpisodeBatch(self.curves, self.orders, self.start_ids)
+
+    def test_pad_curves(self):
+        values, lengths = pad_curves([[101, 99], [102], []], 100)
+        np.testing.assert_array_equal([2, 1, 0], lengths)
+        np.testing.assert_array_equal(
+            [[100, 101, 99], [100, 102, 102], [100, 100, 100]], values)
+
+    def test_metrics(self):
+        result = self.batch.metrics()
+        for i, curve in enumerate(self.curves):
+            values = np.array([100000.0] + curve)
+            returns = values[1:] / values[:-1] - 1
+            self.assertAlmostEqual(values[-1] / values[0] - 1,
+                                   result["total_return"][i])
+            self.assertAlmostEqual(returns.std(ddof=1) * np.sqrt(252),
+                                   result["volatility"][i])
+            self.assertAlmostEqual(
+                returns.mean() / returns.std(ddof=1) * np.sqrt(252),
+                result["sharpe"][i])
+            downside = np.sqrt((np.minimum(returns, 0) ** 2).mean())
+            self.assertAlmostEqual(returns.mean() / downside * np.sqrt(252),
+                                   result["sortino"][i])
+            # 逐个回合计算最大回撤
+            drawdowns = 1 - values / np.maximum.accumulate(values)
+            self.assertAlmostEqual(drawdowns.max(),
+                                   result["max_drawdown"][i])
+            days, longest = 0, 0
+            for v, peak in zip(values, np.maximum.accumulate(values)):
+                days = days + 1 if v < peak else 0
+                longest = max(longest, days)
+            self.assertEqual(longest, result["max_drawdown_days"][i])
+            self.assertAlmostEqual(
+                (returns > 0).sum() / (returns != 0).sum(),
+                result["hit_rate"][i])
+            orders = self.orders[i]
+            amount = (orders["price"] * orders["volume"]).sum()
+            self.assertAlmostEqual(
+                amount / values[1:].mean() * 252 / len(curve),
+                result["turnover"][i])
+            self.assertAlmostEqual(
+                orders["fee"].sum() / values[1:].mean() * 252 / len(curve),
+                result["fee_drag"][i])
+
+    def test_compare_index(self):
+        result = self.batch.compare_index(self.m, "399001.SZ")
+        closes = self.m.indexs_history["399001.SZ"]["close"].to_numpy()
+        for i, curve in enumerate(self.curves):
+            start = self.start_ids[i]
+            index_values = closes[start - 1: start + len(curve)]
+            self.assertAlmostEqual(index_values[-1] / index_values[0] - 1,
+                                   result["index_return"][i])
+            returns = np.diff(np.array([100000.0] + curve)) / \
+                np.array([100000.0] + curve[:-1])
+            index_returns = index_values[1:] / index_values[:-1] - 1
+            beta = np.cov(returns, index_returns)[0, 1] / \
+                index_returns.var(ddof=1)
+            self.assertAlmostEqual(beta, result["beta"][i])
+            active = returns - index_returns
+            self.assertAlmostEqual(active.std(ddof=1) * np.sqrt(252),
+                                   result["tracking_error"][i])
+        with self.assertRaises(Exception):
+            EpisodeBatch(self.curves).compare_index(self.m)
+
+    def test_from_store(self):
+        path = tempfile.mkdtemp()
+        env = TrajectoryRecorder(self.env, path, chunk_size=16)
+        curves, orders, start_ids = run_episodes(env, 3, 10, seed=1)
+        env.close()
+        batch = EpisodeBatch.from_store(TrajectoryStore(path))
+        expected = EpisodeBatch(curves, orders, start_ids)
+        for key, value in expected.metrics().items():
+            np.testing.assert_allclose(value, batch.metrics()[key])
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+# -*- coding:utf-8 -*-
+"""
+env.step吞吐性能测试: 在tgym/generator.py生成的离线数据上, 对不同的scenario,
+股票数量, look_back_days与reward函数, 测量steps/sec, 每步延迟的分位数以及每步
+分配的内存, 结果写入JSON文件, 可以在不同的提交之间比较:
+
+    python -m tgym.benchmark --output before.json
+    python -m tgym.benchmark --output after.json --baseline before.json
+
+NOTE(wen): SimpleEnv只交易第一支股票, 只在n_codes=1时测试
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from tgym.envs.reward import get_code_reward_func
+from tgym.generator import generate_market
+from tgym.scenario import make_env
+
+SCENARIOS = ["simple", "average", "multi_vol"]
+N_CODES = [1, 10, 100, 1000]
+LOOK_BACK_DAYS = [5, 20, 60, 250]
+REWARD_FNS = ["simple", "daily_return", "daily_return_add_count_rate",
+              "daily_return_add_price_bound",
+              "daily_return_with_chl_penalty"]
+USED_INFOS = ["equities_hfq_info", "indexs_info"]
+# 一个case的唯一标识, 用于与baseline对比
+CASE_KEYS = ["scenario", "n_codes", "look_back_days", "reward_fn"]
+
+
+def make_market(n_codes, n_dates, seed=0):
+    """
+    生成n_dates个开市日的Market
+    """
+    codes = ["%06d.SZ" % (i + 1) for i in range(n_codes)]
+    end = pd.bdate_range("20100101", periods=n_dates)[-1].strftime("%Y%m%d")
+    return generate_market("20100101", end, codes, seed=seed)
+
+
+def run_case(market, scenario, look_back_days, reward_fn, n_steps=500,
+             n_alloc_steps=100, seed=0):
+    """
+    在market上创建env并step n_steps次, market至少要有
+    look_back_days + n_steps个开市日
+    返回: dict, 测试结果
+    """
+    start = time.perf_counter()
+    env = make_env(scenario, market, 100000.0, look_back_days, USED_INFOS,
+                   reward_fn)
+    init_sec = time.perf_counter() - start
+    rng = np.random.RandomState(seed)
+    actions = rng.uniform(-1, 1, (n_steps, env.action_size)).tolist()
+
+    env.reset()
+    latencies = np.empty(n_steps)
+    for t in range(n_steps):
+        step_start = time.perf_counter()
+        _, _, done, _, _ = env.step(actions[t])
+        latencies[t] = time.perf_counter() - step_start
+        if done:
+            env.reset()
+
+    # tracemalloc会显著降低速度, 单独运行; 每步的峰值减去step之前的内存
+    # 为一步中分配的内存, 回合结束时仍保留的内存为每步新增的内存
+    n_alloc_steps = min(n_alloc_steps, n_steps)
+    tracemalloc.start()
+    env.reset()
+    allocated = np.empty(n_alloc_steps)
+    first_current, _ = tracemalloc.get_traced_memory()
+    for t in range(n_alloc_steps):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        env.step(actions[t])
+        _, peak = tracemalloc.get_traced_memory()
+        allocated[t] = peak - current
+    last_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": scenario, "n_codes": len(market.codes),
+        "look_back_days": look_back_days, "reward_fn": reward_fn,
+        "n_steps": n_steps,
+        "init_sec": init_sec,
+        "steps_per_sec": n_steps / latencies.sum(),
+        "latency_us_mean": latencies.mean() * 1e6,
+        "latency_us_p50": np.percentile(latencies, 50) * 1e6,
+        "latency_us_p90": np.percentile(latencies, 90) * 1e6,
+        "latency_us_p99": np.percentile(latencies, 99) * 1e6,
+        "latency_us_max": latencies.max() * 1e6,
+        "alloc_kb_per_step": allocated.mean() / 1024,
+        "retained_kb_per_step":
+            (last_current - first_current) / n_alloc_steps / 1024}
+
+
+def get_meta():
+    meta = {"python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pd.__version__, "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+    try:
+        meta["commit"] = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        meta["commit"] = None
+    return meta
+
+
+def run(scenarios=SCENARIOS, n_codes=N_CODES, look_back_days=LOOK_BACK_DAYS,
+        reward_fns=REWARD_FNS, n_steps=500, n_alloc_steps=100, seed=0,
+        log=None):
+    """
+    对所有参数组合运行run_case, 每种股票数量只生成一次Market
+    log: log(result), 每个case完成之后调用, 如打印进度
+    返回: dict, {"meta": 运行环境, "results": [run_case的结果]}
+    """
+    results = []
+    for n in n_codes:
+        cases = [(scenario, days, reward_fn)
+                 for scenario in scenarios if scenario != "simple" or n == 1
+                 for days in look_back_days
+                 for reward_fn in reward_fns]
+        if not cases:
+            continue
+        market = make_market(n, max(look_back_days) + n_steps + 1, seed)
+        for scenario, days, reward_fn in cases:
+            # 检查reward函数名, 出错时尽早报告
+            get_code_reward_func(reward_fn)
+            result = run_case(market, scenario, days, reward_fn, n_steps,
+                              n_alloc_steps, seed)
+            results.append(result)
+            if log is not None:
+                log(result)
+    return {"meta": get_meta(), "results": results}
+
+
+def get_case_key(result):
+    return tuple(result[key] for key in CASE_KEYS)
+
+
+def compare(baseline, report, metric="steps_per_sec"):
+    """
+    对比两次run的结果, 返回: [(case_key, baseline值, 当前值, 当前值/baseline值)]
+    只包含两次都运行了的case
+    """
+    base = {get_case_key(r): r[metric] for r in baseline["results"]}
+    rows = []
+    for r in report["results"]:
+        key = get_case_key(r)
+        if key in base:
+            rows.append((key, base[key], r[metric], r[metric] / base[key]))
+    return rows
+
+
+def write_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+
+
+def read_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def print_result(result):
+    print("%-9s n_codes=%-4d look_back_days=%-3d %-29s %9.1f steps/sec, "
+          "p99 %8.1fus, %7.1fKB/step" % (
+              result["scenario"], result["n_codes"],
+              result["look_back_days"], result["reward_fn"],
+              result["steps_per_sec"], result["latency_us_p99"],
+              result["alloc_kb_per_step"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=u"env.step吞吐性能测试")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS)
+    parser.add_argument("--n_codes", nargs="+", type=int, default=N_CODES)
+    parser.add_argument("--look_back_days", nargs="+", type=int,
+                        default=LOOK_BACK_DAYS)
+    parser.add_argument("--reward_fns", nargs="+", default=REWARD_FNS)
+    parser.add_argument("--n_steps", type=int, default=500)
+    parser.add_argument("--n_alloc_steps", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="tgym_benchmark.json")
+    parser.add_argument("--baseline", default="",
+                        help=u"之前运行的JSON结果, 打印steps/sec的变化")
+    args = parser.parse_args()
+    report = run(args.scenarios, args.n_codes, args.look_back_days,
+                 args.reward_fns, args.n_steps, args.n_alloc_steps,
+                 args.seed, log=print_result)
+    write_report(report, args.output)
+    if args.baseline:
+        for key, base, value, ratio in compare(read_report(args.baseline),
+                                               report):
+            print("%-70s %9.1f -> %9.1f (%.2fx)" % (
+                " ".join(str(k) for k in key), base, value, ratio))
+
+
+if __name__ == '__main__':
+    main()
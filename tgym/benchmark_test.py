@@ -0,0 +1,60 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from tgym.benchmark import (REWARD_FNS, compare, read_report, run,
+                            write_report)
+
+logging.root.setLevel(logging.ERROR)
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.report = run(n_codes=[1, 3], look_back_days=[5, 10],
+                          reward_fns=["daily_return",
+                                      "daily_return_with_chl_penalty"],
+                          n_steps=20, n_alloc_steps=5)
+
+    def test_run(self):
+        results = self.report["results"]
+        # simple只在n_codes=1时运行
+        self.assertEqual((3 + 2) * 2 * 2, len(results))
+        self.assertEqual(["simple"] * 4 + ["average"] * 4,
+                         [r["scenario"] for r in results[:8]])
+        for r in results:
+            self.assertEqual(20, r["n_steps"])
+            self.assertGreater(r["steps_per_sec"], 0)
+            self.assertLessEqual(r["latency_us_p50"], r["latency_us_p99"])
+            self.assertLessEqual(r["latency_us_p99"], r["latency_us_max"])
+            self.assertGreater(r["alloc_kb_per_step"], 0)
+        self.assertIn("commit", self.report["meta"])
+
+    def test_reward_fns(self):
+        # 默认的每个reward函数都可以运行, 包括有停牌的股票
+        report = run(n_codes=[1, 3], look_back_days=[5],
+                     reward_fns=REWARD_FNS, n_steps=20, n_alloc_steps=2)
+        results = report["results"]
+        self.assertEqual((3 + 2) * len(REWARD_FNS), len(results))
+        self.assertEqual(set(REWARD_FNS),
+                         set(r["reward_fn"] for r in results))
+
+    def test_report(self):
+        data_dir = tempfile.mkdtemp()
+        path = os.path.join(data_dir, "benchmark.json")
+        write_report(self.report, path)
+        report = read_report(path)
+        self.assertEqual(self.report["results"], report["results"])
+        rows = compare(report, self.report)
+        self.assertEqual(len(report["results"]), len(rows))
+        for key, base, value, ratio in rows:
+            self.assertEqual(1.0, ratio)
+        self.assertEqual(("simple", 1, 5, "daily_return"), rows[0][0])
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
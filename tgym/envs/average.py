@@ -22,22 +22,27 @@ class AverageEnv(BaseEnv):
 
     def __init__(self, market=None, investment=100000.0, look_back_days=10,
                  used_infos=["equities_hfq_info", "indexs_info"],
-                 reward_fn="daily_return_add_price_bound"):
+                 reward_fn="daily_return_add_price_bound", dtype=np.float32,
+                 info_mode="dict"):
         """
         investment: 初始资金
         look_back_days: 向前取数据的天数
+        dtype: observation的数据类型
+        info_mode: step返回的info类型, 见BaseEnv
         """
         super(AverageEnv, self).__init__(market, investment, look_back_days,
-                                         used_infos, reward_fn)
+                                         used_infos, reward_fn, dtype,
+                                         info_mode)
         self.avg_percent = 1.0 / self.n
-        self.action_space = 2 * self.n
+        self.action_size = 2 * self.n
         self.start = market.start
         self.portfolio_info_size = 2 * self.n
         self.input_size = self.market_info_size + self.portfolio_info_size
+        self.init_spaces()
 
     def get_init_portfolio_obs(self):
         # 初始持仓 状态
-        one_day = np.array([0] * (self.n * 2))
+        one_day = np.array([0] * (self.n * 2), dtype=self.dtype)
         obs = np.array([one_day] * self.look_back_days)
         return obs
 
@@ -46,17 +51,19 @@ class AverageEnv(BaseEnv):
         obs 由两部分组成: 市场信息, 帐户信息(收益率, 持仓量)
         """
         market_info = []
-        for date in self.dates[: self.look_back_days]:
-            market_info.append(self.get_market_info(date))
-        market_info = np.array(market_info)
+        for time_id in range(self.current_time_id - self.look_back_days,
+                             self.current_time_id):
+            market_info.append(self.get_market_info(time_id))
+        market_info = np.array(market_info, dtype=self.dtype)
         portfolio_info = self.get_init_portfolio_obs()
         return np.concatenate((market_info, portfolio_info), axis=1)
 
-    def get_action_price(self, action, code):
-        pre_close = self.market.get_pre_close_price(
-            code, self.current_date)
+    def get_action_price(self, action, id):
+        # id: code id
+        pre_close = self.market.get_pre_close_price_by_id(
+            id, self.current_time_id)
         logger.debug("%s %s pre_close: %.2f" %
-                     (self.current_date, code, pre_close))
+                     (self.current_date, self.codes[id], pre_close))
         [v_sell, v_buy] = action
         # scale [-1, 1] to [-0.1, 0.1]
         pct_sell, pct_buy = v_sell * 0.1, v_buy * 0.1
@@ -64,61 +71,67 @@ class AverageEnv(BaseEnv):
         buy_price = round(pre_close * (1 + pct_buy), 2)
         return sell_price, buy_price
 
+    def get_orders(self, action):
+        # 每支股票的卖出价, 卖出目标仓位, 买入价, 买入目标仓位, 见do_action_by_kernel
+        sell_prices, buy_prices = [], []
+        for i in range(self.n):
+            sell_price, buy_price = self.get_action_price(
+                action[2 * i: 2 * (i + 1)], i)
+            sell_prices.append(sell_price)
+            buy_prices.append(buy_price)
+        return (sell_prices, [0] * self.n, buy_prices,
+                [self.avg_percent] * self.n)
+
     def do_action(self, action, pre_portfolio_value, only_update):
-        cash_change = 0
+        if self.kernel is not None:
+            return self.do_action_by_kernel(
+                None if only_update else self.get_orders(action),
+                pre_portfolio_value, only_update)
+        # 每支股票当天卖出与买入的现金变化
+        cash_changes = [0] * self.n
         # 更新拆分信息
         for i in range(self.n):
-            code = self.codes[i]
-            divide_rate = self.market.get_divide_rate(code, self.current_date)
-            self.portfolios[i].update_before_trade(divide_rate)
+            divide_rate = self.market.get_divide_rate_by_id(
+                i, self.current_time_id)
+            self.portfolios[i].update_before_trade(divide_rate,
+                                                   self.current_date)
         sell_prices, buy_prices = [], []
         if only_update:
             sell_prices, buy_prices = [0] * self.n, [0] * self.n
         if not only_update:
             # 卖出
             for i in range(self.n):
-                code = self.codes[i]
                 act_i = action[2 * i: 2 * (i + 1)]
-                sell_price, _ = self.get_action_price(act_i, code)
+                sell_price, _ = self.get_action_price(act_i, i)
                 sell_prices.append(sell_price)
 
                 sell_cash_change, ok = self.sell(i, sell_price, 0)
-                cash_change += sell_cash_change
+                cash_changes[i] += sell_cash_change
             # 买进
             for i in range(self.n):
-                code = self.codes[i]
                 act_i = action[2 * i: 2 * (i + 1)]
-                _, buy_price = self.get_action_price(act_i, code)
+                _, buy_price = self.get_action_price(act_i, i)
                 buy_prices.append(buy_price)
 
                 buy_cash_change, ok = self.buy(i, buy_price, self.avg_percent)
-                cash_change += buy_cash_change
+                cash_changes[i] += buy_cash_change
 
         logger.debug("do_action: time_id: %d, cash_change: %.1f" % (
-            self.current_time_id, cash_change))
+            self.current_time_id, sum(cash_changes)))
 
         # update
         for i in range(self.n):
-            code = self.codes[i]
-            close_price = self.market.get_close_price(code, self.current_date)
+            close_price = self.market.get_close_price_by_id(
+                i, self.current_time_id)
             self.portfolios[i].update_after_trade(
                 close_price=close_price,
-                cash_change=cash_change,
+                cash_change=cash_changes[i],
                 pre_portfolio_value=pre_portfolio_value)
         return sell_prices, buy_prices
 
-    def _next(self):
-        market_info = self.get_market_info(self.current_date)
+    def get_portfolio_info(self):
         portfolio_info = []
         for i in range(self.n):
             portfolio_info.append(self.portfolios[i].daily_return)
             portfolio_info.append(self.portfolios[i].value_percent)
-        portfolio_info = np.array(portfolio_info)
-        new_obs = np.concatenate((market_info, portfolio_info), axis=0)
-        obs = np.concatenate((self.obs[1:, :],
-                              np.array([new_obs])), axis=0)
-        if not self.done:
-            self.current_time_id += 1
-            self.current_date = self.dates[self.current_time_id]
-        self.pre_cash = self.cash
-        return obs
+        return portfolio_info
@@ -1,23 +1,57 @@
 # -*- coding:utf-8 -*-
-import random
-
 import gym
 import numpy as np
+from gym import spaces
 
-from tgym.envs.reward import get_reward_func
+from tgym.envs.kernel import (ALL_TRANSACTION_COST, DAILY_PNL, DAILY_RETURN,
+                              FILL_VOLUME, MARKET_VALUE, PNL,
+                              TRANSACTION_COST, VALUE_PERCENT,
+                              PortfolioArrays, get_kernel)
+from tgym.envs.normalizer import ObsNormalizer
+from tgym.envs.reward import get_code_reward_func, get_reward_func
+from tgym.ledger import BUY, ORDER_DTYPE, SELL, OrderLedger
 from tgym.logger import logger
 from tgym.portfolio import Portfolio
 
 
+def get_step_info_dtype(n):
+    """
+    info_mode为"array"时step返回的info, n为股票数量
+    """
+    return np.dtype([
+        ("portfolio_value", np.float64),
+        ("daily_pnl", np.float64),
+        ("cash", np.float64),
+        ("reward", np.float64),
+        # 每支股票当天的成交量, 买入为正, 卖出为负
+        ("fill_volume", np.int64, (n,)),
+        # 每支股票当天的成交金额(不含交易费), 买入为正, 卖出为负
+        ("fill_amount", np.float64, (n,)),
+        ("fee", np.float64, (n,))])
+
+
+INFO_MODES = ["dict", "ledger", "array"]
+
+
 class BaseEnv(gym.Env):
     def __init__(self, market=None, investment=100000.0, look_back_days=10,
                  used_infos=["equities_hfq_info", "indexs_info"],
-                 reward_fn="daily_return_add_price_bound"):
+                 reward_fn="daily_return_add_price_bound", dtype=np.float32,
+                 info_mode="dict"):
         """
         investment: 初始资金
         look_back_days: 向前取数据的天数
+        dtype: observation的数据类型, 训练时默认使用float32
+        info_mode: step返回的info与rewards的类型:
+            dict: 每步新建包含orders, portfolio_value等的dict, rewards为list
+            ledger: 直接返回self.ledger, 不新建任何对象
+            array: 返回预先分配的self.step_info, 见get_step_info_dtype;
+                rewards也返回预先分配的[n]数组self.reward_array, 每步原地更新
         """
+        if info_mode not in INFO_MODES:
+            raise Exception(u"未知的info_mode: %s" % info_mode)
         self.market = market
+        self.dtype = np.dtype(dtype)
         # 股票数量
         self.n = len(market.codes)
         self.codes = market.codes
@@ -25,15 +59,52 @@ class BaseEnv(gym.Env):
         self.end = market.end
         self.look_back_days = look_back_days
         self.investment = investment
-        # 输入数据: 个股信息 + 指数信息
+        # 输入数据: 个股信息 + 指数信息 + 技术指标(见tgym/features.py)
         self.used_infos = used_infos
+        market.add_features(used_infos)
         self.market_info_size = self.get_market_info_size()
+        # [date, market_info_size], 与market共用, 见Market.get_market_info_array
+        self.market_infos = market.get_market_info_array(used_infos,
+                                                         self.dtype)
         # 开市日期列表
         self.dates = market.open_dates
         # 记录一个回合的收益序列
         self.returns = []
         self.reward_fn = get_reward_func(name=reward_fn)
+        # 每支股票的reward, 用于Multi-Agent算法
+        self.code_reward_fn = get_code_reward_func(name=reward_fn)
         self.reward_fn_name = reward_fn
+        # observation在线标准化, 默认不开启, 见set_obs_normalizer
+        self.obs_normalizer = None
+        # 按日期生效的交易费率表, 默认使用Portfolio的固定费率, 见set_fee_schedule
+        self.fee_schedule = None
+        self.info_mode = info_mode
+        # 每个回合的交易日数, 为None时从第look_back_days天运行到最后一天;
+        # 否则reset时用self.np_random随机选择回合开始的日期, 见set_episode_days
+        self.episode_days = None
+        self.last_time_id = None
+        self.seed()
+        # 直接写入transition的replay buffer, 见set_replay_buffer
+        self.replay_buffer = None
+        # 每日撮合与持仓更新的kernel, 见set_kernel
+        self.kernel_backend = None
+        self.kernel = None
+        self.init_buffers()
+
+    def init_buffers(self):
+        """
+        按env交易的股票数量self.n分配ledger与每步复用的数组; 子类改变self.n
+        (如SimpleEnv只交易第一支股票)之后需要重新调用
+        """
+        # 一个回合中所有成交的订单, 见tgym/ledger.py
+        self.ledger = OrderLedger(self.n)
+        self.step_info = np.zeros((), dtype=get_step_info_dtype(self.n))
+        self.reward_array = np.zeros(self.n, dtype=np.float64)
+        # 计算每支股票reward的输入: 当日收益率, 卖出价, 买入价
+        self.code_inputs = np.zeros((3, self.n))
+        # step(repeat > 1)中每支股票reward之和
+        self.reward_sums = np.zeros(self.n)
+        self.fills = np.zeros((2, 4, self.n))
 
     def get_market_info_size(self):
         size = 0
@@ -41,53 +112,182 @@ class BaseEnv(gym.Env):
             size += self.market.get_info_size(info_name)
         return size
 
+    def seed(self, seed=None):
+        """
+        设置env自己的随机数流, 用于get_random_action与回合开始日期的选择
+        seed: int或np.random.SeedSequence, 多个env/worker使用spawn_seeds的返回值
+            得到相互独立的随机数流
+        """
+        self.np_random = np.random.default_rng(seed)
+        return [seed]
+
+    def set_episode_days(self, episode_days=None):
+        """
+        episode_days: 每个回合的交易日数, reset时在[look_back_days,
+            最后一天 - episode_days + 1]中随机选择回合开始的日期; 为None时每个回合
+            从第look_back_days天运行到最后一天; 下一次reset时生效
+        """
+        if episode_days is not None and \
+                self.look_back_days + episode_days > len(self.dates):
+            raise Exception(u"episode_days: %d超过了可用的交易日数" %
+                            episode_days)
+        self.episode_days = episode_days
+
     def _init_current_time_id(self):
-        return self.look_back_days
+        if self.episode_days is None:
+            return self.look_back_days
+        return int(self.np_random.integers(
+            self.look_back_days, len(self.dates) - self.episode_days + 1))
 
-    def get_market_info(self, date):
-        info = []
-        for info_name in self.used_infos:
-            data = self.market.market_info[date][info_name]
-            info.extend(data)
-        return np.array(info)
+    def get_last_time_id(self):
+        # 回合最后一天的time_id
+        if self.last_time_id is None:
+            return len(self.dates) - 1
+        return self.last_time_id
+
+    def init_spaces(self):
+        """
+        子类确定action_size和input_size之后调用
+        action: 所有取值[-1, 1]
+        observation: [look_back_days, input_size]
+        """
+        self.action_space = spaces.Box(low=-1.0, high=1.0,
+                                       shape=(self.action_size,),
+                                       dtype=np.float32)
+        self.observation_space = spaces.Box(
+            low=-np.inf, high=np.inf,
+            shape=(self.look_back_days, self.input_size), dtype=self.dtype)
+
+    def get_market_info(self, time_id):
+        if len(self.market_infos) < len(self.dates):
+            # Market.append_days追加了新的交易日
+            self.market_infos = self.market.get_market_info_array(
+                self.used_infos, self.dtype)
+        return self.market_infos[time_id]
+
+    def get_next_obs(self, rows):
+        """
+        rows: [(time_id, portfolio_info)], 新增的交易日
+        去掉最早的len(rows)天, 加入这些天的市场信息和帐户信息, 返回新的C连续数组
+        """
+        rows = rows[-len(self.obs):]
+        k = len(rows)
+        obs = np.empty_like(self.obs)
+        obs[:-k] = self.obs[k:]
+        for row, (time_id, portfolio_info) in zip(obs[-k:], rows):
+            row[:self.market_info_size] = self.get_market_info(time_id)
+            row[self.market_info_size:] = portfolio_info
+        return obs
+
+    def get_portfolio_info(self):
+        """
+        当天收盘后observation中的帐户信息, 由子类实现
+        """
+        raise NotImplementedError
+
+    def _next(self):
+        # 进入下一个交易日
+        if not self.done:
+            self.current_time_id += 1
+            self.current_date = self.dates[self.current_time_id]
+        self.pre_cash = self.cash
 
     def get_hlc_prices(self):
-        date = self.current_date
-        highs, lows, closes = [], [], []
-        for i in range(self.n):
-            code = self.codes[i]
-            if date in self.market.codes_history[code].index:
-                highs.append(self.market.codes_history[code].loc[date, "high"])
-                lows.append(self.market.codes_history[code].loc[date, "low"])
-                closes.append(self.market.codes_history[code].loc[date,
-                                                                  "close"])
-            else:
-                # 停牌时
-                highs.appen(0)
-                lows.appen(0)
-                closes.appen(0)
+        # env交易的前n支股票的最高, 最低, 收盘价, 停牌时为0
+        time_id = self.current_time_id
+        traded = self.market.traded[time_id, :self.n]
+        prices = self.market.prices
+        highs = np.where(traded, prices["high"][time_id, :self.n], 0).tolist()
+        lows = np.where(traded, prices["low"][time_id, :self.n], 0).tolist()
+        closes = np.where(traded, prices["close"][time_id, :self.n],
+                          0).tolist()
         return highs, lows, closes
 
+    def get_code_rewards(self, sell_prices, buy_prices, out=None):
+        """
+        env交易的每支股票的reward, [n], 见reward.py中的*_by_code
+        输入写入预先分配的self.code_inputs, out不为None时结果写入out
+        """
+        time_id = self.current_time_id
+        prices = self.market.prices
+        n = self.n
+        daily_returns, sell, buy = self.code_inputs
+        if self.kernel is not None:
+            daily_returns[:] = self.portfolios.floats[DAILY_RETURN, :n]
+        else:
+            for i in range(n):
+                daily_returns[i] = self.portfolios[i].daily_return
+        sell[:] = sell_prices
+        buy[:] = buy_prices
+        return self.code_reward_fn(
+            daily_returns, prices["high"][time_id, :n],
+            prices["low"][time_id, :n], prices["close"][time_id, :n],
+            sell, buy, self.market.traded[time_id, :n], out=out)
+
     def update_reward(self, sell_prices, buy_prices):
+        # 每支股票的reward写入self.reward_array, self.rewards在step最后更新
         if self.reward_fn_name in ["daily_return", "simple"]:
             self.reward = self.reward_fn(self.daily_return)
         else:
             highs, lows, closes = self.get_hlc_prices()
+            # 停牌的股票不计价格相关的惩罚
+            traded = self.market.traded[self.current_time_id, :self.n]
             self.reward = self.reward_fn(
                 self.daily_return, highs, lows, closes,
-                sell_prices, buy_prices)
-        # 每一只股的reward与总的reward一致
-        for i in range(self.n):
-            self.rewards[i] = self.reward
+                sell_prices, buy_prices, traded=traded)
+        self.get_code_rewards(sell_prices, buy_prices, out=self.reward_array)
+
+    def record_order(self, id, cash_change, price, vol, position=None):
+        # order_target_percent可能与sell/buy的方向相反, 以现金变化判断买卖方向
+        # position: 成交之后的持仓量, 为None时使用当前的持仓量
+        if position is None:
+            position = self.portfolios[id].volume
+        amount = price * vol
+        if cash_change < 0:
+            side, fee, sign = BUY, -cash_change - amount, 1
+        else:
+            side, fee, sign = SELL, amount - cash_change, -1
+        self.ledger.append(side, id, self.current_time_id, price, vol, fee,
+                           cash_change, position)
+        if self.info_mode == "array":
+            self.step_info["fill_volume"][id] += sign * vol
+            self.step_info["fill_amount"][id] += sign * amount
+            self.step_info["fee"][id] += fee
+
+    def record_fills(self, ids, fills):
+        """
+        kernel一侧(卖出或买入)的所有成交一次写入ledger与step_info, 结果与按ids
+        的顺序逐个调用record_order相同
+        ids: 有成交的股票, fills: [4, len(ids)], 见kernel.py中的FILL_*
+        """
+        cash_changes, prices, volumes, positions = fills
+        volumes = volumes.astype(np.int64)
+        amounts = prices * volumes
+        is_buy = cash_changes < 0
+        orders = np.empty(len(ids), dtype=ORDER_DTYPE)
+        orders["side"] = np.where(is_buy, BUY, SELL)
+        orders["code_id"] = ids
+        orders["time_id"] = self.current_time_id
+        orders["price"] = prices
+        orders["volume"] = volumes
+        orders["fee"] = np.where(is_buy, -cash_changes - amounts,
+                                 amounts - cash_changes)
+        orders["cash_change"] = cash_changes
+        orders["position"] = positions
+        self.ledger.extend(orders)
+        if self.info_mode == "array":
+            signs = np.where(is_buy, 1, -1)
+            self.step_info["fill_volume"][ids] += signs * volumes
+            self.step_info["fill_amount"][ids] += signs * amounts
+            self.step_info["fee"][ids] += orders["fee"]
 
     def sell(self, id, price, target_pct):
         # id: code id
         code = self.codes[id]
         logger.debug("sell %s, bid price: %.2f" % (code, price))
-        ok, price = self.market.sell_check(
-            code=code,
-            datestr=self.current_date,
-            bid_price=price)
+        self.ledger.add_attempt(SELL, id)
+        ok, price = self.market.sell_check_by_id(
+            id, self.current_time_id, bid_price=price)
         if ok:
             # 全仓卖出
             cash_change, price, vol = self.portfolios[
@@ -97,9 +297,11 @@ class BaseEnv(gym.Env):
                     current_cash=self.cash)
             self.cash += cash_change
             if vol != 0:
-                self.info["orders"].append(["sell", code,
-                                            round(cash_change, 1),
-                                            round(price, 2), vol])
+                self.record_order(id, cash_change, price, vol)
+                if self.info_mode == "dict":
+                    self.info["orders"].append(["sell", code,
+                                                round(cash_change, 1),
+                                                round(price, 2), vol])
             logger.debug("sell %s target_percent: 0, cash_change: %.3f" %
                          (code, cash_change))
             return cash_change, ok
@@ -109,10 +311,9 @@ class BaseEnv(gym.Env):
         # id: code id
         code = self.codes[id]
         logger.debug("buy %s, bid_price: %.2f" % (code, price))
-        ok, price = self.market.buy_check(
-            code=code,
-            datestr=self.current_date,
-            bid_price=price)
+        self.ledger.add_attempt(BUY, id)
+        ok, price = self.market.buy_check_by_id(
+            id, self.current_time_id, bid_price=price)
         pre_cash = self.cash
         if ok:
             # 分仓买进
@@ -122,27 +323,79 @@ class BaseEnv(gym.Env):
                 current_cash=self.cash)
             self.cash += cash_change
             if vol != 0:
-                self.info["orders"].append(["buy", code,
-                                            round(cash_change, 1),
-                                            round(price, 2), vol])
+                self.record_order(id, cash_change, price, vol)
+                if self.info_mode == "dict":
+                    self.info["orders"].append(["buy", code,
+                                                round(cash_change, 1),
+                                                round(price, 2), vol])
             logger.debug("buy %s cash: %.1f, cash_change: %1.f" %
                          (code, pre_cash, cash_change))
             return cash_change, ok
         return 0, ok
 
+    def do_action_by_kernel(self, orders, pre_portfolio_value, only_update):
+        """
+        用kernel(见tgym/envs/kernel.py)执行一个交易日, 结果与do_action中逐支
+        股票调用sell/buy, Portfolio.update_after_trade相同
+        orders: (sell_prices, sell_pcts, buy_prices, buy_pcts), 每个为[n],
+            only_update为True时可以为None
+        """
+        time_id = self.current_time_id
+        market = self.market
+        state = self.portfolios
+        if only_update:
+            orders = [np.zeros(self.n)] * 4
+        sell_prices, sell_pcts, buy_prices, buy_pcts = [
+            np.asarray(x, dtype=np.float64) for x in orders]
+        self.cash, _ = self.kernel(
+            state.ints, state.floats, market.get_divide_rates_by_id(time_id),
+            market.buyable[time_id], market.sellable[time_id],
+            market.prices["high"][time_id], market.prices["low"][time_id],
+            market.prices["close"][time_id], sell_prices, sell_pcts,
+            buy_prices, buy_pcts, self.cash, pre_portfolio_value,
+            only_update,
+            state.get_fee_params(self.fee_schedule, self.current_date),
+            state.round_lot, state.divide_rate_threshold, self.fills)
+        if only_update:
+            return [0] * self.n, [0] * self.n
+        self.ledger.attempts += 1
+        for side, name in [(SELL, "sell"), (BUY, "buy")]:
+            fills = self.fills[side]
+            ids = np.flatnonzero(fills[FILL_VOLUME])
+            if len(ids) == 0:
+                continue
+            self.record_fills(ids, fills[:, ids])
+            if self.info_mode == "dict":
+                # 与Portfolio一样对np.float64取round
+                cash_changes, prices, volumes, _ = fills[:, ids]
+                for id, cash_change, price, vol in zip(
+                        ids.tolist(), cash_changes, prices, volumes):
+                    self.info["orders"].append([name, self.codes[id],
+                                                round(cash_change, 1),
+                                                round(price, 2), int(vol)])
+        return list(orders[0]), list(orders[2])
+
     def update_portfolio(self):
         pre_portfolio_value = self.portfolio_value
-        self.market_value = 0
-        self.daily_pnl = 0
-        self.pnl = 0
-        self.transaction_cost = 0
-        self.all_transaction_cost = 0
-        for p in self.portfolios:
-            self.market_value += p.market_value
-            self.daily_pnl += p.daily_pnl
-            self.pnl += p.pnl
-            self.transaction_cost += p.transaction_cost
-            self.all_transaction_cost += p.all_transaction_cost
+        if self.kernel is not None:
+            # cumsum按顺序累加, 与下面逐个相加的结果相同
+            (self.market_value, self.daily_pnl, self.pnl,
+             self.transaction_cost, self.all_transaction_cost) = np.cumsum(
+                self.portfolios.floats[[
+                    MARKET_VALUE, DAILY_PNL, PNL, TRANSACTION_COST,
+                    ALL_TRANSACTION_COST]], axis=1)[:, -1]
+        else:
+            self.market_value = 0
+            self.daily_pnl = 0
+            self.pnl = 0
+            self.transaction_cost = 0
+            self.all_transaction_cost = 0
+            for p in self.portfolios:
+                self.market_value += p.market_value
+                self.daily_pnl += p.daily_pnl
+                self.pnl += p.pnl
+                self.transaction_cost += p.transaction_cost
+                self.all_transaction_cost += p.all_transaction_cost
         self.total_pnl += self.pnl
 
         # 当日收益率 更新
@@ -159,15 +412,75 @@ class BaseEnv(gym.Env):
             self.value_percent = 0.0
         else:
             self.value_percent = self.market_value / self.portfolio_value
+        if self.kernel is not None:
+            floats = self.portfolios.floats
+            if self.portfolio_value == 0:
+                floats[VALUE_PERCENT] = 0.0
+            else:
+                floats[VALUE_PERCENT] = floats[MARKET_VALUE] / \
+                    self.portfolio_value
+            return
         for i in range(self.n):
             self.portfolios[i].update_value_percent(self.portfolio_value)
 
     def get_init_obs():
         raise NotImplementedError
 
-    def reset(self):
+    def set_obs_normalizer(self, normalizer=None, seed_from_market=False):
+        """
+        开启observation在线标准化, 见tgym/envs/normalizer.py
+        normalizer: 为None时新建一个, 也可以传入已保存的(如评估时frozen的)
+        seed_from_market: 是否先用Market全部历史初始化市场信息部分的统计量
+        """
+        if normalizer is None:
+            normalizer = ObsNormalizer(self.input_size)
+        if seed_from_market:
+            normalizer.seed_from_market(self.market, self.used_infos)
+        self.obs_normalizer = normalizer
+        return normalizer
+
+    def set_replay_buffer(self, replay_buffer=None):
+        """
+        replay_buffer: tgym.replay.ReplayBuffer, 设置之后reset/step直接把
+            obs的新增行与action, reward, done写入buffer, 不需要在env之外复制obs;
+            look_back_days, input_size, action_size需要与env一致
+        """
+        if replay_buffer is not None and (
+                replay_buffer.look_back_days != self.look_back_days or
+                replay_buffer.input_size != self.input_size or
+                replay_buffer.action_size != self.action_size):
+            raise Exception(u"set_replay_buffer: buffer的大小与env不一致")
+        self.replay_buffer = replay_buffer
+
+    def set_kernel(self, backend="auto"):
+        """
+        backend: 每日撮合与持仓更新使用的kernel, 见tgym/envs/kernel.py:
+            auto: 安装了numba时编译执行, 否则纯Python执行; numba; python;
+            为None时使用Portfolio逐支股票计算(默认); 下一次reset时生效
+        开启之后env.portfolios为PortfolioArrays, 按下标只读访问各支股票的持仓
+        """
+        if backend is not None:
+            get_kernel(backend)
+        self.kernel_backend = backend
+
+    def set_fee_schedule(self, fee_schedule):
+        """
+        fee_schedule: tgym.fees.FeeSchedule, 每步按当天生效的费率计算交易费,
+            为None时使用Portfolio的固定费率; 下一次reset时生效
+        """
+        self.fee_schedule = fee_schedule
+
+    def reset(self, seed=None):
+        """
+        seed: 不为None时先重新设置随机数流, 相同的seed得到相同的回合
+        """
+        if seed is not None:
+            self.seed(seed)
         # 当前时间
         self.current_time_id = self._init_current_time_id()
+        self.last_time_id = None
+        if self.episode_days is not None:
+            self.last_time_id = self.current_time_id + self.episode_days - 1
         self.current_date = self.dates[self.current_time_id]
         self.done = False
         # 当日的回报
@@ -177,6 +490,9 @@ class BaseEnv(gym.Env):
         self.total_reward = 0.0
         # 当日订单集合
         self.info = {"orders": []}
+        self.ledger.clear()
+        self.step_info[...] = 0
+        self.reward_array[:] = 0
         # 总权益
         self.portfolio_value = self.investment
         # 初始资金
@@ -187,43 +503,118 @@ class BaseEnv(gym.Env):
         self.total_pnl = 0
 
         # 每只股的 portfolio
-        self.portfolios = []
-        for code in self.codes:
-            self.portfolios.append(Portfolio(code=code))
+        self.kernel = None
+        if self.kernel_backend is not None:
+            self.kernel = get_kernel(self.kernel_backend)
+            self.portfolios = PortfolioArrays(self.codes)
+        else:
+            self.portfolios = []
+            for code in self.codes:
+                self.portfolios.append(Portfolio(
+                    code=code, fee_schedule=self.fee_schedule))
         self.obs = self.get_init_obs()
+        if self.obs_normalizer is not None:
+            self.obs_normalizer.normalize(self.obs)
+        if self.replay_buffer is not None:
+            self.replay_buffer.add_episode(self.obs)
         self.portfolio_value_logs = []
+        # 上一次step执行的交易日数, 即obs新增的行数
+        self.step_days = 0
         return self.obs
 
-    def step(self, action, only_update=False):
+    def step(self, action, only_update=False, repeat=1, hold=False):
         """
         only_update为True时，表示buy_and_hold策略，可作为一种baseline策略
+        repeat: 在一次调用中连续执行repeat个交易日(到最后一天时提前结束),
+            返回的reward, rewards与info中的daily_pnl为各天之和, 订单与成交为
+            各天的合计, observation只在最后构建一次
+        hold: repeat > 1时, 只在第一天按action交易, 之后的交易日只持有
+            (同only_update); 为False时每天重复执行action
         """
         self.action = action
-        self.info = {"orders": []}
-        logger.debug("=" * 50 + "%s" % self.current_date + "=" * 50)
-        logger.debug("current_time_id: %d, portfolio: %.1f" %
-                     (self.current_time_id, self.portfolio_value))
-        logger.debug("step action: %s" % str(action))
+        if self.info_mode == "dict":
+            self.info = {"orders": []}
+        elif self.info_mode == "array":
+            self.step_info["fill_volume"] = 0
+            self.step_info["fill_amount"] = 0
+            self.step_info["fee"] = 0
+        rows = []
+        for day in range(repeat):
+            logger.debug("=" * 50 + "%s" % self.current_date + "=" * 50)
+            logger.debug("current_time_id: %d, portfolio: %.1f" %
+                         (self.current_time_id, self.portfolio_value))
+            logger.debug("step action: %s" % str(action))
 
-        # 到最后一天
-        if self.current_date == self.dates[-1]:
-            self.done = True
+            # 到最后一天
+            if self.current_time_id == self.get_last_time_id():
+                self.done = True
 
-        pre_portfolio_value = self.portfolio_value
-        sell_prices, buy_prices = self.do_action(action,
-                                                 pre_portfolio_value,
-                                                 only_update)
-        self.update_portfolio()
-        self.update_value_percent()
-        self.update_reward(sell_prices, buy_prices)
-        self.obs = self._next()
-        self.info = {
-            "orders": self.info["orders"],
-            "current_date": self.current_date,
-            "portfolio_value": round(self.portfolio_value / self.investment, 3),
-            "daily_pnl": round(self.daily_pnl, 1),
-            "reward": self.reward}
+            pre_portfolio_value = self.portfolio_value
+            sell_prices, buy_prices = self.do_action(
+                action, pre_portfolio_value,
+                only_update or (hold and day > 0))
+            self.update_portfolio()
+            self.update_value_percent()
+            self.update_reward(sell_prices, buy_prices)
+            if repeat > 1:
+                if day == 0:
+                    reward, daily_pnl = self.reward, self.daily_pnl
+                    self.reward_sums[:] = self.reward_array
+                else:
+                    reward += self.reward
+                    daily_pnl += self.daily_pnl
+                    self.reward_sums += self.reward_array
+            rows.append((self.current_time_id, self.get_portfolio_info()))
+            self._next()
+            if self.done:
+                break
+        if len(rows) > 1:
+            self.reward, self.daily_pnl = reward, daily_pnl
+            self.reward_array[:] = self.reward_sums
+        if self.info_mode != "array":
+            self.rewards = self.reward_array.tolist()
+        self.step_days = len(rows)
+        self.obs = self.get_next_obs(rows)
+        if self.obs_normalizer is not None:
+            # 之前的行已经标准化过, 只处理新增的交易日
+            self.obs_normalizer.normalize(self.obs[-len(rows):])
+        if self.replay_buffer is not None:
+            self.replay_buffer.add(self.obs[-len(rows):], action, self.reward,
+                                   self.done)
+        if self.info_mode == "dict":
+            self.info = {
+                "orders": self.info["orders"],
+                "current_date": self.current_date,
+                "portfolio_value": round(
+                    self.portfolio_value / self.investment, 3),
+                "daily_pnl": round(self.daily_pnl, 1),
+                "reward": self.reward}
+        elif self.info_mode == "array":
+            info = self.step_info
+            info["portfolio_value"] = self.portfolio_value
+            info["daily_pnl"] = self.daily_pnl
+            info["cash"] = self.cash
+            info["reward"] = self.reward
+            return self.obs, self.reward, self.done, info, self.reward_array
+        else:
+            self.info = self.ledger
         return self.obs, self.reward, self.done, self.info, self.rewards
 
+    def resume(self):
+        """
+        Market.append_days追加新的交易日之后, 让已经结束(done)的回合继续向后step
+        返回: 是否还有未处理的交易日
+        """
+        self.end = self.market.end
+        # 设置了episode_days的回合长度固定
+        if self.last_time_id is not None or \
+                self.current_time_id + 1 >= len(self.dates):
+            return not self.done
+        if self.done:
+            self.current_time_id += 1
+            self.current_date = self.dates[self.current_time_id]
+            self.done = False
+        return True
+
     def get_random_action(self):
-        return [random.uniform(-1, 1) for i in range(self.action_space)]
+        return self.np_random.uniform(-1, 1, self.action_size)
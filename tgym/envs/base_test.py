@@ -0,0 +1,258 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import unittest
+
+import numpy as np
+from gym import spaces
+
+from tgym.envs.average import AverageEnv
+from tgym.envs.multi_vol import MultiVolEnv
+from tgym.envs.simple import SimpleEnv
+from tgym.market_test import MarketTestCase
+
+logging.root.setLevel(logging.ERROR)
+
+
+class TestBaseEnv(MarketTestCase):
+    indexs = ["000001.SH", "399001.SZ"]
+
+    def test_spaces(self):
+        for cls, action_size in [(SimpleEnv, 2), (AverageEnv, 4),
+                                 (MultiVolEnv, 8)]:
+            env = cls(self.m, look_back_days=5)
+            self.assertIsInstance(env.action_space, spaces.Box)
+            self.assertEqual((action_size,), env.action_space.shape)
+            self.assertIsInstance(env.observation_space, spaces.Box)
+            self.assertEqual((5, env.input_size), env.observation_space.shape)
+            self.assertTrue(env.action_space.contains(
+                np.array(env.get_random_action(), dtype=np.float32)))
+            obs = env.reset()
+            self.assertTrue(env.observation_space.contains(obs))
+
+    def test_single_code_env(self):
+        # 多支股票的Market上只交易第一支股票, 使用默认的价格相关reward
+        env = SimpleEnv(self.m, look_back_days=5)
+        self.assertEqual(2, len(self.m.codes))
+        env.reset()
+        done = False
+        while not done:
+            _, reward, done, _, _ = env.step([0.05, -0.05])
+            self.assertTrue(np.isfinite(reward))
+        highs, lows, closes = env.get_hlc_prices()
+        self.assertEqual(1, len(highs))
+
+    def test_float32_obs(self):
+        env = AverageEnv(self.m, look_back_days=5)
+        obs = env.reset()
+        self.assertEqual(np.float32, obs.dtype)
+        self.assertTrue(obs.flags.c_contiguous)
+        for _ in range(3):
+            pre_obs = obs
+            obs, _, _, _, _ = env.step([0, 0.1, 0, 0.1])
+            self.assertEqual(np.float32, obs.dtype)
+            self.assertTrue(obs.flags.c_contiguous)
+            np.testing.assert_array_equal(pre_obs[1:], obs[:-1])
+        # 市场信息与market_info一致
+        date = self.m.open_dates[env.current_time_id - 1]
+        expected = self.m.market_info[date]["equities_hfq_info"]
+        np.testing.assert_allclose(expected, obs[-1, :20], rtol=1e-6)
+
+    def test_float64_obs(self):
+        env = MultiVolEnv(self.m, look_back_days=5, dtype=np.float64)
+        obs = env.reset()
+        self.assertEqual(np.float64, obs.dtype)
+        self.assertEqual(np.float64, env.observation_space.dtype)
+        # 相同的used_infos和dtype共用一份market_info数组
+        other = SimpleEnv(self.m, look_back_days=5, dtype=np.float64)
+        self.assertIs(env.market_infos, other.market_infos)
+        self.assertFalse(env.market_infos.flags.writeable)
+
+    def test_array_info_mode(self):
+        env = AverageEnv(self.m, look_back_days=5, reward_fn="daily_return",
+                         info_mode="array")
+        env.reset()
+        pre_info, pre_rewards = None, None
+        done, n_orders = False, 0
+        while not done:
+            _, reward, done, info, rewards = env.step([0, 0.5, 0, 0.5])
+            # 每步返回同一个预先分配的数组
+            if pre_info is not None:
+                self.assertIs(pre_info, info)
+                self.assertIs(pre_rewards, rewards)
+            pre_info, pre_rewards = info, rewards
+            self.assertIs(env.reward_array, rewards)
+            self.assertEqual(np.float64, rewards.dtype)
+            self.assertEqual(env.portfolio_value, info["portfolio_value"])
+            self.assertEqual(env.daily_pnl, info["daily_pnl"])
+            self.assertEqual(env.cash, info["cash"])
+            # 当天的成交与ledger一致
+            orders = env.ledger.orders[n_orders:]
+            n_orders = len(env.ledger)
+            sign = np.where(orders["side"] == 1, 1, -1)
+            np.testing.assert_array_equal(
+                np.bincount(orders["code_id"],
+                            weights=sign * orders["volume"], minlength=2),
+                info["fill_volume"])
+            np.testing.assert_allclose(
+                np.bincount(orders["code_id"], weights=orders["fee"],
+                            minlength=2), info["fee"])
+        self.assertGreater(n_orders, 0)
+        with self.assertRaises(Exception):
+            AverageEnv(self.m, look_back_days=5, info_mode="tuple")
+
+    def test_array_buffers(self):
+        # array模式每步复用预先分配的数组, repeat > 1时也是
+        env = MultiVolEnv(self.m, look_back_days=5, info_mode="array",
+                          reward_fn="daily_return_with_chl_penalty")
+        env.reset()
+        buffers = [env.reward_array, env.step_info, env.code_inputs,
+                   env.reward_sums]
+        for repeat in [1, 3]:
+            _, _, _, info, rewards = env.step(
+                [0.1, -0.5, -0.1, 0.5, 0.2, -0.5, 0, 0.5], repeat=repeat)
+            for buffer, array in zip(buffers, [
+                    rewards, info, env.code_inputs, env.reward_sums]):
+                self.assertIs(buffer, array)
+        self.assertTrue(np.all(np.isfinite(rewards)))
+        self.assertEqual(env.portfolios[0].daily_return,
+                         env.code_inputs[0, 0])
+
+    def test_code_rewards(self):
+        for reward_fn in ["simple", "daily_return_add_price_bound",
+                          "daily_return_with_chl_penalty"]:
+            env = MultiVolEnv(self.m, look_back_days=5, reward_fn=reward_fn)
+            env.reset()
+            for _ in range(3):
+                _, _, _, _, rewards = env.step(
+                    [0.1, -0.5, -0.1, 0.5, 0.2, -0.5, 0, 0.5])
+                self.assertEqual(2, len(rewards))
+                self.assertTrue(np.all(np.isfinite(rewards)))
+            if reward_fn == "simple":
+                returns = [p.daily_return for p in env.portfolios]
+                self.assertEqual(np.where(np.array(returns) > 0, 1, -1)
+                                 .tolist(), rewards)
+
+    def test_code_rewards_size(self):
+        # SimpleEnv只交易第一支股票, 每支股票的数组按env的股票数量分配
+        env = SimpleEnv(self.m, look_back_days=5, reward_fn="daily_return",
+                        info_mode="array")
+        env.reset()
+        for _ in range(5):
+            _, _, _, info, rewards = env.step([0.05, -0.05])
+            self.assertEqual((1,), rewards.shape)
+            self.assertEqual((1,), info["fill_volume"].shape)
+        self.assertEqual(env.portfolio.daily_return, rewards[0])
+        self.assertEqual((2, 1), env.ledger.attempts.shape)
+        self.assertGreater(len(env.ledger), 0)
+
+    def test_code_daily_pnl(self):
+        # 每支股票的daily_pnl只包含自己的成交, 不包含其他股票的现金变化
+        for cls in [AverageEnv, MultiVolEnv]:
+            env = cls(self.m, look_back_days=5, reward_fn="daily_return")
+            env.reset()
+            rng = np.random.RandomState(0)
+            done = False
+            while not done:
+                pre_values = [p.market_value for p in env.portfolios]
+                n_orders = len(env.ledger)
+                _, _, done, _, _ = env.step(
+                    rng.uniform(-1, 1, env.action_size).tolist())
+                orders = env.ledger.orders[n_orders:]
+                for i, p in enumerate(env.portfolios):
+                    cash_change = orders["cash_change"][
+                        orders["code_id"] == i].sum()
+                    self.assertAlmostEqual(
+                        p.market_value - pre_values[i] + cash_change,
+                        p.daily_pnl, places=6)
+
+    def test_repeat(self):
+        action = [0.1, -0.5, -0.1, 0.5, 0.2, -0.5, 0, 0.5]
+        env = MultiVolEnv(self.m, look_back_days=5, reward_fn="daily_return")
+        other = MultiVolEnv(self.m, look_back_days=5,
+                            reward_fn="daily_return")
+        env.reset()
+        other.reset()
+        done = False
+        while not done:
+            obs, reward, done, info, rewards = env.step(action, repeat=7)
+            expected_reward, expected_rewards, pnl = 0, np.zeros(2), 0
+            for _ in range(7):
+                expected, r, other_done, _, rs = other.step(action)
+                expected_reward += r
+                expected_rewards += rs
+                pnl += other.daily_pnl
+                if other_done:
+                    break
+            self.assertEqual(other_done, done)
+            self.assertEqual(other.current_date, info["current_date"])
+            np.testing.assert_array_equal(expected, obs)
+            self.assertAlmostEqual(expected_reward, reward)
+            np.testing.assert_allclose(expected_rewards, rewards)
+            self.assertAlmostEqual(round(pnl, 1), info["daily_pnl"])
+        self.assertEqual(other.portfolio_value_logs, env.portfolio_value_logs)
+        self.assertEqual(len(other.ledger), len(env.ledger))
+        # repeat大于look_back_days时, observation只保留最后几天
+        env.reset()
+        other.reset()
+        obs, _, _, _, _ = env.step(action, repeat=8)
+        for _ in range(8):
+            expected, _, _, _, _ = other.step(action)
+        np.testing.assert_array_equal(expected, obs)
+
+    def test_repeat_hold(self):
+        action = [0, 0.5, 0, 0.5]
+        env = AverageEnv(self.m, look_back_days=5, reward_fn="daily_return",
+                         info_mode="array")
+        other = AverageEnv(self.m, look_back_days=5,
+                           reward_fn="daily_return", info_mode="array")
+        env.reset()
+        other.reset()
+        _, reward, _, info, rewards = env.step(action, repeat=5, hold=True)
+        fill_volume, expected_reward = 0, 0
+        for day in range(5):
+            _, r, _, other_info, _ = other.step(action, only_update=day > 0)
+            fill_volume += other_info["fill_volume"]
+            expected_reward += r
+        np.testing.assert_array_equal(fill_volume, info["fill_volume"])
+        self.assertAlmostEqual(expected_reward, reward)
+        self.assertEqual(other.portfolio_value, env.portfolio_value)
+        # 只在第一天交易
+        self.assertEqual({env.ledger.orders["time_id"][0]},
+                         set(env.ledger.orders["time_id"]))
+
+    def test_seed(self):
+        env = AverageEnv(self.m, look_back_days=5, reward_fn="daily_return")
+        other = AverageEnv(self.m, look_back_days=5,
+                           reward_fn="daily_return")
+        env.set_episode_days(10)
+        other.set_episode_days(10)
+        for seed in [1, 2]:
+            obs = env.reset(seed=seed)
+            np.testing.assert_array_equal(obs, other.reset(seed=seed))
+            start = env.current_time_id
+            np.testing.assert_allclose(env.market_infos[start - 5: start],
+                                       obs[:, :env.market_info_size])
+            done, n_steps = False, 0
+            while not done:
+                action = env.get_random_action()
+                np.testing.assert_array_equal(action,
+                                              other.get_random_action())
+                _, _, done, _, _ = env.step(action)
+                other.step(action)
+                n_steps += 1
+            self.assertEqual(10, n_steps)
+            self.assertEqual(start + 9, env.current_time_id)
+            self.assertEqual(other.portfolio_value_logs,
+                             env.portfolio_value_logs)
+            self.assertFalse(env.resume())
+        # 不设置episode_days时从第look_back_days天开始
+        env.set_episode_days()
+        env.reset(seed=1)
+        self.assertEqual(5, env.current_time_id)
+        with self.assertRaises(Exception):
+            env.set_episode_days(len(self.m.open_dates))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,276 @@
+# -*- coding:utf-8 -*-
+"""
+每日撮合与持仓更新的kernel: 把BaseEnv.sell/buy, Market.sell_check/buy_check与
+Portfolio.update_before_trade/order_target_percent/order_value/
+update_after_trade中逐支股票的标量计算, 改为在数组状态(PortfolioArrays)上的
+一个函数trade_day; 安装了numba时编译执行, 否则以纯Python执行, 见
+BaseEnv.set_kernel
+NOTE(wen): 计算顺序与Portfolio完全一致(包括交易费的round, 以及每支股票使用
+    自己当天卖出与买入的现金变化计算daily_pnl), 成交, 交易费与现金逐位相同,
+    见kernel_test.py
+NOTE(wen): 导入numba约需0.3秒, 只在第一次使用numba backend时导入并编译,
+    见compile_numba; 编译的函数保存在NUMBA_FUNCS中, 本模块的函数始终是纯Python
+"""
+import importlib.util
+import threading
+import types
+
+import numpy as np
+
+from tgym.portfolio import Portfolio
+
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+
+BACKENDS = ["auto", "numba", "python"]
+# 用numba编译的函数, trade_day及它调用的函数
+NUMBA_NAMES = ["get_fee", "submit_order", "order_target_percent", "trade_day"]
+# 函数名 -> 编译之后的函数, 见compile_numba
+NUMBA_FUNCS = {}
+NUMBA_LOCK = threading.Lock()
+
+# PortfolioArrays.ints的行
+VOLUME, PRE_VOLUME, FROZEN_VOLUME, SELLABLE = range(4)
+INT_FIELDS = ["volume", "pre_volume", "frozen_volume", "sellable"]
+# PortfolioArrays.floats的行, 名字与Portfolio的属性一致
+(MARKET_VALUE, AVG_PRICE, PRICE, DAILY_PNL, PNL, DAILY_RETURN,
+ TRANSACTION_COST, ALL_TRANSACTION_COST, VALUE_PERCENT) = range(9)
+FLOAT_FIELDS = ["market_value", "avg_price", "_price", "daily_pnl", "pnl",
+                "daily_return", "transaction_cost", "all_transaction_cost",
+                "value_percent"]
+# trade_day输出的成交, fills[side, field, code], side为SELL/BUY
+FILL_CASH_CHANGE, FILL_PRICE, FILL_VOLUME, FILL_POSITION = range(4)
+
+
+class PortfolioView:
+    """
+    PortfolioArrays中一支股票的只读视图, 属性名与Portfolio一致
+    """
+
+    def __init__(self, arrays, id):
+        self.arrays = arrays
+        self.id = id
+        self.code = arrays.codes[id]
+
+    def __getattr__(self, name):
+        arrays = self.__dict__["arrays"]
+        if name in arrays.int_ids:
+            return arrays.ints[arrays.int_ids[name], self.id]
+        if name in arrays.float_ids:
+            return arrays.floats[arrays.float_ids[name], self.id]
+        raise AttributeError(name)
+
+
+class PortfolioArrays:
+    """
+    所有股票的持仓状态: ints: [len(INT_FIELDS), n], floats:
+    [len(FLOAT_FIELDS), n]; 按下标返回PortfolioView, 可以代替
+    env.portfolios(Portfolio的列表)读取
+    交易费率, round_lot与divide_rate_threshold使用Portfolio的默认值
+    """
+
+    def __init__(self, codes):
+        self.codes = codes
+        self.ints = np.zeros((len(INT_FIELDS), len(codes)), dtype=np.int64)
+        self.floats = np.zeros((len(FLOAT_FIELDS), len(codes)))
+        self.int_ids = {name: i for i, name in enumerate(INT_FIELDS)}
+        self.float_ids = {name: i for i, name in enumerate(FLOAT_FIELDS)}
+        p = Portfolio()
+        self.round_lot = p.round_lot
+        self.divide_rate_threshold = p.divide_rate_threshold
+        # get_fee的参数: 买入的(佣金率, 最低佣金, 其他费率), 卖出的(同前)
+        self.fee_params = np.array([
+            p.buy_commission_rate, p.min_commission, 0.0,
+            p.sell_commission_rate, 0.0, 0.0])
+        self.views = [PortfolioView(self, i) for i in range(len(codes))]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, id):
+        return self.views[id]
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def get_fee_params(self, fee_schedule=None, date=None):
+        # fee_schedule: tgym.fees.FeeSchedule, 使用date生效的费率
+        if fee_schedule is None:
+            return self.fee_params
+        s = fee_schedule
+        buy_rate, sell_rate = s.get_rates(date)
+        return np.array([s.commission_rate, s.min_commission, buy_rate,
+                         s.commission_rate, s.min_commission, sell_rate])
+
+
+def get_fee(amount, commission_rate, min_commission, rate):
+    # 与Portfolio._buy_fee/_sell_fee和FeeSchedule._fee相同
+    # NOTE(wen): 都使用np.round; Python的round对Python float按精确的十进制值
+    #     舍入, 正好半分时与np.round不同, 如round(2773.475, 2) = 2773.47
+    if amount <= 0:
+        return 0.0
+    return np.round(max(amount * commission_rate, min_commission) +
+                    amount * rate, 2)
+
+
+def submit_order(is_buy, i, price, volume, ints, floats, fee_params):
+    # Portfolio.buy/sell, 返回现金变化
+    amount = volume * price
+    if is_buy:
+        fee = get_fee(amount, fee_params[0], fee_params[1], fee_params[2])
+        floats[TRANSACTION_COST, i] += fee
+        floats[AVG_PRICE, i] = (floats[AVG_PRICE, i] * ints[VOLUME, i] +
+                                amount + fee) / (ints[VOLUME, i] + volume)
+        floats[PRICE, i] = price
+        ints[VOLUME, i] += volume
+        ints[FROZEN_VOLUME, i] += volume
+        floats[ALL_TRANSACTION_COST, i] += fee
+        return -amount - fee
+    fee = get_fee(amount, fee_params[3], fee_params[4], fee_params[5])
+    if ints[VOLUME, i] == volume:
+        floats[AVG_PRICE, i] = 0.0
+    else:
+        floats[AVG_PRICE, i] = (floats[AVG_PRICE, i] * ints[VOLUME, i] -
+                                amount + fee) / (ints[VOLUME, i] - volume)
+    floats[PRICE, i] = price
+    floats[TRANSACTION_COST, i] += fee
+    ints[VOLUME, i] -= volume
+    ints[SELLABLE, i] -= volume
+    floats[ALL_TRANSACTION_COST, i] += fee
+    return amount - fee
+
+
+def order_target_percent(i, percent, price, pre_portfolio_value, cash,
+                         ints, floats, fee_params, round_lot):
+    """
+    Portfolio.order_target_percent与order_value
+    返回: 现金变化, 成交量(没有下单时为-1)
+    """
+    if percent < 0 or percent > 1:
+        raise Exception("percent should between 0 and 1")
+    if percent == 0:
+        volume = ints[SELLABLE, i]
+        return submit_order(False, i, price, volume, ints, floats,
+                            fee_params), volume
+    amount = pre_portfolio_value * percent - ints[VOLUME, i] * \
+        floats[PRICE, i]
+    if amount > 0:
+        amount = min(amount, cash)
+        volume = int(amount / (price * round_lot)) * round_lot
+        while volume > 0:
+            amount = volume * price
+            fee = get_fee(amount, fee_params[0], fee_params[1],
+                          fee_params[2])
+            if amount + fee <= cash:
+                break
+            volume -= round_lot
+        if volume > 0:
+            return submit_order(True, i, price, volume, ints, floats,
+                                fee_params), volume
+        return 0.0, -1
+    elif amount < 0:
+        volume = min(ints[SELLABLE, i],
+                     abs(int(amount / (price * round_lot)) * round_lot))
+        return submit_order(False, i, price, volume, ints, floats,
+                            fee_params), volume
+    return 0.0, -1
+
+
+def trade_day(ints, floats, divide_rates, buyable, sellable, highs, lows,
+              closes, sell_prices, sell_pcts, buy_prices, buy_pcts, cash,
+              pre_portfolio_value, only_update, fee_params, round_lot,
+              divide_rate_threshold, fills):
+    """
+    一个交易日: 拆分 -> 按股票顺序卖出 -> 按股票顺序买入 -> 按收盘价更新
+    ints, floats: PortfolioArrays的状态, 原地更新
+    divide_rates, buyable, sellable, highs, lows, closes: [n], 当天的市场数据
+    sell_prices, sell_pcts, buy_prices, buy_pcts: [n], 出价与目标仓位
+    fills: [2, 4, n], 输出每支股票卖出/买入的成交, 没有成交时成交量为0
+    返回: 交易之后的现金, [n]每支股票当天的现金变化
+    """
+    n = ints.shape[1]
+    fills[:] = 0
+    for i in range(n):
+        # Portfolio.update_before_trade
+        if divide_rates[i] > divide_rate_threshold:
+            ints[VOLUME, i] = int(divide_rates[i] * ints[VOLUME, i])
+        ints[SELLABLE, i] = ints[VOLUME, i]
+        ints[FROZEN_VOLUME, i] = 0
+        floats[DAILY_PNL, i] = 0.0
+        floats[DAILY_RETURN, i] = 0.0
+        floats[TRANSACTION_COST, i] = 0.0
+        ints[PRE_VOLUME, i] = ints[VOLUME, i]
+    cash_changes = np.zeros(n)
+    if not only_update:
+        for side in range(2):
+            is_buy = side == 1
+            for i in range(n):
+                if is_buy:
+                    # Market.buy_check_by_id: 买入竞价低于最低价，不能成交
+                    if not buyable[i] or buy_prices[i] < lows[i]:
+                        continue
+                    price = min(buy_prices[i], highs[i])
+                    percent = buy_pcts[i]
+                else:
+                    # Market.sell_check_by_id: 卖出竞价高于最高价，不能成交
+                    if not sellable[i] or sell_prices[i] > highs[i]:
+                        continue
+                    price = max(sell_prices[i], lows[i])
+                    percent = sell_pcts[i]
+                change, volume = order_target_percent(
+                    i, percent, price, pre_portfolio_value, cash, ints,
+                    floats, fee_params, round_lot)
+                cash += change
+                cash_changes[i] += change
+                if volume > 0:
+                    fills[side, FILL_CASH_CHANGE, i] = change
+                    fills[side, FILL_PRICE, i] = price
+                    fills[side, FILL_VOLUME, i] = volume
+                    fills[side, FILL_POSITION, i] = ints[VOLUME, i]
+    for i in range(n):
+        # Portfolio.update_after_trade
+        pre_market_value = floats[MARKET_VALUE, i]
+        floats[MARKET_VALUE, i] = ints[VOLUME, i] * closes[i]
+        floats[DAILY_PNL, i] = floats[MARKET_VALUE, i] - pre_market_value + \
+            cash_changes[i]
+        floats[PNL, i] += floats[DAILY_PNL, i]
+        if pre_portfolio_value == 0:
+            floats[DAILY_RETURN, i] = 0.0
+        else:
+            floats[DAILY_RETURN, i] = floats[DAILY_PNL, i] / \
+                pre_portfolio_value
+    return cash, cash_changes
+
+
+def compile_numba():
+    """
+    导入numba, 用numba.njit编译NUMBA_NAMES中的函数(第一次调用时编译, 结果缓存
+    在__pycache__中), 返回编译的trade_day
+    编译的函数使用自己的全局命名空间, 相互调用时使用编译的版本; 本模块中的
+    同名函数不变, 纯Python backend不会调用编译的函数
+    """
+    with NUMBA_LOCK:
+        if not NUMBA_FUNCS:
+            import numba
+            namespace = dict(globals())
+            funcs = {}
+            for name in NUMBA_NAMES:
+                func = globals()[name]
+                func = types.FunctionType(func.__code__, namespace, name,
+                                          func.__defaults__)
+                funcs[name] = namespace[name] = numba.njit(cache=True)(func)
+            NUMBA_FUNCS.update(funcs)
+    return NUMBA_FUNCS["trade_day"]
+
+
+def get_kernel(backend="auto"):
+    """
+    backend: auto: 安装了numba时使用编译的kernel, 否则使用纯Python;
+        numba: 要求安装numba; python: 纯Python执行trade_day
+    """
+    if backend not in BACKENDS:
+        raise Exception(u"未知的kernel backend: %s" % backend)
+    if backend == "numba" and not HAS_NUMBA:
+        raise Exception(u"kernel backend numba需要安装numba")
+    if backend == "python" or not HAS_NUMBA:
+        return trade_day
+    return compile_numba()
@@ -0,0 +1,165 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import types
+import unittest
+
+import numpy as np
+
+from tgym.envs import kernel as kernel_module
+from tgym.envs.average import AverageEnv
+from tgym.envs.kernel import (FLOAT_FIELDS, HAS_NUMBA, INT_FIELDS,
+                              NUMBA_FUNCS, NUMBA_NAMES, get_kernel)
+from tgym.envs.multi_vol import MultiVolEnv
+from tgym.envs.simple import SimpleEnv
+from tgym.fees import FeeSchedule
+from tgym.ledger import BUY
+from tgym.generator import generate_market
+from tgym.portfolio import Portfolio
+
+logging.root.setLevel(logging.ERROR)
+
+# numba没有安装时只比较纯Python执行的kernel
+BACKENDS = ["python", "numba"] if HAS_NUMBA else ["python"]
+
+
+class TestKernel(unittest.TestCase):
+    """
+    差分测试: 相同的action序列下, kernel与Portfolio逐支股票计算的成交, 交易费,
+    现金与持仓逐位相同
+    """
+    @classmethod
+    def setUpClass(self):
+        # 停牌, 拆分与涨跌停都比默认值频繁
+        self.m = generate_market("20190101", "20191231",
+                                 ["%06d.SZ" % (i + 1) for i in range(6)],
+                                 seed=1, suspend_prob=0.02, split_prob=0.01,
+                                 limit_prob=0.1)
+        self.single = generate_market("20190101", "20190630", ["000001.SZ"],
+                                      seed=2, split_prob=0.02,
+                                      limit_prob=0.1)
+
+    def make_envs(self, cls, market, backend, fee_schedule=None,
+                  info_mode="dict"):
+        envs = []
+        for kernel in [None, backend]:
+            env = cls(market, look_back_days=5, reward_fn="daily_return",
+                      dtype=np.float64, info_mode=info_mode)
+            env.set_kernel(kernel)
+            env.set_fee_schedule(fee_schedule)
+            envs.append(env)
+        return envs
+
+    def assertSameState(self, expected, env):
+        self.assertEqual(expected.cash, env.cash)
+        self.assertEqual(expected.portfolio_value, env.portfolio_value)
+        for name in ["market_value", "daily_pnl", "pnl", "transaction_cost",
+                     "all_transaction_cost", "total_pnl", "value_percent"]:
+            self.assertEqual(getattr(expected, name), getattr(env, name),
+                             name)
+        for name in INT_FIELDS + FLOAT_FIELDS:
+            values = [getattr(p, name) for p in expected.portfolios]
+            self.assertEqual(values,
+                             [getattr(p, name) for p in env.portfolios],
+                             name)
+        np.testing.assert_array_equal(expected.ledger.orders,
+                                      env.ledger.orders)
+        np.testing.assert_array_equal(expected.ledger.attempts,
+                                      env.ledger.attempts)
+
+    def run_envs(self, envs, actions, **kwargs):
+        expected, env = envs
+        for obs in [e.reset() for e in envs]:
+            np.testing.assert_array_equal(expected.obs, obs)
+        for t, action in enumerate(actions):
+            results = [e.step(action, only_update=t % 7 == 6, **kwargs)
+                       for e in envs]
+            (obs, reward, done, info, rewards), result = results
+            np.testing.assert_array_equal(obs, result[0])
+            self.assertEqual(reward, result[1])
+            self.assertEqual(done, result[2])
+            if env.info_mode == "array":
+                np.testing.assert_array_equal(info, result[3])
+                np.testing.assert_array_equal(rewards, result[4])
+            else:
+                self.assertEqual(info, result[3])
+                self.assertEqual(rewards, result[4])
+            self.assertSameState(expected, env)
+            if done:
+                for e in envs:
+                    e.reset()
+        return len(expected.ledger)
+
+    def get_actions(self, env, n_steps, seed=0):
+        rng = np.random.default_rng(seed)
+        actions = rng.uniform(-1, 1, (n_steps, env.action_size))
+        # 出价为涨跌停价, 以及目标仓位为0或1
+        actions[rng.random(actions.shape) < 0.1] = 1.0
+        actions[rng.random(actions.shape) < 0.1] = -1.0
+        return actions.tolist()
+
+    def test_average(self):
+        for backend in BACKENDS:
+            envs = self.make_envs(AverageEnv, self.m, backend)
+            n_orders = self.run_envs(envs, self.get_actions(envs[0], 300))
+            self.assertGreater(n_orders, 0)
+
+    def test_multi_vol(self):
+        for backend in BACKENDS:
+            for fee_schedule in [None, FeeSchedule()]:
+                envs = self.make_envs(MultiVolEnv, self.m, backend,
+                                      fee_schedule)
+                n_orders = self.run_envs(envs,
+                                         self.get_actions(envs[0], 300))
+                self.assertGreater(n_orders, 0)
+
+    def test_simple(self):
+        for backend in BACKENDS:
+            envs = self.make_envs(SimpleEnv, self.single, backend)
+            self.run_envs(envs, self.get_actions(envs[0], 200))
+        with self.assertRaises(Exception):
+            SimpleEnv(self.m, look_back_days=5).set_kernel("python")
+
+    def test_repeat(self):
+        for backend in BACKENDS:
+            envs = self.make_envs(MultiVolEnv, self.m, backend,
+                                  info_mode="array")
+            self.run_envs(envs, self.get_actions(envs[0], 50, seed=1),
+                          repeat=3, hold=True)
+
+    def test_backend(self):
+        self.assertIs(get_kernel("auto"), get_kernel(
+            "numba" if HAS_NUMBA else "python"))
+        # 编译numba之后纯Python backend仍然只调用纯Python函数
+        for name in NUMBA_NAMES:
+            func = getattr(kernel_module, name)
+            self.assertIsInstance(func, types.FunctionType)
+        self.assertIs(kernel_module.trade_day, get_kernel("python"))
+        if HAS_NUMBA:
+            self.assertIsNot(kernel_module.trade_day, get_kernel("numba"))
+            self.assertIs(NUMBA_FUNCS["trade_day"], get_kernel("numba"))
+        with self.assertRaises(Exception):
+            get_kernel("cuda")
+        if not HAS_NUMBA:
+            with self.assertRaises(Exception):
+                get_kernel("numba")
+
+    def test_half_cent_fee(self):
+        # 交易费正好是半分时各处的round结果一致: round(2773.475, 2) = 2773.47,
+        # np.round(2773.475, 2) = 2773.48
+        amount = 2773.475
+        schedule = FeeSchedule(commission_rate=1.0, min_commission=5.0)
+        expected = [
+            Portfolio(buy_commission_rate=1.0)._buy_fee(amount),
+            Portfolio(sell_commission_rate=1.0)._sell_fee(amount),
+            schedule.buy_fee(amount, "20100104"),
+            schedule.fees([BUY], [amount], "20100104")[0],
+            kernel_module.get_fee(amount, 1.0, 5.0, 0.0)]
+        if HAS_NUMBA:
+            get_kernel("numba")
+            expected.append(NUMBA_FUNCS["get_fee"](amount, 1.0, 5.0, 0.0))
+        self.assertEqual([2773.48] * len(expected), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
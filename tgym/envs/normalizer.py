@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+
+class ObsNormalizer:
+    """
+    observation在线标准化: 对每个特征维护运行均值与方差(Welford算法), 按
+    (x - mean) / std 原地变换, 并截断到[-clip, clip]
+    NOTE(wen): observation中混合了价格, 成交量, 指数点位以及持仓比例等, 数量级差别
+        很大, 直接作为模型输入效果不好
+    size: 特征数, 即env.input_size
+    frozen: 为True时只做变换不更新统计量, 用于评估
+    """
+
+    def __init__(self, size, clip=10.0, epsilon=1e-8):
+        self.size = size
+        self.clip = clip
+        self.epsilon = epsilon
+        self.frozen = False
+        # 每个特征单独计数, 以便只用Market历史预先初始化市场信息部分
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        # 与均值差的平方和
+        self.m2 = np.zeros(size)
+
+    @property
+    def var(self):
+        return np.where(self.count > 0, self.m2 / np.maximum(self.count, 1),
+                        1.0)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var + self.epsilon)
+
+    def freeze(self):
+        self.frozen = True
+
+    def unfreeze(self):
+        self.frozen = False
+
+    def update(self, x, start=0):
+        """
+        x: [batch, k], 更新第start至start+k个特征的统计量
+        按批合并(Chan et al.), 对特征维度向量化
+        """
+        x = np.asarray(x, dtype=np.float64)
+        n = x.shape[0]
+        if n == 0:
+            return
+        s = slice(start, start + x.shape[1])
+        count = self.count[s]
+        batch_mean = x.mean(axis=0)
+        delta = batch_mean - self.mean[s]
+        total = count + n
+        self.mean[s] += delta * n / total
+        self.m2[s] += x.var(axis=0) * n + delta ** 2 * count * n / total
+        self.count[s] = total
+
+    def normalize(self, x, update=True):
+        """
+        原地标准化x: [batch, size], x需要是浮点数组
+        update为True且没有frozen时, 先用x更新统计量
+        """
+        if update and not self.frozen:
+            self.update(x)
+        x -= self.mean
+        x /= self.std
+        np.clip(x, -self.clip, self.clip, out=x)
+        return x
+
+    def seed_from_market(self, market, used_infos, dates=None):
+        """
+        遍历一次Market的历史数据, 预先初始化市场信息部分(前market_info_size个特征)
+        的统计量
+        """
+        dates = dates or market.open_dates
+        x = []
+        for date in dates:
+            info = []
+            for info_name in used_infos:
+                info.extend(market.market_info[date][info_name])
+            x.append(info)
+        self.update(np.array(x))
+
+    def state_dict(self):
+        return {"count": self.count.copy(), "mean": self.mean.copy(),
+                "m2": self.m2.copy(),
+                "clip": self.clip, "epsilon": self.epsilon}
+
+    def load_state_dict(self, state):
+        self.count = np.array(state["count"], dtype=np.float64)
+        self.mean = np.array(state["mean"], dtype=np.float64)
+        self.m2 = np.array(state["m2"], dtype=np.float64)
+        self.size = len(self.mean)
+        self.clip = float(state["clip"])
+        self.epsilon = float(state["epsilon"])
+
+    def save(self, path):
+        np.savez(path, **self.state_dict())
+
+    @classmethod
+    def load(cls, path):
+        state = np.load(path)
+        normalizer = cls(len(state["mean"]))
+        normalizer.load_state_dict(state)
+        return normalizer
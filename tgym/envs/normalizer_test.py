@@ -0,0 +1,84 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tgym.envs.multi_vol import MultiVolEnv
+from tgym.envs.normalizer import ObsNormalizer
+from tgym.market_test import MarketTestCase
+
+logging.root.setLevel(logging.ERROR)
+
+
+class TestObsNormalizer(unittest.TestCase):
+    def test_update(self):
+        rng = np.random.RandomState(0)
+        x = rng.normal(100, 20, size=(50, 3))
+        normalizer = ObsNormalizer(3)
+        # 分批更新与一次计算的结果一致
+        for i in range(0, 50, 7):
+            normalizer.update(x[i: i + 7])
+        np.testing.assert_allclose(x.mean(axis=0), normalizer.mean)
+        np.testing.assert_allclose(x.var(axis=0), normalizer.var)
+        # 部分特征更新
+        normalizer.update(x[:, :1] + 1000, start=2)
+        self.assertEqual([50, 50, 100], normalizer.count.tolist())
+
+    def test_normalize(self):
+        x = np.array([[1.0, 10.0], [3.0, 30.0]])
+        normalizer = ObsNormalizer(2)
+        y = normalizer.normalize(x)
+        self.assertIs(x, y)
+        np.testing.assert_allclose([[-1, -1], [1, 1]], x, atol=1e-6)
+        # frozen时不更新统计量
+        normalizer.freeze()
+        z = normalizer.normalize(np.array([[1e6, 20.0]]))
+        self.assertEqual([2, 2], normalizer.count.tolist())
+        # 截断到[-clip, clip]
+        self.assertEqual([10.0, 0.0], z[0].tolist())
+        normalizer.unfreeze()
+        normalizer.normalize(np.array([[100.0, 100.0]]))
+        self.assertEqual([3, 3], normalizer.count.tolist())
+
+    def test_save_load(self):
+        normalizer = ObsNormalizer(2, clip=5.0)
+        normalizer.update(np.array([[1.0, 2.0], [3.0, 5.0]]))
+        dir = tempfile.mkdtemp()
+        path = os.path.join(dir, "normalizer.npz")
+        normalizer.save(path)
+        loaded = ObsNormalizer.load(path)
+        shutil.rmtree(dir)
+        np.testing.assert_array_equal(normalizer.mean, loaded.mean)
+        np.testing.assert_array_equal(normalizer.var, loaded.var)
+        self.assertEqual(5.0, loaded.clip)
+
+
+class TestEnvObsNormalizer(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.env = MultiVolEnv(self.m, look_back_days=5)
+
+    def test_step(self):
+        raw_obs = self.env.reset()
+        normalizer = self.env.set_obs_normalizer(seed_from_market=True)
+        n_dates = len(self.m.open_dates)
+        self.assertEqual(n_dates, normalizer.count[0])
+        self.assertEqual(0, normalizer.count[-1])
+        obs = self.env.reset()
+        self.assertEqual(n_dates + 5, normalizer.count[0])
+        self.assertTrue(np.abs(obs[:, :20]).max() < 5)
+        self.assertTrue(np.abs(raw_obs[:, :20]).max() > 5)
+        normalizer.freeze()
+        mean = normalizer.mean.copy()
+        obs, _, _, _, _ = self.env.step([0, -1, 0.2, 0, 0, -1, 0.1, 0])
+        np.testing.assert_array_equal(mean, normalizer.mean)
+        self.assertEqual((5, self.env.input_size), obs.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
 # -*- coding:utf-8 -*-
+import numpy as np
+
 from tgym.logger import logger
 
 
@@ -14,9 +16,13 @@ def daily_return(daily_return, *args):
 
 
 def daily_return_add_count_rate(daily_return, highs, lows,
-                                closes, sell_prices, buy_prices):
-    fail, success, profit_count, loss_count = 0, 0, 0
+                                closes, sell_prices, buy_prices,
+                                traded=None):
+    # traded: 为None时所有股票都有交易, 否则停牌的股票不计成交
+    fail, success, profit_count, loss_count = 0, 0, 0, 0
     for i in range(len(highs)):
+        if traded is not None and not traded[i]:
+            continue
         # 买
         if buy_prices[i] >= lows[i]:
             success += 1
@@ -37,46 +43,63 @@ def daily_return_add_count_rate(daily_return, highs, lows,
         else:
             fail += 1
 
-    success_rate = (success * 2) / (success + fail)
-    profit_rate = (profit_count * 2) / (profit_count + loss_count)
+    # 全部停牌或没有成交时比例为0, 与daily_return_add_count_rate_by_code一致
+    success_rate, profit_rate = 0.0, 0.0
+    if success + fail > 0:
+        success_rate = (success * 2) / (success + fail)
+    if profit_count + loss_count > 0:
+        profit_rate = (profit_count * 2) / (profit_count + loss_count)
 
     reward = daily_return + success_rate + profit_rate
 
     return reward
 
 
-def mean_squared_error(a, b):
+def mean_squared_error(a, b, traded=None):
+    # traded: 为None时所有股票都有交易, 否则只计算有交易(未停牌)的股票
     v = 0.0
-    n = len(a)
-    for i in range(n):
+    n = 0
+    for i in range(len(a)):
+        if traded is not None and not traded[i]:
+            continue
         v += (10.0 * (1 - b[i] / a[i])) ** 2
+        n += 1
+    if n == 0:
+        return 0.0
     return v / n
 
 
 def daily_return_add_price_bound(daily_return, highs, lows,
-                                 closes, sell_prices, buy_prices):
+                                 closes, sell_prices, buy_prices,
+                                 traded=None):
+    # 停牌的股票最高最低价为0, 不计价格相关的惩罚, 与*_by_code一致
     reward = daily_return
     n = len(highs)
     # 如果出现买价>卖价 增加一个较大的惩罚
     for i in range(n):
+        if traded is not None and not traded[i]:
+            continue
         if sell_prices[i] < buy_prices[i]:
             reward -= 1.0
     # 计算 bound
-    sell_error = mean_squared_error(highs, sell_prices)
-    buy_error = mean_squared_error(lows, buy_prices)
+    sell_error = mean_squared_error(highs, sell_prices, traded)
+    buy_error = mean_squared_error(lows, buy_prices, traded)
 
     reward = reward - sell_error - buy_error
     return reward
 
 
 def daily_return_with_chl_penalty(daily_return, highs, lows,
-                                  closes, sell_prices, buy_prices):
+                                  closes, sell_prices, buy_prices,
+                                  traded=None):
     reward = daily_return_add_price_bound(daily_return, highs, lows, closes,
-                                          sell_prices, buy_prices)
+                                          sell_prices, buy_prices, traded)
     # 增加相对于收盘价的惩罚
     close_error_sum = 0
     n = len(highs)
     for i in range(n):
+        if traded is not None and not traded[i]:
+            continue
         if sell_prices[i] < closes[i]:
             close_error = (closes[i] - sell_prices[i]) * 10 / closes[i]
             close_error_sum += close_error ** 2
@@ -101,6 +124,97 @@ def get_reward_func(name="simple"):
         return daily_return_with_chl_penalty
 
 
+# 每支股票的reward: 与上面同名的reward函数对应, 对所有股票一次向量化计算
+# 参数均为[n]数组:
+#   daily_returns: 每支股票的当日收益率, Portfolio.daily_pnl / 前一日总权益,
+#       所有股票之和为总的当日收益率
+#   highs, lows, closes: 当日最高, 最低, 收盘价(停牌时为前一开市日的数据)
+#   traded: 当日是否有交易, 停牌的股票不计成交与价格相关的惩罚
+#   out: 不为None时结果写入这个[n]数组(如env预先分配的reward_array)并返回
+
+
+def store(result, out):
+    if out is None:
+        return result
+    out[:] = result
+    return out
+
+
+def simple_by_code(daily_returns, *args, out=None):
+    return store(np.where(daily_returns > 0, 1.0, -1.0), out)
+
+
+def daily_return_by_code(daily_returns, *args, out=None):
+    if out is None:
+        return np.array(daily_returns, dtype=np.float64)
+    return store(daily_returns, out)
+
+
+def get_fill_outcomes(highs, lows, closes, sell_prices, buy_prices, traded):
+    """
+    返回: 买入成交, 卖出成交, 盈利的成交数, 亏损的成交数, 均为[n]数组
+    """
+    buy_ok = traded & (buy_prices >= lows)
+    sell_ok = traded & (sell_prices <= highs)
+    profit = ((buy_ok & (buy_prices <= closes)).astype(np.int64) +
+              (sell_ok & (sell_prices > closes)))
+    loss = buy_ok.astype(np.int64) + sell_ok - profit
+    return buy_ok, sell_ok, profit, loss
+
+
+def daily_return_add_count_rate_by_code(daily_returns, highs, lows, closes,
+                                        sell_prices, buy_prices, traded,
+                                        out=None):
+    buy_ok, sell_ok, profit, loss = get_fill_outcomes(
+        highs, lows, closes, sell_prices, buy_prices, traded)
+    # 每支股票每天买卖各下一单, success + fail = 2, 成功率为success * 2 / 2
+    success_rate = (buy_ok.astype(np.int64) + sell_ok).astype(np.float64)
+    filled = profit + loss
+    profit_rate = np.divide(profit * 2, filled, out=np.zeros(len(filled)),
+                            where=filled > 0)
+    return np.add(daily_returns + success_rate, profit_rate, out=out)
+
+
+def price_bound_penalty(highs, lows, sell_prices, buy_prices, traded):
+    # 买价>卖价的惩罚 + 卖价与最高价, 买价与最低价的偏差
+    penalty = np.where(sell_prices < buy_prices, 1.0, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        penalty += (10.0 * (1 - sell_prices / highs)) ** 2
+        penalty += (10.0 * (1 - buy_prices / lows)) ** 2
+    return np.where(traded, penalty, 0.0)
+
+
+def daily_return_add_price_bound_by_code(daily_returns, highs, lows, closes,
+                                         sell_prices, buy_prices, traded,
+                                         out=None):
+    return np.subtract(daily_returns, price_bound_penalty(
+        highs, lows, sell_prices, buy_prices, traded), out=out)
+
+
+def daily_return_with_chl_penalty_by_code(daily_returns, highs, lows, closes,
+                                          sell_prices, buy_prices, traded,
+                                          out=None):
+    reward = daily_return_add_price_bound_by_code(
+        daily_returns, highs, lows, closes, sell_prices, buy_prices, traded,
+        out=out)
+    # 相对于收盘价的惩罚, 与daily_return_with_chl_penalty一致
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sell_error = np.maximum(closes - sell_prices, 0) * 10 / closes
+        buy_error = np.maximum(buy_prices - closes, 0) * 10 / closes
+    close_error = np.where(traded, sell_error ** 2 + buy_error ** 2, 0.0)
+    return np.add(reward, close_error, out=out)
+
+
+def get_code_reward_func(name="simple"):
+    return {
+        "simple": simple_by_code,
+        "daily_return": daily_return_by_code,
+        "daily_return_add_count_rate": daily_return_add_count_rate_by_code,
+        "daily_return_add_price_bound": daily_return_add_price_bound_by_code,
+        "daily_return_with_chl_penalty":
+            daily_return_with_chl_penalty_by_code}[name]
+
+
 def main():
     r_func = get_reward_func(name="simple")
     assert -1 == r_func(0)
@@ -1,6 +1,14 @@
 import unittest
 
-from tgym.envs.reward import mean_squared_error
+import numpy as np
+
+from tgym.envs.reward import (daily_return_add_count_rate,
+                              daily_return_add_count_rate_by_code,
+                              daily_return_add_price_bound,
+                              daily_return_add_price_bound_by_code,
+                              daily_return_with_chl_penalty,
+                              daily_return_with_chl_penalty_by_code,
+                              mean_squared_error)
 
 
 class TestReward(unittest.TestCase):
@@ -10,6 +18,71 @@ class TestReward(unittest.TestCase):
         mse = mean_squared_error(a, b)
         self.assertEqual(0.125, mse)
 
+    def test_suspended(self):
+        # 停牌的股票最高最低价为0, 不计价格相关的惩罚
+        args = ([10.5, 0.0], [9.8, 0.0], [10.2, 0.0], [10.4, 8.5],
+                [9.9, 8.2])
+        traded = [True, False]
+        expected = daily_return_add_price_bound(
+            0.01, *[a[:1] for a in args])
+        self.assertAlmostEqual(expected, daily_return_add_price_bound(
+            0.01, *args, traded=traded))
+        expected = daily_return_with_chl_penalty(
+            0.01, *[a[:1] for a in args])
+        self.assertAlmostEqual(expected, daily_return_with_chl_penalty(
+            0.01, *args, traded=traded))
+        self.assertEqual(0.0, mean_squared_error([0.0], [8.5], [False]))
+
+    def test_count_rate(self):
+        # 0: 买入成交(盈利), 卖出未成交; 1: 停牌, 不计成交
+        args = ([10.5, 0.0], [9.8, 0.0], [10.2, 0.0], [10.6, 8.5],
+                [9.9, 8.2])
+        reward = daily_return_add_count_rate(0.01, *args,
+                                             traded=[True, False])
+        self.assertAlmostEqual(0.01 + 1 + 2, reward)
+        self.assertAlmostEqual(0.01, daily_return_add_count_rate(
+            0.01, *args, traded=[False, False]))
+
+
+class TestCodeReward(unittest.TestCase):
+    def setUp(self):
+        self.daily_returns = np.array([0.01, -0.02, 0.0])
+        self.highs = np.array([10.5, 21.0, 8.0])
+        self.lows = np.array([9.8, 19.0, 8.0])
+        self.closes = np.array([10.2, 20.0, 8.0])
+        self.sell_prices = np.array([10.4, 18.0, 8.5])
+        self.buy_prices = np.array([9.9, 19.5, 8.2])
+        self.traded = np.array([True, True, False])
+        self.args = (self.daily_returns, self.highs, self.lows, self.closes,
+                     self.sell_prices, self.buy_prices)
+
+    def test_single_code(self):
+        # 只有一支股票时与原reward函数一致
+        for fn, code_fn in [
+                (daily_return_add_price_bound,
+                 daily_return_add_price_bound_by_code),
+                (daily_return_with_chl_penalty,
+                 daily_return_with_chl_penalty_by_code)]:
+            for i in range(2):
+                args = [a[i: i + 1] for a in self.args]
+                expected = fn(args[0][0], *args[1:])
+                rewards = code_fn(*args, traded=self.traded[i: i + 1])
+                self.assertAlmostEqual(expected, rewards[0])
+
+    def test_suspended(self):
+        rewards = daily_return_add_price_bound_by_code(*self.args,
+                                                       traded=self.traded)
+        self.assertEqual(0.0, rewards[2])
+
+    def test_count_rate(self):
+        rewards = daily_return_add_count_rate_by_code(*self.args,
+                                                      traded=self.traded)
+        # 0: 买卖均成交, 买价<=收盘价, 卖价>收盘价, 均盈利
+        # 1: 买入成交(买价<=收盘价盈利), 卖出成交(卖价<=收盘价亏损)
+        # 2: 停牌
+        np.testing.assert_allclose([0.01 + 2 + 2, -0.02 + 2 + 1, 0.0],
+                                   rewards)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,31 @@
+# -*- coding:utf-8 -*-
+"""
+可复现的随机数流与批量随机action, 用于随机策略的baseline与并行的worker
+"""
+import numpy as np
+
+
+def spawn_seeds(seed, n):
+    """
+    从一个seed派生n个相互独立的np.random.SeedSequence, 每个env/worker一个,
+    传给BaseEnv.seed或RandomActionSampler
+    """
+    return np.random.SeedSequence(seed).spawn(n)
+
+
+class RandomActionSampler:
+    """
+    批量随机action: 每次sample返回[n_envs, action_size]的数组, 取值[-1, 1)
+    seed: int或np.random.SeedSequence, 相同的seed得到相同的action序列
+    NOTE(wen): 返回的数组每次复用, 需要保存时使用copy()
+    """
+
+    def __init__(self, n_envs, action_size, seed=None, dtype=np.float32):
+        self.rng = np.random.default_rng(seed)
+        self.actions = np.empty((n_envs, action_size), dtype=dtype)
+
+    def sample(self):
+        self.rng.random(dtype=self.actions.dtype, out=self.actions)
+        self.actions *= 2
+        self.actions -= 1
+        return self.actions
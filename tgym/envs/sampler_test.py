@@ -0,0 +1,35 @@
+# -*- coding:utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+from tgym.envs.sampler import RandomActionSampler, spawn_seeds
+
+
+class TestSampler(unittest.TestCase):
+    def test_sample(self):
+        sampler = RandomActionSampler(8, 4, seed=1)
+        actions = sampler.sample()
+        self.assertEqual((8, 4), actions.shape)
+        self.assertEqual(np.float32, actions.dtype)
+        self.assertTrue(np.all((actions >= -1) & (actions < 1)))
+        first = actions.copy()
+        # 复用同一个数组
+        self.assertIs(actions, sampler.sample())
+        self.assertFalse(np.array_equal(first, actions))
+        np.testing.assert_array_equal(
+            first, RandomActionSampler(8, 4, seed=1).sample())
+
+    def test_spawn_seeds(self):
+        seeds = spawn_seeds(0, 3)
+        samples = [RandomActionSampler(2, 4, seed).sample().copy()
+                   for seed in seeds]
+        self.assertFalse(np.array_equal(samples[0], samples[1]))
+        np.testing.assert_array_equal(
+            samples[2], RandomActionSampler(2, 4, spawn_seeds(0, 3)[2])
+            .sample())
+
+
+if __name__ == '__main__':
+    unittest.main()
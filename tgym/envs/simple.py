@@ -21,25 +21,37 @@ class SimpleEnv(BaseEnv):
 
     def __init__(self, market=None, investment=100000.0, look_back_days=10,
                  used_infos=["equities_hfq_info", "indexs_info"],
-                 reward_fn="daily_return_add_price_bound"):
+                 reward_fn="daily_return_add_price_bound", dtype=np.float32,
+                 info_mode="dict"):
         """
         investment: 初始资金
         look_back_days: 向前取数据的天数
+        dtype: observation的数据类型
+        info_mode: step返回的info类型, 见BaseEnv
         """
         super(SimpleEnv, self).__init__(market, investment, look_back_days,
-                                        used_infos, reward_fn)
-        # 股票数量
+                                        used_infos, reward_fn, dtype,
+                                        info_mode)
+        # 股票数量, 只交易第一支股票
         self.n = 1
-        self.action_space = 2
+        self.init_buffers()
+        self.action_size = 2
         self.code = market.codes[0]
         self.portfolio_info_size = 2
         self.input_size = self.market_info_size + self.portfolio_info_size
+        self.init_spaces()
+
+    def set_kernel(self, backend="auto"):
+        # kernel对所有股票同时更新持仓, 只交易第一支股票时结果不同
+        if backend is not None and len(self.codes) > 1:
+            raise Exception(u"SimpleEnv: 只有一支股票时可以使用kernel")
+        super(SimpleEnv, self).set_kernel(backend)
 
     def get_init_portfolio_obs(self):
         # 初始持仓信息
         self.portfolio = self.portfolios[0]
         one_day = np.array([self.portfolio.daily_return,
-                            self.portfolio.value_percent])
+                            self.portfolio.value_percent], dtype=self.dtype)
         obs = np.array([one_day] * self.look_back_days)
         return obs
 
@@ -48,15 +60,16 @@ class SimpleEnv(BaseEnv):
         obs 由两部分组成: 市场信息, 帐户信息(收益率, 持仓量)
         """
         market_info = []
-        for date in self.dates[: self.look_back_days]:
-            market_info.append(self.get_market_info(date))
-        market_info = np.array(market_info)
+        for time_id in range(self.current_time_id - self.look_back_days,
+                             self.current_time_id):
+            market_info.append(self.get_market_info(time_id))
+        market_info = np.array(market_info, dtype=self.dtype)
         portfolio_info = self.get_init_portfolio_obs()
         return np.concatenate((market_info, portfolio_info), axis=1)
 
     def get_action_price(self, action):
-        pre_close = self.market.get_pre_close_price(
-            self.code, self.current_date)
+        pre_close = self.market.get_pre_close_price_by_id(
+            0, self.current_time_id)
         logger.debug("%s %s pre_close: %.2f" %
                      (self.current_date, self.code, pre_close))
         [v_sell, v_buy] = action
@@ -69,11 +82,17 @@ class SimpleEnv(BaseEnv):
     def do_action(self, action, pre_portfolio_value, only_update):
         sell_price, buy_price = self.get_action_price(action)
         sell_prices, buy_prices = [sell_price], [buy_price]
+        if self.kernel is not None:
+            # 全仓卖出, 全仓买进
+            return self.do_action_by_kernel(
+                (sell_prices, [0.0], buy_prices, [1.0]),
+                pre_portfolio_value, only_update)
         if only_update:
             sell_prices, buy_prices = [0] * self.n, [0] * self.n
-        divide_rate = self.market.get_divide_rate(self.code, self.current_date)
+        divide_rate = self.market.get_divide_rate_by_id(
+            0, self.current_time_id)
         logger.debug("divide_rate: %.4f" % divide_rate)
-        self.portfolio.update_before_trade(divide_rate)
+        self.portfolio.update_before_trade(divide_rate, self.current_date)
         cash_change = 0
 
         if not only_update:
@@ -85,22 +104,13 @@ class SimpleEnv(BaseEnv):
             logger.debug("do_action: time_id: %d, %s, cash_change: %.1f" % (
                 self.current_time_id, self.code, cash_change))
 
-        close_price = self.market.get_close_price(self.code, self.current_date)
+        close_price = self.market.get_close_price_by_id(
+            0, self.current_time_id)
         self.portfolio.update_after_trade(
             close_price=close_price,
             cash_change=cash_change,
             pre_portfolio_value=pre_portfolio_value)
         return sell_prices, buy_prices
 
-    def _next(self):
-        market_info = self.get_market_info(self.current_date)
-        portfolio_info = np.array([self.portfolio.daily_return,
-                                  self.portfolio.value_percent])
-        new_obs = np.concatenate((market_info, portfolio_info), axis=0)
-        obs = np.concatenate((self.obs[1:, :],
-                              np.array([new_obs])), axis=0)
-        if not self.done:
-            self.current_time_id += 1
-            self.current_date = self.dates[self.current_time_id]
-        self.pre_cash = self.cash
-        return obs
+    def get_portfolio_info(self):
+        return [self.portfolio.daily_return, self.portfolio.value_percent]
@@ -0,0 +1,220 @@
+# -*- coding:utf-8 -*-
+"""
+技术指标(因子), 在Market中对所有股票, 所有日期一次性向量化计算
+名字格式: 指标_窗口, 如: ma_5, ema_12, atr_14, rsi_14, volatility_20
+每个指标在market_info中是一个以名字为key的信息块, 每支股票一个值, 可直接在env的
+used_infos中使用, 如: used_infos=["equities_hfq_info", "indexs_info", "rsi_14"]
+NOTE(wen): 统一使用后复权数据计算, 停牌日使用前一开盘日的数据
+截面指标: 每天在所有股票之间比较, 停牌的股票不参与计算, 取中性值
+    return_rank_N: N日收益率的截面排名, 取值[0, 1], 停牌为0.5
+    volume_zscore_N: 成交量相对自身N日均量之比的截面z-score, 停牌为0
+    rs_sh_N, rs_sz_N: N日收益率减去上证指数(000001.SH)/深证成指(399001.SZ)
+        的N日收益率
+增量计算: 指标函数的start参数表示只计算open_dates[start:](见Market.append_days),
+    滚动窗口的指标只读取窗口需要的前几行; 指数加权(ema, atr, rsi)从state中
+    保存的前一天的值继续计算, 结果与一次性计算一致
+"""
+import numpy as np
+import pandas as pd
+
+
+def reindex_ffill(df, dates):
+    """
+    将按日期升序的df(或Series)对齐到升序的日期列表dates, 停牌日使用之前最近一个
+    交易日的数据; 只读取从dates[0]之前最近一行开始的部分, 计算量与df的长度无关
+    """
+    i = df.index.searchsorted(dates[0])
+    df = df.iloc[max(i - 1, 0):]
+    return df.reindex(df.index.union(dates)).ffill().reindex(dates)
+
+
+def get_panel(market, column, start=0):
+    """
+    返回[date, code]的DataFrame, index为market.open_dates[start:], columns为
+    market.codes
+    """
+    dates = market.open_dates[start:]
+    return pd.DataFrame({code: reindex_ffill(
+        market.codes_history[code][column], dates)
+        for code in market.codes}, index=dates, columns=market.codes)
+
+
+def get_first(start, lookback):
+    # 计算open_dates[start:]的指标需要的第一行: 前lookback行也参与计算
+    return max(start - lookback, 0)
+
+
+def ewm_mean(df, state, key, **kwargs):
+    """
+    adjust=False的指数加权平均(kwargs为span或alpha); state中有key时以它(前一天
+    的值)为初始值继续计算, 计算之后state[key]为最后一天的值
+    """
+    pre = None if state is None else state.get(key)
+    if pre is not None:
+        df = pd.concat([pre.to_frame().T, df])
+    result = df.ewm(adjust=False, **kwargs).mean()
+    if pre is not None:
+        result = result.iloc[1:]
+    if state is not None:
+        state[key] = result.iloc[-1]
+    return result
+
+
+def ma(market, window, start=0, state=None):
+    # 移动平均
+    first = get_first(start, window - 1)
+    close = get_panel(market, "close_hfq", first)
+    return close.rolling(window, min_periods=1).mean().iloc[start - first:]
+
+
+def ema(market, window, start=0, state=None):
+    # 指数移动平均
+    close = get_panel(market, "close_hfq", start)
+    return ewm_mean(close, state, "ema", span=window)
+
+
+def atr(market, window, start=0, state=None):
+    # 平均真实波幅, 使用Wilder平滑
+    first = get_first(start, 1)
+    high = get_panel(market, "high_hfq", start)
+    low = get_panel(market, "low_hfq", start)
+    close = get_panel(market, "close_hfq", first)
+    pre_close = close.shift(1).fillna(close).iloc[start - first:]
+    tr = np.maximum(high - low, np.maximum((high - pre_close).abs(),
+                                           (low - pre_close).abs()))
+    return ewm_mean(tr, state, "atr", alpha=1.0 / window)
+
+
+def rsi(market, window, start=0, state=None):
+    # 相对强弱指标, 取值[0, 100], 使用Wilder平滑
+    first = get_first(start, 1)
+    close = get_panel(market, "close_hfq", first)
+    delta = close.diff().fillna(0).iloc[start - first:]
+    up = ewm_mean(delta.clip(lower=0), state, "up", alpha=1.0 / window)
+    down = ewm_mean(-delta.clip(upper=0), state, "down", alpha=1.0 / window)
+    total = up + down
+    # 没有涨跌时为50
+    return (100 * up / total).where(total > 0, 50.0)
+
+
+def volatility(market, window, start=0, state=None):
+    # 日收益率的滚动标准差
+    first = get_first(start, window)
+    close = get_panel(market, "close_hfq", first)
+    returns = close.pct_change().fillna(0)
+    return returns.rolling(window, min_periods=2).std().fillna(0).iloc[
+        start - first:]
+
+
+def cross_section_rank(df, mask):
+    """
+    每天在mask为True的股票中的排名, 归一化到[0, 1]; 其他股票及只有一支股票
+    参与时为0.5
+    """
+    x = df.where(mask)
+    count = mask.sum(axis=1)
+    rank = (x.rank(axis=1) - 1).div(np.maximum(count - 1, 1), axis=0)
+    return rank.where(count > 1, axis=0).fillna(0.5)
+
+
+def cross_section_zscore(df, mask):
+    """
+    每天在mask为True的股票中的z-score, 其他股票及截面标准差为0时为0
+    """
+    x = df.where(mask)
+    std = x.std(axis=1, ddof=0)
+    z = x.sub(x.mean(axis=1), axis=0).div(std.where(std > 0), axis=0)
+    return z.fillna(0.0)
+
+
+def get_trade_mask(market, start=0):
+    # [date, code]的DataFrame, 当天是否有交易
+    return pd.DataFrame(market.traded[start:],
+                        index=market.open_dates[start:],
+                        columns=market.codes)
+
+
+def get_returns(market, window, start):
+    # open_dates[start:]的N日收益率
+    first = get_first(start, window)
+    close = get_panel(market, "close_hfq", first)
+    returns = close.pct_change(window, fill_method=None).fillna(0)
+    return returns.iloc[start - first:]
+
+
+def return_rank(market, window, start=0, state=None):
+    # N日收益率的截面排名
+    return cross_section_rank(get_returns(market, window, start),
+                              get_trade_mask(market, start))
+
+
+def volume_zscore(market, window, start=0, state=None):
+    # 成交量相对自身N日均量(只计交易日)之比的截面z-score
+    first = get_first(start, window - 1)
+    vol = get_panel(market, "vol_hfq", first).where(
+        get_trade_mask(market, first))
+    mean = vol.rolling(window, min_periods=1).mean()
+    vol = vol.iloc[start - first:]
+    mean = mean.iloc[start - first:]
+    return cross_section_zscore(vol / mean.where(mean > 0),
+                                get_trade_mask(market, start))
+
+
+def relative_strength(market, window, index, start=0):
+    # N日收益率与指数N日收益率之差
+    if index not in market.indexs_history:
+        raise Exception(u"计算相对强弱需要指数%s的数据" % index)
+    first = get_first(start, window)
+    index_close = reindex_ffill(market.indexs_history[index]["close"],
+                                market.open_dates[first:])
+    index_returns = index_close.pct_change(window, fill_method=None).fillna(0)
+    return get_returns(market, window, start).sub(
+        index_returns.iloc[start - first:], axis=0)
+
+
+def rs_sh(market, window, start=0, state=None):
+    return relative_strength(market, window, "000001.SH", start)
+
+
+def rs_sz(market, window, start=0, state=None):
+    return relative_strength(market, window, "399001.SZ", start)
+
+
+FEATURES = {
+    "ma": ma,
+    "ema": ema,
+    "atr": atr,
+    "rsi": rsi,
+    "volatility": volatility,
+    "return_rank": return_rank,
+    "volume_zscore": volume_zscore,
+    "rs_sh": rs_sh,
+    "rs_sz": rs_sz,
+}
+
+
+def parse_feature_name(name):
+    # 返回: 指标名, 窗口; 不是技术指标时返回 None, None
+    parts = name.rsplit("_", 1)
+    if len(parts) != 2 or parts[0] not in FEATURES or not parts[1].isdigit():
+        return None, None
+    return parts[0], int(parts[1])
+
+
+def is_feature(name):
+    indicator, _ = parse_feature_name(name)
+    return indicator is not None
+
+
+def get_feature(market, name, start=0, state=None):
+    """
+    计算名为name的技术指标, 返回open_dates[start:]上[date, code]的DataFrame
+    state: dict, 增量计算时在多次调用之间保存的状态(见Market.init_features_info),
+        start > 0时需要传入之前计算时使用的state
+    """
+    indicator, window = parse_feature_name(name)
+    if indicator is None:
+        raise Exception(u"Not implement feature %s" % name)
+    if state is None:
+        state = {}
+    return FEATURES[indicator](market, window, start, state)
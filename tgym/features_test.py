@@ -0,0 +1,98 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import unittest
+
+import numpy as np
+
+from tgym.envs.average import AverageEnv
+from tgym.features import get_feature, is_feature, parse_feature_name
+from tgym.generator import generate_market
+from tgym.market_test import MarketTestCase, make_history
+
+logging.root.setLevel(logging.ERROR)
+
+
+class TestFeatures(MarketTestCase):
+    indexs = ["000001.SH", "399001.SZ"]
+
+    def test_parse_feature_name(self):
+        self.assertEqual(("ma", 5), parse_feature_name("ma_5"))
+        self.assertEqual(("volatility", 20),
+                         parse_feature_name("volatility_20"))
+        self.assertEqual((None, None), parse_feature_name("indexs_info"))
+        self.assertEqual((None, None), parse_feature_name("ma_x"))
+        self.assertTrue(is_feature("rsi_14"))
+        self.assertFalse(is_feature("equities_hfq_info"))
+
+    def test_ma(self):
+        closes = self.m.codes_history["000002.SZ"]["close_hfq"].to_numpy()
+        df = get_feature(self.m, "ma_3")
+        self.assertEqual((len(self.m.open_dates), 2), df.shape)
+        self.assertAlmostEqual(closes[7:10].mean(), df.iloc[9, 1])
+        self.assertAlmostEqual(closes[0], df.iloc[0, 1])
+
+    def test_rsi_atr_volatility(self):
+        rsi = get_feature(self.m, "rsi_14").to_numpy()
+        self.assertTrue(np.all((rsi >= 0) & (rsi <= 100)))
+        self.assertEqual(50, rsi[0, 0])
+        atr = get_feature(self.m, "atr_14").to_numpy()
+        self.assertTrue(np.all(atr > 0))
+        vol = get_feature(self.m, "volatility_20").to_numpy()
+        self.assertFalse(np.isnan(vol).any())
+
+    def test_used_infos(self):
+        env = AverageEnv(self.m, look_back_days=5,
+                         used_infos=["equities_hfq_info", "ema_12", "rsi_14"],
+                         reward_fn="daily_return")
+        self.assertEqual(["ema_12", "rsi_14"], self.m.features)
+        self.assertEqual(20 + 2 + 2, env.market_info_size)
+        obs = env.reset()
+        self.assertEqual((5, 24 + 4), obs.shape)
+        date = self.m.open_dates[4]
+        np.testing.assert_allclose(self.m.market_info[date]["rsi_14"],
+                                   obs[-1, 22:24], rtol=1e-6)
+
+    def test_append_days(self):
+        self.m.add_features(["ma_5"])
+        codes_feed, indexs_feed = make_history("20190101", "20190430",
+                                               self.codes, self.indexs)
+        new_dates = self.m.append_days("20190430", codes_feed, indexs_feed)
+        expected = get_feature(self.m, "ma_5").loc[new_dates[-1]].tolist()
+        self.assertEqual(expected,
+                         self.m.market_info[new_dates[-1]]["ma_5"])
+
+    def test_cross_section(self):
+        m = generate_market("20190101", "20190630",
+                            ["%06d.SZ" % (i + 1) for i in range(5)],
+                            seed=1, suspend_prob=0.05)
+        self.assertTrue(is_feature("rs_sh_5"))
+        traded = m.traded
+        close = np.array([m.codes_history[code]["close_hfq"].reindex(
+            m.open_dates).ffill().to_numpy() for code in m.codes]).T
+        returns = close[5:] / close[:-5] - 1
+
+        rank = get_feature(m, "return_rank_5").to_numpy()[5:]
+        self.assertTrue(np.all(rank[~traded[5:]] == 0.5))
+        t = np.nonzero(traded[5:].all(axis=1))[0][0]
+        np.testing.assert_allclose(np.argsort(np.argsort(returns[t])) / 4.0,
+                                   rank[t])
+
+        z = get_feature(m, "volume_zscore_20").to_numpy()
+        self.assertTrue(np.all(z[~traded] == 0))
+        np.testing.assert_allclose(0, (z * traded).sum(axis=1), atol=1e-9)
+
+        index_close = m.indexs_history["000001.SH"]["close"].to_numpy()
+        rs = get_feature(m, "rs_sh_5").to_numpy()[5:]
+        np.testing.assert_allclose(
+            returns - (index_close[5:] / index_close[:-5] - 1)[:, None], rs)
+
+        env = AverageEnv(m, look_back_days=5,
+                         used_infos=["return_rank_5", "rs_sz_5"],
+                         reward_fn="daily_return")
+        self.assertEqual(10, env.market_info_size)
+        env.reset()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding:utf-8 -*-
+"""
+按日期生效的交易费率表: 佣金(含最低佣金), 印花税, 过户费
+一批订单的交易费可以一次向量化计算(fees), 也可以按单笔计算(buy_fee/sell_fee,
+Portfolio使用). 费率总是由传入的日期决定, FeeSchedule没有随日期变化的状态,
+可以在多个env与线程之间共用
+NOTE(wen): env按顺序逐笔下单, 每笔的成交量取决于它的交易费与之前订单成交之后
+    剩余的现金(见Portfolio.order_value), 所以step中仍然逐笔计算交易费, 结果与
+    对当天的成交调用fees的合计相同(见fees_test.py); 使用kernel(BaseEnv.set_kernel)
+    时逐笔计算在编译的trade_day中执行
+"""
+from bisect import bisect_right
+
+import numpy as np
+
+from tgym.ledger import BUY
+
+REGIME_DTYPE = np.dtype([
+    # 生效日期, 如 20080919
+    ("start", np.int64),
+    # 印花税率, 买方/卖方
+    ("buy_stamp_duty", np.float64),
+    ("sell_stamp_duty", np.float64),
+    # 过户费率, 买卖双向
+    ("transfer_fee", np.float64)])
+
+# A股历史费率: (生效日期, 买方印花税, 卖方印花税, 过户费)
+# NOTE(wen): 2015年8月1日之前沪市过户费按股数收取(每千股0.6元), 深市不收, 这里忽略
+A_SHARE_REGIMES = [
+    ("20011116", 0.002, 0.002, 0.0),
+    ("20050124", 0.001, 0.001, 0.0),
+    ("20070530", 0.003, 0.003, 0.0),
+    ("20080424", 0.001, 0.001, 0.0),
+    # 改为向卖方单边征收
+    ("20080919", 0.0, 0.001, 0.0),
+    ("20150801", 0.0, 0.001, 0.00002),
+    ("20220429", 0.0, 0.001, 0.00001),
+    ("20230828", 0.0, 0.0005, 0.00001)]
+
+
+def to_date_ints(dates):
+    # "YYYYMMDD" -> int, 支持单个日期和数组
+    return np.asarray(dates).astype(np.int64)
+
+
+class FeeSchedule:
+    """
+    commission_rate: 券商佣金率(买卖双向, 含交易规费)
+    min_commission: 单笔最低佣金
+    regimes: [(生效日期, 买方印花税, 卖方印花税, 过户费)], 按生效日期升序;
+        第一个生效日期之前使用第一个
+    """
+
+    def __init__(self, commission_rate=0.00025, min_commission=5.0,
+                 regimes=A_SHARE_REGIMES):
+        self.commission_rate = commission_rate
+        self.min_commission = min_commission
+        self.regimes = np.array([(int(start),) + tuple(rates)
+                                 for start, *rates in regimes],
+                                dtype=REGIME_DTYPE)
+        self.starts = self.regimes["start"].tolist()
+
+    def get_regime_ids(self, dates):
+        ids = np.searchsorted(self.regimes["start"], to_date_ints(dates),
+                              side="right") - 1
+        return np.maximum(ids, 0)
+
+    def get_rates(self, date):
+        """
+        返回: date("YYYYMMDD"或int)生效的买入费率, 卖出费率(印花税 + 过户费,
+            不含佣金)
+        """
+        i = max(bisect_right(self.starts, int(date)) - 1, 0)
+        regime = self.regimes[i]
+        return (float(regime["buy_stamp_duty"] + regime["transfer_fee"]),
+                float(regime["sell_stamp_duty"] + regime["transfer_fee"]))
+
+    def _fee(self, amount, rate):
+        if amount <= 0:
+            return 0.0
+        commission = max(amount * self.commission_rate, self.min_commission)
+        # NOTE(wen): 与fees和tgym.envs.kernel.get_fee一样使用np.round
+        return np.round(commission + amount * rate, 2)
+
+    def buy_fee(self, amount, date):
+        # 单笔买入在date的交易费
+        return self._fee(amount, self.get_rates(date)[0])
+
+    def sell_fee(self, amount, date):
+        # 单笔卖出在date的交易费
+        return self._fee(amount, self.get_rates(date)[1])
+
+    def fees(self, sides, amounts, dates):
+        """
+        向量化计算一批订单的交易费
+        sides, amounts: [n]; dates: [n]或单个日期, "YYYYMMDD"或int
+        """
+        sides = np.asarray(sides)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        regimes = self.regimes[self.get_regime_ids(dates)]
+        stamp_duty = np.where(sides == BUY, regimes["buy_stamp_duty"],
+                              regimes["sell_stamp_duty"])
+        commission = np.maximum(amounts * self.commission_rate,
+                                self.min_commission)
+        fees = commission + amounts * (stamp_duty + regimes["transfer_fee"])
+        return np.where(amounts > 0, np.round(fees, 2), 0.0)
+
+    def order_fees(self, orders, dates):
+        """
+        按费率表重新计算账本中订单的交易费
+        orders: ORDER_DTYPE的结构化数组, 见tgym/ledger.py
+        dates: time_id对应的日期列表, 如market.open_dates
+        """
+        date_ints = to_date_ints(dates)[orders["time_id"]]
+        return self.fees(orders["side"], orders["price"] * orders["volume"],
+                         date_ints)
@@ -0,0 +1,146 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from tgym.envs.average import AverageEnv
+from tgym.fees import FeeSchedule
+from tgym.ledger import BUY, SELL
+from tgym.market_test import MarketTestCase
+
+logging.root.setLevel(logging.ERROR)
+
+
+class TestFeeSchedule(unittest.TestCase):
+    def setUp(self):
+        self.schedule = FeeSchedule(commission_rate=0.0003,
+                                    min_commission=5.0)
+
+    def test_regimes(self):
+        s = self.schedule
+        # 2008年4月24日之前双边0.3%印花税
+        self.assertEqual(330.0, s.buy_fee(100000, "20080423"))
+        self.assertEqual(330.0, s.sell_fee(100000, "20080423"))
+        # 2008年9月19日起卖方单边征收
+        self.assertEqual(30.0, s.buy_fee(100000, "20080919"))
+        self.assertEqual(130.0, s.sell_fee(100000, "20080919"))
+        # 2015年8月1日起收取过户费
+        self.assertEqual(32.0, s.buy_fee(100000, "20190102"))
+        self.assertEqual(132.0, s.sell_fee(100000, 20190102))
+        self.assertEqual((0.00002, 0.00102), s.get_rates("20190102"))
+        # 2023年8月28日起印花税减半
+        self.assertEqual(81.0, s.sell_fee(100000, "20231009"))
+        # 最低佣金
+        self.assertEqual(5.01, s.buy_fee(1000, "20231009"))
+        self.assertEqual(0.0, s.buy_fee(0, "20231009"))
+        # 第一个生效日期之前使用第一个
+        self.assertEqual(230.0, s.buy_fee(100000, "19990101"))
+
+    def test_fees(self):
+        rng = np.random.RandomState(0)
+        n = 1000
+        sides = rng.randint(0, 2, n)
+        amounts = rng.uniform(100, 1e6, n).round(2)
+        dates = rng.choice(["20070101", "20080601", "20100104", "20160104",
+                            "20230901"], n)
+        fees = self.schedule.fees(sides, amounts, dates)
+        expected = []
+        for side, amount, date in zip(sides, amounts, dates):
+            if side == BUY:
+                expected.append(self.schedule.buy_fee(amount, date))
+            else:
+                expected.append(self.schedule.sell_fee(amount, date))
+        np.testing.assert_allclose(expected, fees, atol=0.011)
+        # 单个日期广播
+        fees = self.schedule.fees([BUY, SELL], [100000, 100000], "20190102")
+        self.assertEqual([32.0, 132.0], fees.tolist())
+
+    def test_large(self):
+        n = 1000000
+        rng = np.random.RandomState(0)
+        dates = rng.randint(20050101, 20231231, n)
+        start = time.time()
+        fees = self.schedule.fees(rng.randint(0, 2, n),
+                                  rng.uniform(100, 1e6, n), dates)
+        self.assertLess(time.time() - start, 2.0)
+        self.assertTrue(np.all(fees >= 5.0))
+
+
+class TestEnvFeeSchedule(MarketTestCase):
+    start = "20080801"
+    end = "20081031"
+
+    def test_env(self):
+        schedule = FeeSchedule()
+        env = AverageEnv(self.m, look_back_days=5, reward_fn="daily_return")
+        env.set_fee_schedule(schedule)
+        env.reset()
+        done = False
+        while not done:
+            _, _, done, _, _ = env.step(env.get_random_action())
+        orders = env.ledger.orders
+        self.assertGreater(len(orders), 0)
+        # 跨越2008年9月19日的印花税调整, 与按订单重新计算的结果一致
+        np.testing.assert_allclose(
+            schedule.order_fees(orders, self.m.open_dates), orders["fee"],
+            atol=0.011)
+        self.assertAlmostEqual(orders["fee"].sum(), env.all_transaction_cost)
+
+    def test_step_fees(self):
+        # step中逐笔计算的交易费, 与对当天的成交一次向量化计算的合计相同
+        schedule = FeeSchedule()
+        for kernel in [None, "python"]:
+            env = AverageEnv(self.m, look_back_days=5,
+                             reward_fn="daily_return")
+            env.set_fee_schedule(schedule)
+            env.set_kernel(kernel)
+            env.reset()
+            rng = np.random.RandomState(0)
+            done, n_days = False, 0
+            while not done:
+                n_orders = len(env.ledger)
+                date = env.current_date
+                _, _, done, _, _ = env.step(
+                    rng.uniform(-1, 1, env.action_size).tolist())
+                orders = env.ledger.orders[n_orders:]
+                fees = schedule.fees(orders["side"],
+                                     orders["price"] * orders["volume"],
+                                     date)
+                self.assertAlmostEqual(fees.sum(), env.transaction_cost,
+                                       places=6)
+                n_days += len(orders) > 0
+            self.assertGreater(n_days, 10)
+
+    def test_shared(self):
+        # 一个FeeSchedule在多个线程中不同日期(跨越2008年9月19日)的env之间共用
+        schedule = FeeSchedule()
+        envs = [AverageEnv(self.m, look_back_days=look_back_days,
+                           reward_fn="daily_return")
+                for look_back_days in [5, 40]]
+
+        def run(env):
+            env.set_fee_schedule(schedule)
+            env.reset()
+            rng = np.random.RandomState(0)
+            for _ in range(20):
+                env.step(rng.uniform(-1, 1, env.action_size).tolist())
+
+        threads = [threading.Thread(target=run, args=(env,)) for env in envs]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for env in envs:
+            orders = env.ledger.orders
+            self.assertGreater(len(orders), 0)
+            np.testing.assert_allclose(
+                schedule.order_fees(orders, self.m.open_dates),
+                orders["fee"], atol=0.011)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+# -*- coding:utf-8 -*-
+"""
+离线生成与Market数据格式一致的模拟日线数据, 不依赖tushare, 用于压力测试与实验
+- 个股: 不复权/后复权OHLCV, pre_close, pct_chg, 复权因子(拆分), 停牌, 涨跌停
+- 指数: OHLCV, pre_close, pct_chg
+收益率序列可以是几何布朗运动(GBM), 也可以从已有的历史收益率中分块抽样(block
+bootstrap). 所有股票, 所有日期一次性向量化生成, 相同seed生成的数据相同
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from tgym.market import Market, get_price_limits
+
+CODE_COLUMNS = ["adj_factor", "open", "high", "low", "close", "pre_close",
+                "change", "pct_chg", "vol", "amount", "open_hfq", "high_hfq",
+                "low_hfq", "close_hfq", "pre_close_hfq", "change_hfq",
+                "pct_chg_hfq", "vol_hfq", "amount_hfq"]
+
+INDEX_COLUMNS = ["close", "open", "high", "low", "pre_close", "change",
+                 "pct_chg", "vol", "amount"]
+
+# Market默认加载的指数
+DEFAULT_INDEXS = ["000001.SH", "399001.SZ"]
+
+
+def generate_open_dates(start, end):
+    # 以工作日作为开市日
+    return [d.strftime("%Y%m%d") for d in pd.bdate_range(start, end)]
+
+
+def gbm_returns(rng, n_dates, n_codes, mu=0.0003, sigma=0.02):
+    """
+    几何布朗运动的日收益率, [n_dates, n_codes]
+    """
+    log_returns = rng.normal(mu - sigma ** 2 / 2, sigma, (n_dates, n_codes))
+    return np.expm1(log_returns)
+
+
+def block_bootstrap_returns(rng, returns, n_dates, n_codes, block_size=20):
+    """
+    从历史日收益率中按长度为block_size的连续块有放回抽样, 保留波动聚集等特征
+    returns: [T] 或 [T, k] 的历史日收益率, 如:
+        market.codes_history[code]["close_hfq"].pct_change().dropna()
+    返回: [n_dates, n_codes]
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.ndim == 1:
+        returns = returns[:, None]
+    block_size = min(block_size, len(returns))
+    n_blocks = -(-n_dates // block_size)
+    starts = rng.randint(0, len(returns) - block_size + 1,
+                         (n_blocks, n_codes))
+    index = (starts[:, None, :] +
+             np.arange(block_size)[None, :, None]).reshape(-1, n_codes)
+    columns = rng.randint(0, returns.shape[1], n_codes)
+    return returns[index[:n_dates], columns]
+
+
+def generate_suspended(rng, n_dates, n_codes, suspend_prob, mean_days=5):
+    """
+    停牌: 每天以suspend_prob的概率开始停牌, 停牌天数服从几何分布
+    返回: [n_dates, n_codes]的bool数组, 第一天不停牌
+    """
+    suspended = np.zeros((n_dates, n_codes), dtype=bool)
+    starts = np.argwhere(rng.random_sample((n_dates, n_codes)) < suspend_prob)
+    days = rng.geometric(1.0 / mean_days, len(starts))
+    for (t, i), n in zip(starts, days):
+        suspended[t: t + n, i] = True
+    suspended[0] = False
+    return suspended
+
+
+def generate_codes_history(codes, dates, seed=0, returns=None, sigma=0.02,
+                           price=(5.0, 50.0), suspend_prob=0.002,
+                           split_prob=0.001, limit_prob=0.01, lock_prob=0.5,
+                           block_size=20):
+    """
+    生成个股数据, 返回: dict, code -> DataFrame, 格式与Market.codes_history一致
+    returns: 为None时使用GBM, 否则从returns中block bootstrap
+    price: 初始价格的范围
+    suspend_prob: 每天开始停牌的概率
+    split_prob: 每天拆分的概率
+    limit_prob: 每天涨停或跌停的概率, 模拟收益率的厚尾
+    lock_prob: 收益率达到涨跌停时, 一字板(open=high=low=close)的概率
+    """
+    rng = np.random.RandomState(seed)
+    n_dates, n_codes = len(dates), len(codes)
+    shape = (n_dates, n_codes)
+    if returns is None:
+        r = gbm_returns(rng, n_dates, n_codes, sigma=sigma)
+    else:
+        r = block_bootstrap_returns(rng, returns, n_dates, n_codes,
+                                    block_size)
+    # [n_dates, n_codes], 创业板的涨跌停幅度随日期变化
+    limits = np.column_stack([get_price_limits(code, dates)
+                              for code in codes])
+    to_limit = rng.random_sample(shape) < limit_prob
+    r = np.where(to_limit, np.sign(rng.random_sample(shape) - 0.5) * limits,
+                 r)
+    r = np.clip(r, -limits, limits)
+    suspended = generate_suspended(rng, n_dates, n_codes, suspend_prob)
+    r[suspended] = 0
+    # 拆分: 复权因子增加, 不复权价格相应降低
+    split = (rng.random_sample(shape) < split_prob) & ~suspended
+    split[0] = False
+    ratios = np.where(split, rng.choice([1.2, 1.5, 2.0], shape), 1.0)
+    adj_factor = np.cumprod(ratios, axis=0)
+
+    close_hfq = rng.uniform(price[0], price[1], n_codes) * np.cumprod(
+        1 + r, axis=0)
+    close = np.maximum(np.round(close_hfq / adj_factor, 2), 0.01)
+    # 除权后的前收盘价
+    pre_close = np.empty(shape)
+    pre_close[1:] = close[:-1] / ratios[1:]
+    pre_close[0] = close[0] / (1 + r[0])
+    pre_close = np.round(pre_close, 2)
+    upper = np.round(pre_close * (1 + limits), 2)
+    lower = np.round(pre_close * (1 - limits), 2)
+    close = np.clip(close, lower, upper)
+    # 收益率达到涨跌停时, 收盘价为涨跌停价
+    at_up = r >= limits - 1e-6
+    at_down = r <= -limits + 1e-6
+    close = np.where(at_up, upper, np.where(at_down, lower, close))
+
+    gap = rng.normal(0, sigma / 3, shape)
+    open = np.clip(np.round(pre_close * (1 + gap), 2), lower, upper)
+    high = np.maximum(open, close) * (
+        1 + np.abs(rng.normal(0, sigma / 2, shape)))
+    high = np.clip(np.round(high, 2), None, upper)
+    low = np.minimum(open, close) * (
+        1 - np.abs(rng.normal(0, sigma / 2, shape)))
+    low = np.clip(np.round(low, 2), lower, None)
+    # 涨跌停一字板
+    lock = (at_up | at_down) & (rng.random_sample(shape) < lock_prob)
+    open = np.where(lock, close, open)
+    high = np.where(lock, close, high)
+    low = np.where(lock, close, low)
+
+    vol = np.round(rng.lognormal(11, 0.5, shape) *
+                   (1 + 20 * np.abs(r)), 2)
+    # vol单位: 手, amount单位: 千元
+    amount = np.round(vol * (open + high + low + close) / 4 * 0.1, 3)
+    change = np.round(close - pre_close, 2)
+    pct_chg = np.round(change / pre_close * 100, 4)
+    columns = {
+        "adj_factor": adj_factor,
+        "open": open, "high": high, "low": low, "close": close,
+        "pre_close": pre_close, "change": change, "pct_chg": pct_chg,
+        "vol": vol, "amount": amount}
+    for name in ["open", "high", "low", "close", "pre_close"]:
+        columns[name + "_hfq"] = columns[name] * adj_factor
+    columns["change_hfq"] = columns["close_hfq"] - columns["pre_close_hfq"]
+    columns["pct_chg_hfq"] = pct_chg
+    columns["vol_hfq"] = vol
+    columns["amount_hfq"] = amount
+
+    index = pd.Index(dates, name="trade_date")
+    codes_history = {}
+    for i, code in enumerate(codes):
+        data = np.column_stack([columns[name][:, i] for name in CODE_COLUMNS])
+        df = pd.DataFrame(data, index=index, columns=CODE_COLUMNS)
+        codes_history[code] = df[~suspended[:, i]]
+    return codes_history
+
+
+def generate_indexs_history(indexs, dates, seed=0, sigma=0.012,
+                            point=(2000.0, 12000.0)):
+    """
+    生成指数数据, 返回: dict, code -> DataFrame, 格式与Market.indexs_history一致
+    """
+    rng = np.random.RandomState(seed + 1)
+    n_dates, n_codes = len(dates), len(indexs)
+    shape = (n_dates, n_codes)
+    r = gbm_returns(rng, n_dates, n_codes, sigma=sigma)
+    close = rng.uniform(point[0], point[1], n_codes) * np.cumprod(
+        1 + r, axis=0)
+    pre_close = np.empty(shape)
+    pre_close[1:] = close[:-1]
+    pre_close[0] = close[0] / (1 + r[0])
+    open = pre_close * (1 + rng.normal(0, sigma / 3, shape))
+    high = np.maximum(open, close) * (
+        1 + np.abs(rng.normal(0, sigma / 2, shape)))
+    low = np.minimum(open, close) * (
+        1 - np.abs(rng.normal(0, sigma / 2, shape)))
+    vol = rng.lognormal(18, 0.3, shape)
+    columns = {
+        "close": close, "open": open, "high": high, "low": low,
+        "pre_close": pre_close, "change": close - pre_close,
+        "pct_chg": (close / pre_close - 1) * 100,
+        "vol": vol, "amount": vol * close * 0.01}
+
+    index = pd.Index(dates, name="trade_date")
+    indexs_history = {}
+    for i, code in enumerate(indexs):
+        data = np.column_stack([np.round(columns[name][:, i], 4)
+                                for name in INDEX_COLUMNS])
+        indexs_history[code] = pd.DataFrame(data, index=index,
+                                            columns=INDEX_COLUMNS)
+    return indexs_history
+
+
+def generate_history(start, end, codes, indexs=DEFAULT_INDEXS, seed=0,
+                     **kwargs):
+    """
+    返回: codes_history, indexs_history, 指数包含Market默认加载的指数
+    kwargs: 传给generate_codes_history
+    """
+    dates = generate_open_dates(start, end)
+    indexs = DEFAULT_INDEXS + [code for code in indexs
+                               if code not in DEFAULT_INDEXS]
+    codes_history = generate_codes_history(codes, dates, seed=seed, **kwargs)
+    indexs_history = generate_indexs_history(indexs, dates, seed=seed)
+    return codes_history, indexs_history
+
+
+def write_history(data_dir, start, end, codes_history, indexs_history):
+    """
+    按Market的data_dir格式写入数据文件, 之后以相同的start, end创建Market时直接加载
+    """
+    for code, df in codes_history.items():
+        dir = os.path.join(data_dir, code)
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+        df.to_csv(os.path.join(dir, start + "-" + end + ".csv"))
+    for code, df in indexs_history.items():
+        dir = os.path.join(data_dir, "indexs", code)
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+        df.to_csv(os.path.join(dir, start + "-" + end + ".csv"))
+
+
+def generate_market(start="20190101", end="20200101", codes=["000001.SZ"],
+                    indexs=DEFAULT_INDEXS, seed=0, data_dir=None, **kwargs):
+    """
+    生成模拟数据并创建Market
+    data_dir: 为None时数据只在内存中, 否则先写入data_dir再由Market加载
+    """
+    codes_history, indexs_history = generate_history(
+        start, end, codes, indexs, seed, **kwargs)
+    if data_dir is None:
+        return Market(start=start, end=end, codes=codes, indexs=indexs,
+                      data_dir=None, codes_history=codes_history,
+                      indexs_history=indexs_history)
+    write_history(data_dir, start, end, codes_history, indexs_history)
+    return Market(start=start, end=end, codes=codes, indexs=indexs,
+                  data_dir=data_dir)
@@ -0,0 +1,137 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tgym.envs.multi_vol import MultiVolEnv
+from tgym.generator import (CODE_COLUMNS, INDEX_COLUMNS,
+                            block_bootstrap_returns, generate_history,
+                            generate_market, generate_open_dates)
+
+logging.root.setLevel(logging.ERROR)
+
+
+class TestGenerator(unittest.TestCase):
+    def setUp(self):
+        self.codes = ["000001.SZ", "300750.SZ", "600000.SH"]
+        self.codes_history, self.indexs_history = generate_history(
+            "20150101", "20191231", self.codes, ["000300.SH"], seed=1,
+            suspend_prob=0.01, split_prob=0.002)
+
+    def test_seed(self):
+        codes_history, indexs_history = generate_history(
+            "20150101", "20191231", self.codes, ["000300.SH"], seed=1,
+            suspend_prob=0.01, split_prob=0.002)
+        for code in self.codes:
+            self.assertTrue(codes_history[code].equals(
+                self.codes_history[code]))
+        codes_history, _ = generate_history(
+            "20150101", "20191231", self.codes, seed=2)
+        self.assertFalse(codes_history["000001.SZ"].equals(
+            self.codes_history["000001.SZ"]))
+
+    def test_columns(self):
+        n_dates = len(generate_open_dates("20150101", "20191231"))
+        self.assertEqual(["000001.SH", "399001.SZ", "000300.SH"],
+                         list(self.indexs_history.keys()))
+        for df in self.indexs_history.values():
+            self.assertEqual(INDEX_COLUMNS, df.columns.tolist())
+            self.assertEqual(n_dates, len(df))
+        for df in self.codes_history.values():
+            self.assertEqual(CODE_COLUMNS, df.columns.tolist())
+            self.assertEqual("trade_date", df.index.name)
+            # 停牌日没有数据, 第一天不停牌
+            self.assertLess(len(df), n_dates)
+            self.assertEqual("20150101", df.index[0])
+
+    def test_prices(self):
+        # 2020年8月24日之前创业板的涨跌停幅度也是10%
+        for code, limit in zip(self.codes, [10, 10, 10]):
+            df = self.codes_history[code]
+            self.assertTrue((df["low"] <= df[["open", "close"]].min(
+                axis=1)).all())
+            self.assertTrue((df["high"] >= df[["open", "close"]].max(
+                axis=1)).all())
+            # 涨跌停价四舍五入到分
+            self.assertTrue((df["change"].abs() <=
+                             df["pre_close"] * limit / 100 + 0.011).all())
+            np.testing.assert_allclose(df["close"] * df["adj_factor"],
+                                       df["close_hfq"])
+            # 有拆分, 复权因子单调不减
+            self.assertTrue(df["adj_factor"].iloc[-1] > 1)
+            self.assertTrue((df["adj_factor"].diff().dropna() >= 0).all())
+            # 有一字涨跌停
+            locked = (df["high"] == df["low"]) & (df["pct_chg"].abs() >
+                                                  limit - 0.5)
+            self.assertTrue(locked.any())
+
+    def test_block_bootstrap(self):
+        rng = np.random.RandomState(0)
+        history = np.arange(100) / 1000.0
+        r = block_bootstrap_returns(rng, history, 50, 3, block_size=10)
+        self.assertEqual((50, 3), r.shape)
+        # 块内是连续的历史收益率
+        np.testing.assert_allclose(np.diff(r[:10], axis=0), 0.001)
+        self.assertTrue(np.isin(r, history).all())
+
+    def test_generate_market(self):
+        m = generate_market("20190101", "20191231", self.codes, seed=3)
+        self.assertIsNone(m.data_dir)
+        self.assertEqual(len(self.codes) * 10, m.equity_hfq_info_size)
+        data_dir = tempfile.mkdtemp()
+        m2 = generate_market("20190101", "20191231", self.codes, seed=3,
+                             data_dir=data_dir)
+        self.assertEqual(m.open_dates, m2.open_dates)
+        date = m.open_dates[-1]
+        np.testing.assert_allclose(
+            m.market_info[date]["equities_hfq_info"],
+            m2.market_info[date]["equities_hfq_info"])
+        shutil.rmtree(data_dir)
+
+        # 有停牌时也可以使用价格相关的reward
+        self.assertFalse(m.traded.all())
+        env = MultiVolEnv(m, look_back_days=10)
+        env.reset()
+        done = False
+        while not done:
+            _, reward, done, _, _ = env.step(env.get_random_action())
+            self.assertTrue(np.isfinite(reward))
+        self.assertEqual(len(m.open_dates) - 10,
+                         len(env.portfolio_value_logs))
+
+    def test_trade_masks(self):
+        # 跨越创业板涨跌停幅度由10%改为20%的日期
+        m = generate_market("20190101", "20211231", self.codes, seed=1,
+                            suspend_prob=0.01, split_prob=0.002,
+                            limit_prob=0.03)
+        for code in self.codes:
+            df = m.codes_history[code]
+            i = m.code_ids[code]
+            dates = df.index
+            ids = [m.calendar.get_id(date) for date in dates]
+            limit = np.where(code.startswith("300") &
+                             (dates >= "20200824"), 20, 10)
+            locked = (df["high"] == df["low"]).to_numpy()
+            up = locked & (df["pct_chg"] > limit - 0.5).to_numpy()
+            down = locked & (df["pct_chg"] < 0.5 - limit).to_numpy()
+            self.assertTrue(up.any() and down.any())
+            np.testing.assert_array_equal(up, m.limit_up_locked[ids, i])
+            np.testing.assert_array_equal(down, m.limit_down_locked[ids, i])
+            self.assertEqual(len(m.open_dates) - len(df),
+                             m.suspended[:, i].sum())
+            date = dates[np.nonzero(up)[0][0]]
+            ok, _ = m.buy_check(code, date, bid_price=1000)
+            self.assertFalse(ok)
+            ok, _ = m.sell_check(code, date, bid_price=0.01)
+            self.assertTrue(ok)
+            date = dates[np.nonzero(down)[0][0]]
+            ok, _ = m.sell_check(code, date, bid_price=0.01)
+            self.assertFalse(ok)
+
+
+if __name__ == '__main__':
+    unittest.main()
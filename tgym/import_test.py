@@ -0,0 +1,79 @@
+# -*- coding:utf-8 -*-
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from tgym.generator import write_history
+from tgym.market_test import make_history
+
+# import tgym.envs.average的时间预算(ms), 本地约130ms, 主要是numpy与gym
+AVERAGE_IMPORT_BUDGET_MS = 500
+# 数据源相关的包, 只在下载数据时导入
+DATA_SOURCE_MODULES = ["tushare", "requests", "bs4", "lxml"]
+
+
+def run_python(code, env=None):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=root, env=env, capture_output=True,
+                          text=True, check=True)
+
+
+def get_import_time_ms(stderr, module):
+    # -X importtime的输出: "import time: self [us] | cumulative | module"
+    for line in stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)$", line)
+        if m and m.group(3) == module and not m.group(2):
+            return int(m.group(1)) / 1000.0
+    return None
+
+
+class TestImport(unittest.TestCase):
+    def assertNotImported(self, code, modules):
+        result = run_python(code + "; import sys; print(sorted(sys.modules))")
+        imported = set(eval(result.stdout))
+        self.assertEqual([], [m for m in modules if m in imported])
+
+    def test_average_budget(self):
+        self.assertNotImported("import tgym.envs.average",
+                               DATA_SOURCE_MODULES + ["pandas"])
+        # 取多次中最快的一次, 减少机器负载的影响
+        times = [get_import_time_ms(
+            run_python("import tgym.envs.average").stderr, "tgym.envs.average")
+            for _ in range(3)]
+        self.assertLess(min(times), AVERAGE_IMPORT_BUDGET_MS)
+
+    def test_lazy_imports(self):
+        self.assertNotImported("import tgym.market", DATA_SOURCE_MODULES)
+        self.assertNotImported("import tgym.scenario",
+                               ["tgym.envs.simple", "tgym.envs.multi_vol"])
+        # numba只在第一次使用numba kernel时导入
+        self.assertNotImported("import tgym.envs.average", ["numba"])
+
+    def test_offline(self):
+        data_dir = tempfile.mkdtemp()
+        codes = ["000001.SZ"]
+        indexs = ["000001.SH", "399001.SZ"]
+        write_history(data_dir, "20190101", "20190331",
+                      *make_history("20190101", "20190331", codes, indexs))
+        code = ("from tgym.market import Market; m = Market(start='20190101', "
+                "end='20190331', codes=%r, indexs=%r, data_dir=%r)" % (
+                    codes, indexs, data_dir))
+        env = dict(os.environ, TGYM_OFFLINE="1")
+        self.assertNotImported(code, DATA_SOURCE_MODULES)
+        # 离线模式下缺少数据文件时不会下载
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            run_python(code.replace("20190331", "20190430"), env)
+        self.assertIn(u"离线模式", cm.exception.stderr)
+        self.assertFalse(os.path.exists(os.path.join(
+            data_dir, "000001.SZ", "20190101-20190430.csv")))
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
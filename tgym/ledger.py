@@ -0,0 +1,140 @@
+# -*- coding:utf-8 -*-
+"""
+订单账本: 以结构化数组记录一个回合中所有成交的订单, 并提供向量化的统计查询
+"""
+import numpy as np
+
+SELL, BUY = 0, 1
+SIDES = {"sell": SELL, "buy": BUY}
+
+ORDER_DTYPE = np.dtype([
+    # SELL: 0, BUY: 1
+    ("side", np.int8),
+    # 在env.codes中的位置
+    ("code_id", np.int32),
+    # 成交日期在market.open_dates中的位置
+    ("time_id", np.int32),
+    ("price", np.float64),
+    ("volume", np.int64),
+    # 交易费
+    ("fee", np.float64),
+    ("cash_change", np.float64),
+    # 成交之后的持仓量
+    ("position", np.int64)])
+
+
+class OrderLedger:
+    """
+    n_codes: 股票数量
+    capacity: 初始容量, 写满时容量翻倍, 追加的均摊复杂度为O(1)
+    NOTE(wen): clear之后保留已分配的空间, 需要保存上一回合订单时使用orders.copy()
+    """
+
+    def __init__(self, n_codes, capacity=1024):
+        self.n_codes = n_codes
+        self.buffer = np.zeros(capacity, dtype=ORDER_DTYPE)
+        self.size = 0
+        # 下单次数(包括没有成交的), [side, code_id]
+        self.attempts = np.zeros((2, n_codes), dtype=np.int64)
+
+    @property
+    def orders(self):
+        return self.buffer[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.size = 0
+        self.attempts[:] = 0
+
+    def add_attempt(self, side, code_id):
+        self.attempts[side, code_id] += 1
+
+    def append(self, side, code_id, time_id, price, volume, fee, cash_change,
+               position):
+        if self.size == len(self.buffer):
+            buffer = np.zeros(2 * len(self.buffer), dtype=ORDER_DTYPE)
+            buffer[:self.size] = self.buffer
+            self.buffer = buffer
+        self.buffer[self.size] = (side, code_id, time_id, price, volume, fee,
+                                  cash_change, position)
+        self.size += 1
+
+    def extend(self, orders):
+        """
+        orders: ORDER_DTYPE的结构化数组, 用于合并多个回合, 或从文件加载
+        """
+        n = self.size + len(orders)
+        if n > len(self.buffer):
+            buffer = np.zeros(max(n, 2 * len(self.buffer)), dtype=ORDER_DTYPE)
+            buffer[:self.size] = self.orders
+            self.buffer = buffer
+        self.buffer[self.size: n] = orders
+        self.size = n
+
+    def _by_code(self, weights, mask=None):
+        orders = self.orders
+        if mask is not None:
+            orders, weights = orders[mask], weights[mask]
+        return np.bincount(orders["code_id"], weights=weights,
+                           minlength=self.n_codes)
+
+    def amounts(self):
+        # 每笔订单的成交金额
+        return self.orders["price"] * self.orders["volume"]
+
+    def turnover(self, side=None):
+        """
+        每支股票的成交金额, side为None时买卖合计, 返回[n_codes]
+        """
+        mask = None if side is None else self.orders["side"] == side
+        return self._by_code(self.amounts(), mask)
+
+    def fee_total(self, by_code=False):
+        if by_code:
+            return self._by_code(self.orders["fee"])
+        return self.orders["fee"].sum()
+
+    def fill_counts(self):
+        # 成交次数, [side, code_id]
+        orders = self.orders
+        counts = np.bincount(
+            orders["side"].astype(np.int64) * self.n_codes +
+            orders["code_id"], minlength=2 * self.n_codes)
+        return counts.reshape(2, self.n_codes)
+
+    def fill_rate(self):
+        """
+        成交次数 / 下单次数, [side, code_id], 没有下单时为0
+        """
+        fills = self.fill_counts()
+        return np.divide(fills, self.attempts,
+                         out=np.zeros(fills.shape), where=self.attempts > 0)
+
+    def holding_periods(self):
+        """
+        从空仓买入到全部卖出的持仓周期
+        返回: code_ids, 开仓time_id, 持有的交易日数, 均为一维数组;
+            回合结束时仍未平仓的不计入
+        """
+        orders = self.orders
+        # 按股票分组, 组内保持时间顺序
+        index = np.argsort(orders["code_id"], kind="stable")
+        orders = orders[index]
+        is_buy = orders["side"] == BUY
+        is_open = is_buy & (orders["position"] == orders["volume"])
+        opens = np.nonzero(is_open)[0]
+        closes = np.nonzero(~is_buy & (orders["position"] == 0))[0]
+        if len(opens) == 0 or len(closes) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        # 每次平仓对应它之前最近一次开仓
+        positions = np.searchsorted(opens, closes)
+        matched = opens[positions - 1]
+        valid = (positions > 0) & (
+            orders["code_id"][matched] == orders["code_id"][closes])
+        matched, closes = matched[valid], closes[valid]
+        open_time_ids = orders["time_id"][matched].astype(np.int64)
+        periods = orders["time_id"][closes] - open_time_ids
+        return orders["code_id"][closes], open_time_ids, periods
@@ -0,0 +1,116 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import random
+import time
+import unittest
+
+import numpy as np
+
+from tgym.envs.average import AverageEnv
+from tgym.ledger import BUY, ORDER_DTYPE, SELL, OrderLedger
+from tgym.market_test import MarketTestCase
+
+logging.root.setLevel(logging.ERROR)
+
+
+class TestOrderLedger(unittest.TestCase):
+    def make_ledger(self):
+        ledger = OrderLedger(2, capacity=2)
+        # side, code_id, time_id, price, volume, fee, cash_change, position
+        ledger.append(BUY, 0, 1, 10.0, 100, 5.0, -1005.0, 100)
+        ledger.append(BUY, 1, 1, 20.0, 200, 5.0, -4005.0, 200)
+        ledger.append(BUY, 0, 2, 10.0, 100, 5.0, -1005.0, 200)
+        ledger.append(SELL, 0, 5, 11.0, 200, 3.3, 2196.7, 0)
+        ledger.append(BUY, 0, 6, 12.0, 100, 5.0, -1205.0, 100)
+        ledger.append(SELL, 0, 9, 12.0, 100, 1.8, 1198.2, 0)
+        for code_id in [0, 0, 1, 1]:
+            ledger.add_attempt(BUY, code_id)
+        for code_id in [0, 0, 0, 1]:
+            ledger.add_attempt(SELL, code_id)
+        return ledger
+
+    def test_append(self):
+        ledger = self.make_ledger()
+        self.assertEqual(6, len(ledger))
+        self.assertEqual(8, len(ledger.buffer))
+        self.assertEqual([1, 1, 2, 5, 6, 9], ledger.orders["time_id"].tolist())
+        ledger.clear()
+        self.assertEqual(0, len(ledger))
+        self.assertEqual(8, len(ledger.buffer))
+        self.assertEqual(0, ledger.attempts.sum())
+
+    def test_queries(self):
+        ledger = self.make_ledger()
+        self.assertEqual([1000 + 1000 + 2200 + 1200 + 1200, 4000],
+                         ledger.turnover().tolist())
+        self.assertEqual([3400, 0], ledger.turnover(side=SELL).tolist())
+        self.assertAlmostEqual(25.1, ledger.fee_total())
+        self.assertAlmostEqual(5.0, ledger.fee_total(by_code=True)[1])
+        np.testing.assert_allclose([[2.0 / 3, 0], [1.5, 0.5]],
+                                   ledger.fill_rate())
+        code_ids, open_time_ids, periods = ledger.holding_periods()
+        self.assertEqual([0, 0], code_ids.tolist())
+        self.assertEqual([1, 6], open_time_ids.tolist())
+        self.assertEqual([4, 3], periods.tolist())
+
+    def test_large(self):
+        n = 1000000
+        rng = np.random.RandomState(0)
+        orders = np.zeros(n, dtype=ORDER_DTYPE)
+        orders["side"] = rng.randint(0, 2, n)
+        orders["code_id"] = rng.randint(0, 500, n)
+        orders["time_id"] = np.arange(n) // 500
+        orders["price"] = rng.uniform(5, 50, n)
+        orders["volume"] = rng.randint(1, 100, n) * 100
+        orders["position"] = np.where(orders["side"] == BUY,
+                                      orders["volume"], 0)
+        ledger = OrderLedger(500)
+        ledger.extend(orders)
+        start = time.time()
+        ledger.turnover()
+        ledger.fee_total(by_code=True)
+        ledger.fill_rate()
+        _, _, periods = ledger.holding_periods()
+        self.assertTrue(np.all(periods >= 0))
+        self.assertLess(time.time() - start, 2.0)
+
+
+class TestEnvLedger(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.env = AverageEnv(self.m, look_back_days=5,
+                              reward_fn="daily_return")
+
+    def test_ledger(self):
+        random.seed(0)
+        self.env.reset()
+        done, orders = False, []
+        while not done:
+            _, _, done, info, _ = self.env.step(self.env.get_random_action())
+            orders.extend(info["orders"])
+        ledger = self.env.ledger
+        self.assertEqual(len(orders), len(ledger))
+        self.assertEqual([o[4] for o in orders],
+                         ledger.orders["volume"].tolist())
+        np.testing.assert_allclose([o[2] for o in orders],
+                                   ledger.orders["cash_change"], atol=0.05)
+        self.assertAlmostEqual(self.env.all_transaction_cost,
+                               ledger.fee_total())
+        n_steps = len(self.env.portfolio_value_logs)
+        self.assertEqual([n_steps, n_steps], ledger.attempts[SELL].tolist())
+
+    def test_ledger_info_mode(self):
+        env = AverageEnv(self.m, look_back_days=5, reward_fn="daily_return",
+                         info_mode="ledger")
+        env.reset()
+        _, _, _, info, _ = env.step([0, 0.5, 0, 0.5])
+        self.assertIs(env.ledger, info)
+        _, _, _, info2, _ = env.step([0, 0.5, 0, 0.5])
+        self.assertIs(info, info2)
+        env.reset()
+        self.assertEqual(0, len(env.ledger))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,83 @@
 # -*- coding:utf-8 -*-
+import copy
 import os
+import threading
+from bisect import bisect_left
+from collections.abc import Mapping
+from types import MappingProxyType
 
+import numpy as np
 import pandas as pd
-import tushare as ts
 
-from tgym.logger import logger
+from tgym.features import get_feature, is_feature, reindex_ffill
+from tgym.trade_calendar import TradeCalendar
+
+# 交易判断用到的不复权数据, 见Market.init_price_info
+PRICE_COLUMNS = ["open", "high", "low", "close", "pre_close", "pct_chg",
+                 "adj_factor"]
+
+# [date, code]的交易限制, 见Market.init_trade_masks
+TRADE_MASKS = ["traded", "suspended", "st", "limit_up_locked",
+               "limit_down_locked", "buyable", "sellable"]
+
+
+# market_info中的信息块, 见Market.init_market_info
+INFO_NAMES = ["equities_bfq_info", "equities_hfq_info", "indexs_info"]
+
+
+# 创业板改革并试点注册制, 从这一天起创业板(含ST)的涨跌停幅度由10%(ST 5%)改为20%
+CHINEXT_REFORM_DATE = "20200824"
+
+
+def get_price_limit(code, st=False, date=None):
+    """
+    涨跌停幅度: 主板10%, ST 5%, 创业板(300, 301)与科创板(688, 689) 20%, 北交所30%
+    date: 交易日, 为None时使用现行规则; CHINEXT_REFORM_DATE之前创业板与主板相同
+    """
+    if code.endswith(".BJ"):
+        return 0.3
+    if code[:3] in ["688", "689"]:
+        return 0.2
+    if code[:3] in ["300", "301"] and (date is None or
+                                       date >= CHINEXT_REFORM_DATE):
+        return 0.2
+    if st:
+        return 0.05
+    return 0.1
+
+
+def get_price_limits(code, dates, st=False):
+    """
+    升序的交易日dates上的涨跌停幅度, 返回: [len(dates)]
+    """
+    limits = np.empty(len(dates))
+    n = bisect_left(dates, CHINEXT_REFORM_DATE)
+    if n > 0:
+        limits[:n] = get_price_limit(code, st, dates[0])
+    if n < len(dates):
+        limits[n:] = get_price_limit(code, st, dates[n])
+    return limits
+
+
+class FrozenHistory(Mapping):
+    """
+    冻结的Market中codes_history/indexs_history的只读视图: 不能增删或替换股票,
+    每次访问返回DataFrame的复制, 修改返回的DataFrame不会改变Market的数据
+    NOTE(wen): 复制使不同pandas版本(包括没有Copy-on-Write的版本)的行为一致,
+        冻结之后Market只在计算市场信息之外读取历史数据, 不在step中访问
+    """
+
+    def __init__(self, histories):
+        self._histories = dict(histories)
+
+    def __getitem__(self, code):
+        return self._histories[code].copy()
+
+    def __iter__(self):
+        return iter(self._histories)
+
+    def __len__(self):
+        return len(self._histories)
 
 
 class Market:
@@ -19,6 +92,17 @@ class Market:
         ...
     NOTE(wen): 使用tushare下载指数日线信息需要在tushare.pro帐户中有200积分
     data_dir: 存储数据文件的目录，以降低重复下载的频率
+    codes_history/indexs_history: 已在内存中的数据(如tgym/generator.py生成的),
+        格式与self.codes_history/self.indexs_history一致, 不为None时不再加载
+    infos: 需要构建的market_info信息块与列, 只有这些数据会计算并保存:
+        dict, 信息块名 -> 列名列表(为None时使用全部列), 如
+        {"equities_hfq_info": ["close_hfq", "vol_hfq"], "indexs_info": None};
+        也可以是信息块名的列表; 为None时构建INFO_NAMES中的全部信息块
+    offline: 离线模式, 只使用data_dir中已有的数据, 不导入tushare也不访问网络,
+        数据文件不存在时抛出异常; 为None时由环境变量TGYM_OFFLINE=1开启
+    cache: tgym.market_cache.MarketCache, 相同配置与数据文件时直接读取之前构建
+        的结果, 见tgym/market_cache.py
+    NOTE(wen): tushare只在第一次需要下载数据时导入
     """
 
     def __init__(self,
@@ -27,35 +111,164 @@ class Market:
                  end="20200101",
                  codes=["000001.SZ"],
                  indexs=["000001.SH", "399001.SZ"],
-                 data_dir="/tmp/tgym"):
-        ts.set_token(ts_token)
+                 data_dir="/tmp/tgym",
+                 codes_history=None,
+                 indexs_history=None,
+                 infos=None,
+                 offline=None,
+                 cache=None):
+        self.ts_token = ts_token
+        if offline is None:
+            offline = os.getenv("TGYM_OFFLINE") == "1"
+        self.offline = offline
+        self.ts = None
         self.start = start
         self.end = end
         self.codes = codes
         self.indexs = indexs
         self.data_dir = data_dir
-        self.load_codes_history()
-        self.load_indexs_history()
+        # 已计算的技术指标名, 见tgym/features.py
+        self.features = []
+        # 技术指标增量计算的状态, 见tgym/features.py
+        self.feature_states = {}
+        # append_days追加数组时预留了容量的缓冲区, 见extend_rows
+        self.row_buffers = {}
+        # 按(used_infos, dtype)缓存的market_info数组, 见get_market_info_array
+        self.market_info_arrays = {}
+        # ST期间, 涨跌停幅度为5%, 见set_st_periods
+        self.st_periods = {}
+        # window()返回的视图: 完整的Market, 以及视图第一天在其中的位置
+        self.parent = None
+        self.window_start = 0
+        # 保护技术指标与market_info数组的延迟计算, 多个线程可以共用一个Market
+        self.lock = threading.RLock()
+        # freeze()之后为只读快照, 见freeze
+        self.frozen = False
         # hfq数据: 去除不复权数据(9列) 和复权因子(1列): 10, 从第11列开始是后复权数据
         self.equity_hfq_info_start_index = 10
+        # 持久化缓存, 见tgym/market_cache.py; 只缓存从data_dir读取的数据
+        key = None
+        if cache is not None and codes_history is None and \
+                indexs_history is None:
+            key = cache.get_key(self, infos)
+            if key is not None and cache.load(self, key):
+                self.init_size_info()
+                return
+        if codes_history is None:
+            self.load_codes_history()
+        else:
+            self.codes_history = {code: codes_history[code]
+                                  for code in codes}
+        if indexs_history is None:
+            self.load_indexs_history()
+        else:
+            self.indexs_history = indexs_history
+        self.init_infos(infos)
         self.init_market_info()
         self.init_size_info()
+        if cache is not None and codes_history is None and \
+                indexs_history is None:
+            # 第一次创建时数据文件可能是刚下载的
+            cache.save(self, key or cache.get_key(self, infos))
 
     def get_info_size(self, info_name):
         date = self.open_dates[0]
+        if info_name not in self.market_info[date]:
+            raise Exception(u"market_info中没有%s, 需要在Market的infos中指定"
+                            % info_name)
         return len(self.market_info[date][info_name])
 
     def init_size_info(self):
         """
-        初始化数据的size
+        初始化数据的size, 没有构建的信息块为0
+        """
+        self.equity_hfq_info_size = 0
+        if "equities_hfq_info" in self.infos:
+            self.equity_hfq_info_size = self.get_info_size(
+                "equities_hfq_info")
+        self.indexs_info_size = 0
+        if "indexs_info" in self.infos:
+            self.indexs_info_size = self.get_info_size("indexs_info")
+
+    def get_info_columns(self, info_name):
+        """
+        信息块可以使用的列, 个股信息块在这些列之后还有开盘标志
+        """
+        if info_name == "indexs_info":
+            return self.indexs_history["000001.SH"].columns.tolist()
+        columns = self.codes_history[self.codes[0]].columns.tolist()
+        if info_name == "equities_bfq_info":
+            return columns[1: self.equity_hfq_info_start_index]
+        if info_name == "equities_hfq_info":
+            return columns[self.equity_hfq_info_start_index:]
+        raise Exception(u"没有信息块%s, 可以使用%s" % (info_name, INFO_NAMES))
+
+    def init_infos(self, infos):
+        # self.infos: dict, 信息块名 -> 列名列表
+        if infos is None:
+            infos = INFO_NAMES
+        if not isinstance(infos, dict):
+            infos = {name: None for name in infos}
+        self.infos = {}
+        for name, columns in infos.items():
+            all_columns = self.get_info_columns(name)
+            if columns is None:
+                columns = all_columns
+            unknown = [c for c in columns if c not in all_columns]
+            if unknown:
+                raise Exception(u"信息块%s中没有列%s" % (name, unknown))
+            self.infos[name] = list(columns)
+
+    def get_tushare(self):
+        """
+        第一次下载数据时才导入tushare并设置token
         """
-        self.equity_hfq_info_size = self.get_info_size("equities_hfq_info")
-        self.indexs_info_size = self.get_info_size("indexs_info")
+        if self.offline:
+            raise Exception(u"Market处于离线模式, 不能从tushare下载数据")
+        if self.ts is None:
+            import tushare
+            tushare.set_token(self.ts_token)
+            self.ts = tushare
+        return self.ts
 
-    def get_code_history(self, code, adj=None):
-        return ts.pro_bar(
+    def get_code_history(self, code, adj=None, start=None, end=None):
+        return self.get_tushare().pro_bar(
             ts_code=code, adj=adj,
-            start_date=self.start, end_date=self.end)
+            start_date=start or self.start, end_date=end or self.end)
+
+    def download_code_history(self, code, start=None, end=None):
+        # 不复权
+        df_bfq = self.get_code_history(code, adj=None, start=start, end=end)
+        df_bfq = df_bfq.drop(columns=["ts_code"], axis=1)
+        # 后复权
+        df_hfq = self.get_code_history(code, adj="hfq", start=start, end=end)
+        df_hfq = df_hfq.drop(columns=["ts_code"], axis=1)
+        df = pd.merge(df_bfq, df_hfq,
+                      on='trade_date', how='left',
+                      suffixes=('', '_hfq'))
+        # 拆分因子
+        col_name = df.columns.tolist()
+        col_name.insert(0, 'adj_factor')
+        df = df.reindex(columns=col_name)
+        df["adj_factor"] = df["close_hfq"] / df["close"]
+        df = df.sort_values(by="trade_date", ascending=True)
+        df = df.set_index("trade_date")
+        df.index = df.index.astype(str, copy=False)
+        return df
+
+    def download_index_history(self, code, start=None, end=None):
+        pro = self.get_tushare().pro_api()
+        df = pro.index_daily(ts_code=code,
+                             start_date=start or self.start,
+                             end_date=end or self.end)
+        df = df.drop(columns=["ts_code"], axis=1)
+        df = df.sort_values(by="trade_date", ascending=True)
+        df = df.set_index("trade_date")
+        df.index = df.index.astype(str, copy=False)
+        return df
+
+    def get_data_path(self, dir, end=None):
+        return os.path.join(dir, self.start + "-" + (end or self.end) + ".csv")
 
     def load_codes_history(self):
         """
@@ -75,10 +288,9 @@ class Market:
         self.codes_history = {}
         for code in self.codes:
             dir = os.path.join(self.data_dir, code)
-            if not os.path.exists(dir):
+            if not self.offline and not os.path.exists(dir):
                 os.makedirs(dir)
-            data_path = os.path.join(dir,
-                                     self.start + "-" + self.end + ".csv")
+            data_path = self.get_data_path(dir)
             if os.path.exists(data_path):
                 df = pd.read_csv(data_path)
                 df = df.set_index("trade_date")
@@ -86,121 +298,69 @@ class Market:
                 self.codes_history[code] = df
 
             else:
-                # 不复权
-                df_bfq = self.get_code_history(code, adj=None)
-                df_bfq = df_bfq.drop(columns=["ts_code"], axis=1)
-                # 后复权
-                df_hfq = self.get_code_history(code, adj="hfq")
-                df_hfq = df_hfq.drop(columns=["ts_code"], axis=1)
-                df = pd.merge(df_bfq, df_hfq,
-                              on='trade_date', how='left',
-                              suffixes=('', '_hfq'))
-                # 拆分因子
-                col_name = df.columns.tolist()
-                col_name.insert(0, 'adj_factor')
-                df = df.reindex(columns=col_name)
-                df["adj_factor"] = df["close_hfq"] / df["close"]
-                df = df.sort_values(by="trade_date", ascending=True)
-                df = df.set_index("trade_date")
-                df.index = df.index.astype(str, copy=False)
+                if self.offline:
+                    raise Exception(u"Market处于离线模式, 数据文件%s不存在" %
+                                    data_path)
+                df = self.download_code_history(code)
                 df.to_csv(data_path)
                 self.codes_history[code] = df
 
-    def load_indexs_history(self):
-        self.indexs_history = {}
+    def get_index_codes(self):
         # 默认加载: 000001.SH(上证指数), 399001.SZ(深城证指)
         indexs = ["000001.SH", "399001.SZ"]
         for code in self.indexs:
             if code not in indexs:
                 indexs.append(code)
+        return indexs
 
-        for code in indexs:
+    def load_indexs_history(self):
+        self.indexs_history = {}
+        for code in self.get_index_codes():
             dir = os.path.join(self.data_dir, "indexs", code)
-            if not os.path.exists(dir):
+            if not self.offline and not os.path.exists(dir):
                 os.makedirs(dir)
-            data_path = os.path.join(dir,
-                                     self.start + "-" + self.end + ".csv")
+            data_path = self.get_data_path(dir)
             if os.path.exists(data_path):
                 df = pd.read_csv(data_path)
                 df = df.set_index("trade_date")
                 df.index = df.index.astype(str, copy=False)
                 self.indexs_history[code] = df
             else:
-                pro = ts.pro_api()
-                df = pro.index_daily(ts_code=code,
-                                     start_date=self.start,
-                                     end_date=self.end)
-                df = df.drop(columns=["ts_code"], axis=1)
-                df = df.sort_values(by="trade_date", ascending=True)
-                df = df.set_index("trade_date")
-                df.index = df.index.astype(str, copy=False)
+                if self.offline:
+                    raise Exception(u"Market处于离线模式, 数据文件%s不存在" %
+                                    data_path)
+                df = self.download_index_history(code)
                 df.to_csv(data_path)
                 self.indexs_history[code] = df
 
-    def set_pre_info(self):
-        date = self.open_dates[0]
-        self.equities_pre_hfq_info = {}
-        self.equities_pre_bfq_info = {}
-        for code in self.codes:
-            # 如果第一天就停牌，这里会出错，建议另外选择一天开始回测
-            try:
-                data = self.codes_history[code].loc[date].tolist()
-                bfq_data = data[1: self.equity_hfq_info_start_index]
-                # 开盘时， open=1
-                bfq_data.append(1)
-                self.equities_pre_bfq_info[code] = bfq_data
-                # 后复权
-                hfq_data = data[self.equity_hfq_info_start_index:]
-                # 开盘时， open=1
-                hfq_data.append(1)
-                self.equities_pre_hfq_info[code] = hfq_data
-            except Exception as e:
-                print("%s, %s停牌，建议另外选择一天开始回测" % (code, date))
-                print(e)
-                exit()
+    def get_equities_block(self, columns, start=0):
+        """
+        open_dates[start:]的个股信息块: 每支股票依次为columns列与开盘标志
+        (开盘时open=1, 停牌时open=0并使用前一开盘日的数据)
+        返回: [date, len(codes) * (len(columns) + 1)]的数组
+        """
+        dates = self.open_dates[start:]
+        blocks = []
+        for i, code in enumerate(self.codes):
+            df = self.codes_history[code]
+            # 停牌日使用前一开盘日所在的行; 只读取dates[0]之前最近一行开始的部分
+            first = max(df.index.searchsorted(dates[0]) - 1, 0)
+            data = df.iloc[first:].reindex(dates, method="ffill")
+            blocks.append(data[columns].to_numpy(dtype=np.float64))
+            blocks.append(self.traded[start:, i, None])
+        return np.hstack(blocks)
 
-    def get_equities_bfq_info(self, date):
-        info = []
-        for code in self.codes:
-            data = None
-            if date in self.codes_history[code].index:
-                data = self.codes_history[code].loc[date].tolist()
-                data = data[1: self.equity_hfq_info_start_index]
-                # 开盘时， open=1
-                data.append(1)
-            else:
-                # 如果停牌则使用前一开盘日信息
-                data = self.equities_pre_bfq_info[code]
-                data[-1] = 0
-            # 更新前一开盘日信息
-            self.equities_pre_bfq_info[code] = data
-            info.extend(data)
-        return info
-
-    def get_equities_hfq_info(self, date):
-        info = []
-        for code in self.codes:
-            data = None
-            if date in self.codes_history[code].index:
-                data = self.codes_history[code].loc[date].tolist()
-                data = data[self.equity_hfq_info_start_index:]
-                # 开盘时， open=1
-                data.append(1)
-            else:
-                # 如果停牌则使用前一开盘日信息
-                data = self.equities_pre_hfq_info[code]
-                data[-1] = 0
-            # 更新前一开盘日信息
-            self.equities_pre_hfq_info[code] = data
-            info.extend(data)
-        return info
-
-    def get_indexs_info(self, date):
-        info = []
+    def get_indexs_block(self, columns, start=0):
+        """
+        open_dates[start:]的指数信息块, 返回: [date, len(indexs) * len(columns)]
+        """
+        dates = self.open_dates[start:]
+        blocks = [np.zeros((len(dates), 0))]
         for code in self.indexs:
-            data = self.indexs_history[code].loc[date].tolist()
-            info.extend(data)
-        return info
+            # 指数缺少某个开市日时.loc抛出KeyError
+            blocks.append(self.indexs_history[code][columns].loc[
+                dates].to_numpy(dtype=np.float64))
+        return np.hstack(blocks)
 
     def init_market_info(self):
         """
@@ -209,96 +369,495 @@ class Market:
             indexs_info: 合并之后指数信息
         Note(wen): 添加其他市场相关信息，都放在这里
         """
+        self.init_calendar()
+        self.init_price_info()
+        # 如果第一天就停牌, 没有"前一开盘日"的信息
+        date = self.open_dates[0]
+        for i, code in enumerate(self.codes):
+            if not self.traded[0, i]:
+                print("%s, %s停牌，建议另外选择一天开始回测" % (code, date))
+                exit()
+        self.market_info = {}
+        self.add_market_info()
+
+    def init_calendar(self):
         self.open_dates = self.indexs_history["000001.SH"].index.tolist()
         self.open_dates.sort()
-        self.set_pre_info()
-        self.market_info = {}
-        for date in self.open_dates:
+        # 日期 <-> 在open_dates中的位置(整数id), 与open_dates共用同一个list
+        self.calendar = TradeCalendar(self.open_dates)
+        self.code_ids = {}
+        for i, code in enumerate(self.codes):
+            self.code_ids[code] = i
+
+    def add_market_info(self, start=0):
+        """
+        计算open_dates[start:]的market_info, 只构建self.infos中的信息块与列
+        """
+        dates = self.open_dates[start:]
+        for date in dates:
             self.market_info[date] = {}
-            self.market_info[date]["equities_bfq_info"] = \
-                self.get_equities_bfq_info(date)
-            self.market_info[date]["equities_hfq_info"] = \
-                self.get_equities_hfq_info(date)
-            self.market_info[date]["indexs_info"] = self.get_indexs_info(date)
+        for name, columns in self.infos.items():
+            if name == "indexs_info":
+                block = self.get_indexs_block(columns, start)
+            else:
+                block = self.get_equities_block(columns, start)
+            for date, values in zip(dates, block.tolist()):
+                self.market_info[date][name] = values
+
+    def init_price_info(self, start=0):
+        """
+        将PRICE_COLUMNS整理为以(date_id, code_id)访问的数组:
+            prices[name]: [date, code], 停牌日使用前一开市日的数据
+            traded: [date, code], 当天是否有交易(没有停牌)
+        start > 0时只计算open_dates[start:], 追加到已有的数组之后(append_days)
+        """
+        dates = self.open_dates[start:]
+        shape = (len(dates), len(self.codes))
+        traded = np.zeros(shape, dtype=bool)
+        prices = {}
+        for name in PRICE_COLUMNS:
+            prices[name] = np.full(shape, np.nan)
+        for i, code in enumerate(self.codes):
+            df = self.codes_history[code]
+            index = df.index[df.index.searchsorted(dates[0]):]
+            traded[:, i] = pd.Index(dates).isin(index)
+            values = reindex_ffill(df, dates)[PRICE_COLUMNS].to_numpy(
+                dtype=np.float64)
+            for j, name in enumerate(PRICE_COLUMNS):
+                prices[name][:, i] = values[:, j]
+        if start == 0:
+            self.prices = {}
+        self.set_rows("traded", traded, start)
+        for name in PRICE_COLUMNS:
+            self.set_rows(name, prices[name], start, self.prices)
+        self.init_trade_masks(start)
+
+    def extend_rows(self, key, array, rows):
+        """
+        返回array之后追加rows的数组: array是self.row_buffers[key]的前几行且
+        容量足够时原地写入缓冲区, 否则分配2倍大小的缓冲区, 多次追加的总复制量与
+        追加的行数成正比; 之前返回的数组(如window()的切片)不受影响
+        """
+        n = len(array)
+        size = n + len(rows)
+        buffer = self.row_buffers.get(key)
+        if buffer is None or array.base is not buffer or len(buffer) < size \
+                or buffer.shape[1:] != rows.shape[1:]:
+            buffer = np.empty((2 * size,) + rows.shape[1:], dtype=array.dtype)
+            buffer[:n] = array
+            self.row_buffers[key] = buffer
+        buffer[n: size] = rows
+        return buffer[:size]
+
+    def set_rows(self, name, rows, start, arrays=None):
+        """
+        设置[date, ...]的数组self.<name>(arrays不为None时为arrays[name]):
+        start为0时替换, 否则rows为open_dates[start:]的行, 追加到已有的数组之后
+        """
+        key = name if arrays is None else "prices/" + name
+        if start > 0:
+            array = getattr(self, name) if arrays is None else arrays[name]
+            rows = self.extend_rows(key, array[:start], rows)
+        else:
+            self.row_buffers.pop(key, None)
+        if arrays is None:
+            setattr(self, name, rows)
+        else:
+            arrays[name] = rows
+
+    def init_trade_masks(self, start=0):
+        """
+        预先计算[date, code]的交易限制:
+            suspended: 停牌
+            limit_up_locked: 涨停封板(最高价=最低价=涨停价), 不能买入
+            limit_down_locked: 跌停封板(最高价=最低价=跌停价), 不能卖出
+            buyable/sellable: 是否可以买入/卖出
+        涨跌停幅度按板块与日期: 主板10%, ST 5%, 创业板/科创板20%, 见get_price_limit
+        start > 0时只计算open_dates[start:], 追加到已有的数组之后(append_days)
+        """
+        traded = self.traded[start:]
+        masks = {"suspended": ~traded,
+                 "st": np.zeros(traded.shape, dtype=bool)}
+        for code, periods in self.st_periods.items():
+            if code not in self.code_ids:
+                continue
+            for st_start, st_end in periods:
+                # st_start当天或之后的第一个开市日 ~ st_end当天或之前的最后一个
+                # 开市日, 下标相对于start
+                start_id = max(self.calendar.pre_id(st_start) + 1 - start, 0)
+                end_id = self.calendar.floor_id(st_end) - start
+                if end_id >= start_id:
+                    masks["st"][start_id: end_id + 1,
+                                self.code_ids[code]] = True
+        dates = self.open_dates[start:]
+        limits = np.column_stack([get_price_limits(code, dates)
+                                  for code in self.codes])
+        st_limits = np.column_stack([get_price_limits(code, dates, st=True)
+                                     for code in self.codes])
+        limits = np.where(masks["st"], st_limits, limits)
+        prices = {name: self.prices[name][start:]
+                  for name in ["high", "low", "close", "pre_close"]}
+        with np.errstate(invalid="ignore"):
+            locked = traded & (prices["high"] == prices["low"])
+            # 涨跌停价四舍五入到分
+            up_price = np.round(prices["pre_close"] * (1 + limits), 2)
+            down_price = np.round(prices["pre_close"] * (1 - limits), 2)
+            masks["limit_up_locked"] = locked & (
+                prices["close"] >= up_price - 0.005)
+            masks["limit_down_locked"] = locked & (
+                prices["close"] <= down_price + 0.005)
+        masks["buyable"] = traded & ~masks["limit_up_locked"]
+        masks["sellable"] = traded & ~masks["limit_down_locked"]
+        for name, rows in masks.items():
+            self.set_rows(name, rows, start)
+
+    def set_st_periods(self, st_periods):
+        """
+        st_periods: dict, code -> [(start, end), ...], 闭区间, 日期格式"YYYYMMDD"
+        """
+        if self.frozen:
+            raise Exception(u"set_st_periods: Market已冻结")
+        self.st_periods = st_periods
+        self.init_trade_masks()
+
+    def freeze(self, used_infos=None):
+        """
+        将Market冻结为只读快照, 之后可以在多个线程中共用(如每个线程创建自己的env):
+            价格与交易限制数组设为只读, market_info, open_dates等改为不可变类型,
+            codes_history/indexs_history改为FrozenHistory(访问时返回复制),
+            不能再setattr, append_days, set_st_periods或计算新的技术指标
+        used_infos: 冻结前先计算这些信息块需要的技术指标与market_info数组
+        只有market_info数组的缓存在冻结之后仍可以增加(由self.lock保护)
+        返回self
+        """
+        if self.parent is not None:
+            raise Exception(u"freeze: 需要冻结完整的Market, 而不是视图")
+        with self.lock:
+            if self.frozen:
+                return self
+            if used_infos is not None:
+                self.add_features(used_infos)
+                self.get_market_info_array(used_infos)
+            for array in self.prices.values():
+                array.flags.writeable = False
+            for name in TRADE_MASKS:
+                getattr(self, name).flags.writeable = False
+            self.market_info = MappingProxyType({
+                date: MappingProxyType({name: tuple(values)
+                                        for name, values in info.items()})
+                for date, info in self.market_info.items()})
+            self.prices = MappingProxyType(self.prices)
+            self.codes_history = FrozenHistory(self.codes_history)
+            self.indexs_history = FrozenHistory(self.indexs_history)
+            self.open_dates = tuple(self.open_dates)
+            self.calendar = TradeCalendar(self.open_dates)
+            self.code_ids = MappingProxyType(self.code_ids)
+            self.codes = tuple(self.codes)
+            self.indexs = tuple(self.indexs)
+            self.features = tuple(self.features)
+            self.st_periods = MappingProxyType(self.st_periods)
+            self.infos = MappingProxyType({
+                name: tuple(columns) for name, columns in self.infos.items()})
+            self.frozen = True
+        return self
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get("frozen"):
+            raise Exception(u"Market已冻结, 不能修改属性%s" % name)
+        object.__setattr__(self, name, value)
+
+    def window(self, start, end):
+        """
+        返回[start, end]之间交易日的Market视图, 可以直接用于创建env
+        价格, 交易限制与market_info数组都是完整数组的切片, 不复制数据;
+        技术指标在完整的历史上计算
+        """
+        first = self.calendar.pre_id(start) + 1
+        last = self.calendar.floor_id(end) + 1
+        if first >= last:
+            raise Exception(u"window: %s-%s之间没有交易日" % (start, end))
+        view = copy.copy(self)
+        open_dates = self.open_dates[first: last]
+        prices = {name: array[first: last]
+                  for name, array in self.prices.items()}
+        attrs = {
+            "parent": self if self.parent is None else self.parent,
+            "window_start": self.window_start + first,
+            "start": start,
+            "end": end,
+            "open_dates": open_dates,
+            "calendar": TradeCalendar(open_dates),
+            "prices": MappingProxyType(prices) if self.frozen else prices,
+            "market_info_arrays": {}}
+        for name in TRADE_MASKS:
+            attrs[name] = getattr(self, name)[first: last]
+        # 冻结的Market不能setattr, 视图也保持冻结
+        view.__dict__.update(attrs)
+        return view
+
+    def get_ids(self, code, datestr):
+        """
+        返回: code_id, date_id; 不是开市日时date_id为它之前最近一个开市日的id
+        code不在codes中, 或datestr在第一个开市日之前时抛出异常(不能用-1或None
+        作为数组下标)
+        """
+        return self.get_code_id(code), self.get_date_id(
+            self.calendar.floor_id(datestr), datestr)
+
+    def get_code_id(self, code):
+        if code not in self.code_ids:
+            raise Exception(u"%s不在Market的codes中" % code)
+        return self.code_ids[code]
+
+    def get_date_id(self, date_id, datestr):
+        # date_id: calendar.floor_id/pre_id的结果, 没有对应的开市日时为-1
+        if date_id < 0:
+            raise Exception(u"%s之前没有开市日, 第一个开市日为%s" % (
+                datestr, self.open_dates[0]))
+        return date_id
+
+    def add_features(self, names):
+        """
+        计算技术指标, 以指标名为key加入market_info, 每个指标只计算一次
+        names: 如 ["ma_5", "rsi_14"], 不是技术指标的名字(如indexs_info)会被忽略
+        """
+        if self.parent is not None:
+            # 在完整的历史上计算, 窗口开始时的指标也有足够的历史数据
+            self.parent.add_features(names)
+            return
+        with self.lock:
+            names = [name for name in names
+                     if is_feature(name) and name not in self.features]
+            if not names:
+                return
+            if self.frozen:
+                raise Exception(u"add_features: Market已冻结, 需要在freeze()"
+                                u"之前计算技术指标%s" % names)
+            self.init_features_info(names)
+            self.features.extend(names)
+
+    def init_features_info(self, names, start=0):
+        """
+        计算open_dates[start:]的技术指标, 加入market_info; start > 0时从
+        feature_states中保存的状态继续计算(append_days)
+        """
+        dates = self.open_dates[start:]
+        for name in names:
+            if start == 0:
+                self.feature_states[name] = {}
+            df = get_feature(self, name, start, self.feature_states[name])
+            for date, values in zip(dates, df.to_numpy().tolist()):
+                self.market_info[date][name] = values
+
+    def get_market_info_array(self, used_infos, dtype=np.float32):
+        """
+        将used_infos对应的信息块按日期拼接成[date, size]的C连续只读数组, 行与
+        open_dates一一对应. 按(used_infos, dtype)缓存, 多个env共用;
+        append_days之后再次调用时只计算新增的日期
+        """
+        if self.parent is not None:
+            array = self.parent.get_market_info_array(used_infos, dtype)
+            return array[self.window_start:
+                         self.window_start + len(self.open_dates)]
+        with self.lock:
+            return self._get_market_info_array(used_infos, dtype)
+
+    def _get_market_info_array(self, used_infos, dtype):
+        key = (tuple(used_infos), np.dtype(dtype).str)
+        array = self.market_info_arrays.get(key)
+        start = 0 if array is None else len(array)
+        if start == len(self.open_dates):
+            return array
+        rows = []
+        for date in self.open_dates[start:]:
+            info = []
+            for info_name in used_infos:
+                info.extend(self.market_info[date][info_name])
+            rows.append(info)
+        new_array = np.array(rows, dtype=dtype)
+        if array is not None:
+            new_array = self.extend_rows(key, array, new_array)
+        new_array.flags.writeable = False
+        self.market_info_arrays[key] = new_array
+        return new_array
+
+    def append_days(self, end, codes_history=None, indexs_history=None):
+        """
+        增量追加(self.end, end]之间的交易日, 不重新执行init_market_info
+        codes_history/indexs_history: dict, code -> DataFrame, 格式与
+            self.codes_history/self.indexs_history一致, 为None时从tushare下载
+        返回新增的开市日期列表
+        NOTE(wen): open_dates与market_info原地扩展, 只处理新增的交易日,
+            已经创建的env可以继续step到新的日期(见BaseEnv.resume)
+        """
+        if self.parent is not None:
+            raise Exception(u"append_days: 不能在window()返回的视图上追加数据")
+        if self.frozen:
+            raise Exception(u"append_days: Market已冻结, 不能追加数据")
+        if end <= self.end:
+            return []
+        if codes_history is None:
+            codes_history = {}
+            for code in self.codes:
+                codes_history[code] = self.download_code_history(
+                    code, start=self.end, end=end)
+        if indexs_history is None:
+            indexs_history = {}
+            for code in self.indexs_history:
+                indexs_history[code] = self.download_index_history(
+                    code, start=self.end, end=end)
+        for code in self.indexs_history:
+            if code not in indexs_history:
+                raise Exception(u"append_days: 缺少指数%s的数据" % code)
+
+        pre_end = self.end
+        for code in self.codes:
+            if code not in codes_history:
+                continue
+            df = self.codes_history[code]
+            new_df = codes_history[code]
+            new_df = new_df[(new_df.index > pre_end) & (new_df.index <= end)]
+            self.codes_history[code] = pd.concat([df, new_df[df.columns]])
+        new_dates = []
+        for code in self.indexs_history:
+            df = self.indexs_history[code]
+            new_df = indexs_history[code]
+            new_df = new_df[(new_df.index > pre_end) & (new_df.index <= end)]
+            self.indexs_history[code] = pd.concat([df, new_df[df.columns]])
+            if code == "000001.SH":
+                new_dates = new_df.index.tolist()
+        new_dates.sort()
+        self.end = end
+        self.save_history()
+
+        start = len(self.open_dates)
+        self.calendar.append(new_dates)
+        if not new_dates:
+            return new_dates
+        # 价格, 交易限制, market_info与技术指标都只计算新增的日期
+        self.init_price_info(start)
+        self.add_market_info(start)
+        self.init_features_info(self.features, start)
+        return new_dates
+
+    def save_history(self):
+        """
+        追加数据后, 以新的end保存数据文件, 下次以相同参数创建Market时不需要重新下载
+        data_dir为None(数据只在内存中)时不保存
+        """
+        if self.data_dir is None:
+            return
+        for code in self.codes:
+            dir = os.path.join(self.data_dir, code)
+            self.codes_history[code].to_csv(self.get_data_path(dir))
+        for code in self.indexs_history:
+            dir = os.path.join(self.data_dir, "indexs", code)
+            self.indexs_history[code].to_csv(self.get_data_path(dir))
 
     def is_suspended(self, code='', datestr=''):
         # 是否停牌，是：返回 True, 否：返回 False
-        if code not in self.codes_history:
+        if code not in self.code_ids or not self.calendar.is_open(datestr):
             return True
-        if datestr not in self.codes_history[code].index:
-            return True
-        return False
+        return self.is_suspended_by_id(self.code_ids[code],
+                                       self.calendar.get_id(datestr))
+
+    def is_suspended_by_id(self, code_id, date_id):
+        return not self.traded[date_id, code_id]
 
     def buy_check(self, code='', datestr='', bid_price=None):
         # 返回：OK, 成交价
-        ok = False
-        # 停牌
         if self.is_suspended(code, datestr):
-            return ok, 0
-        # 获取当天标的信息
-        [open, high, low, pct_change] = self.codes_history[code].loc[
-            datestr, ["open", "high", "low", "pct_chg"]]
-        # 涨停封板, 无法买入
-        if low == high and pct_change > self.top_pct_change:
-            logger.debug(u"sell_check %s %s 涨停法买进" % (code, datestr))
-            return ok, 0
+            return False, 0
+        return self.buy_check_by_id(self.code_ids[code],
+                                    self.calendar.get_id(datestr), bid_price)
+
+    def buy_check_by_id(self, code_id, date_id, bid_price):
+        # 返回：OK, 成交价
+        # 停牌或涨停封板, 无法买入
+        if not self.buyable[date_id, code_id]:
+            return False, 0
+        high = self.prices["high"][date_id, code_id]
+        low = self.prices["low"][date_id, code_id]
         # 买入竞价低于最低价，不能成交
         if bid_price < low:
-            return ok, 0
+            return False, 0
         # 买入竞价高于最低价， 可以成交
-        if bid_price >= low:
-            return True, min(bid_price, high)
+        return True, min(bid_price, high)
 
     def sell_check(self, code='', datestr='', bid_price=None):
         # 返回：OK, 成交价
-        ok = False
-        # 停牌
         if self.is_suspended(code, datestr):
-            return ok, 0
-        # 获取当天标的信息
-        [open, high, low, pct_change] = self.codes_history[code].loc[
-            datestr, ["open", "high", "low", "pct_chg"]]
-        # 跌停封板， 不能卖出
-        if low == high and pct_change < -self.top_pct_change:
-            logger.debug(u"sell_check %s %s 跌停无法卖出" % (code, datestr))
-            return ok, 0
+            return False, 0
+        return self.sell_check_by_id(self.code_ids[code],
+                                     self.calendar.get_id(datestr), bid_price)
+
+    def sell_check_by_id(self, code_id, date_id, bid_price):
+        # 返回：OK, 成交价
+        # 停牌或跌停封板, 不能卖出
+        if not self.sellable[date_id, code_id]:
+            return False, 0
+        high = self.prices["high"][date_id, code_id]
+        low = self.prices["low"][date_id, code_id]
         # 卖出竞价高于最高价，不可以成交
         if bid_price > high:
-            return ok, 0
+            return False, 0
         # 卖出竞价在最低最高价之间， 可以成交，按出价成交
         # NOTE: 这里卖出竞价低于最低价时，可以成交，按最低价成交
-        if bid_price <= high:
-            ok = True
-            return ok, max(bid_price, low)
+        return True, max(bid_price, low)
 
     def get_pre_close_price(self, code, datestr):
-        if datestr in self.codes_history[code].index:
-            return self.codes_history[code].loc[datestr]["pre_close"]
+        return self.get_pre_close_price_by_id(*self.get_ids(code, datestr))
+
+    def get_pre_close_price_by_id(self, code_id, date_id):
         # 如果当天停牌, 返回前一开市日的pre_close
-        df = self.codes_history[code]
-        df_ = df[df.index < datestr]
-        return df_.iloc[-1]["pre_close"]
+        return self.prices["pre_close"][date_id, code_id]
 
     def get_close_price(self, code, datestr):
-        if datestr in self.codes_history[code].index:
-            return self.codes_history[code].loc[datestr]["close"]
+        return self.get_close_price_by_id(*self.get_ids(code, datestr))
+
+    def get_close_price_by_id(self, code_id, date_id):
         # 如果当天停牌, 返回前一开市日收盘价
-        df = self.codes_history[code]
-        df_ = df[df.index < datestr]
-        return df_.iloc[-1]["close"]
+        return self.prices["close"][date_id, code_id]
 
     def get_pre_adj_factor(self, code, datestr):
-        df = self.codes_history[code]
-        df_ = df[df.index < datestr]
-        return df_.iloc[-1]["adj_factor"]
+        # datestr之前最近一个开市日的复权因子
+        date_id = self.get_date_id(self.calendar.pre_id(datestr), datestr)
+        return self.prices["adj_factor"][date_id, self.get_code_id(code)]
 
     def get_adj_factor(self, code, datestr):
-        if self.is_suspended(code=code, datestr=datestr):
-            return self.get_pre_adj_factor(code, datestr)
-        else:
-            return self.codes_history[code].loc[datestr]["adj_factor"]
+        # 如果当天停牌, 返回前一开市日的复权因子
+        code_id, date_id = self.get_ids(code, datestr)
+        return self.prices["adj_factor"][date_id, code_id]
 
     def get_divide_rate(self, code, datestr):
-        pre_adj_factor = self.get_pre_adj_factor(code, datestr)
-        current_adj_factor = self.get_adj_factor(code, datestr)
-        return current_adj_factor / pre_adj_factor
+        code_id = self.get_code_id(code)
+        date_id = self.calendar.get_id(datestr)
+        if date_id is None:
+            # 不是开市日, 复权因子不变
+            return 1.0
+        return self.get_divide_rate_by_id(code_id, date_id)
+
+    def get_pre_adj_factors_by_id(self, date_id):
+        """
+        date_id前一开市日所有股票的复权因子, [code]; 没有前一开市日时返回None
+        NOTE(wen): 视图的第一天从完整Market中读取前一天, 否则会漏掉这一天的拆分
+        """
+        if date_id > 0:
+            return self.prices["adj_factor"][date_id - 1]
+        if self.parent is not None and self.window_start > 0:
+            return self.parent.prices["adj_factor"][self.window_start - 1]
+        return None
+
+    def get_divide_rate_by_id(self, code_id, date_id):
+        pre_adj_factors = self.get_pre_adj_factors_by_id(date_id)
+        if pre_adj_factors is None:
+            return 1.0
+        return self.prices["adj_factor"][date_id, code_id] / \
+            pre_adj_factors[code_id]
+
+    def get_divide_rates_by_id(self, date_id):
+        # 所有股票的拆分比例, [code]
+        pre_adj_factors = self.get_pre_adj_factors_by_id(date_id)
+        if pre_adj_factors is None:
+            return np.ones(len(self.codes))
+        return self.prices["adj_factor"][date_id] / pre_adj_factors
@@ -0,0 +1,191 @@
+# -*- coding:utf-8 -*-
+"""
+Market构建结果的持久化缓存: 将读取csv并整理之后的codes_history, indexs_history,
+价格数组与market_info以npz(二进制, 不用pickle)保存在cache_dir中, 相同配置再次
+创建Market时直接读取, 跳过csv解析与market_info的计算:
+
+    cache = MarketCache("/tmp/tgym/cache")
+    market = Market(start, end, codes, indexs, data_dir, cache=cache)
+
+缓存的key为配置(codes, indexs, start, end, infos, data_dir)与数据文件指纹
+(路径, 大小, 修改时间)的hash, 文件名为"<配置hash>-<key>.npz":
+    - 数据文件被修改之后key改变, 同一配置的旧文件在下次读取时删除
+    - 所有缓存文件的总大小超过max_bytes时, 删除最久未使用的文件
+NOTE(wen): 所有股票的数据合并为一个数组保存, 列不同时读取之后缺少的列为nan
+NOTE(wen): 只缓存从data_dir读取的数据, 传入codes_history/indexs_history时
+    不使用缓存; 技术指标(features)与st_periods不缓存, 仍然按需计算
+"""
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from tgym.market import PRICE_COLUMNS
+
+# 缓存格式的版本, 格式改变时加1, 旧的缓存自动失效
+CACHE_VERSION = 1
+# 默认的缓存大小上限: 1GB
+MAX_BYTES = 1 << 30
+HISTORY_PARTS = ["records", "index", "index_name", "lengths"]
+
+
+def get_hash(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode(
+        "utf-8")).hexdigest()[:16]
+
+
+def dfs_to_arrays(dfs):
+    """
+    将多个DataFrame合并为一个记录数组(保留每列的dtype)与每个DataFrame的行数,
+    日期index保存为定长字符串; 数组少时npz读取更快
+    """
+    df = pd.concat(dfs)
+    return {"records": df.to_records(index=False),
+            "index": np.asarray(df.index.astype(str), dtype=str),
+            "index_name": np.asarray(df.index.name or "", dtype=str),
+            "lengths": np.array([len(d) for d in dfs], dtype=np.int64)}
+
+
+def arrays_to_dfs(records, index, index_name, lengths):
+    df = pd.DataFrame(records)
+    df.index = pd.Index(index.astype(object), name=str(index_name) or None)
+    ends = np.cumsum(lengths).tolist()
+    return [df.iloc[end - n: end] for n, end in zip(lengths.tolist(), ends)]
+
+
+class MarketCache:
+    """
+    cache_dir: 缓存目录
+    max_bytes: 缓存文件的总大小上限
+    """
+
+    def __init__(self, cache_dir="/tmp/tgym/cache", max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def get_data_paths(self, market):
+        paths = []
+        for code in market.codes:
+            paths.append(market.get_data_path(os.path.join(
+                market.data_dir, code)))
+        for code in market.get_index_codes():
+            paths.append(market.get_data_path(os.path.join(
+                market.data_dir, "indexs", code)))
+        return paths
+
+    def get_history_codes(self, market):
+        return [("codes_history", market.codes),
+                ("indexs_history", market.get_index_codes())]
+
+    def get_config_hash(self, market, infos):
+        return get_hash([CACHE_VERSION, os.path.abspath(market.data_dir),
+                         list(market.codes), list(market.indexs),
+                         market.start, market.end, infos])
+
+    def get_key(self, market, infos=None):
+        """
+        返回缓存文件名(不含目录); 有数据文件不存在(需要下载)时返回None
+        """
+        fingerprints = []
+        for path in self.get_data_paths(market):
+            if not os.path.exists(path):
+                return None
+            stat = os.stat(path)
+            fingerprints.append([path, stat.st_size, stat.st_mtime_ns])
+        config = self.get_config_hash(market, infos)
+        return "%s-%s.npz" % (config, get_hash([config, fingerprints]))
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def remove_stale(self, key):
+        # 删除同一配置下与key不同的缓存文件(数据文件已被修改)
+        config = key.split("-")[0]
+        for path in glob.glob(self.get_path(config + "-*.npz")):
+            if os.path.basename(path) != key:
+                os.remove(path)
+
+    def load(self, market, key):
+        """
+        将缓存的数据设置到market中, 返回是否命中
+        """
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            self.remove_stale(key)
+            return False
+        with np.load(path, allow_pickle=False) as data:
+            infos = json.loads(str(data["infos"]))
+            histories = {}
+            for name, codes in self.get_history_codes(market):
+                dfs = arrays_to_dfs(*[data["%s/%s" % (name, part)]
+                                      for part in HISTORY_PARTS])
+                histories[name] = dict(zip(codes, dfs))
+            traded = data["traded"]
+            prices = {name: data["prices/" + name] for name in PRICE_COLUMNS}
+            blocks = {name: data["market_info/" + name].tolist()
+                      for name in infos}
+        market.codes_history = histories["codes_history"]
+        market.indexs_history = histories["indexs_history"]
+        market.infos = infos
+        market.init_calendar()
+        market.traded = traded
+        market.prices = prices
+        market.init_trade_masks()
+        market.market_info = {date: {} for date in market.open_dates}
+        for name, rows in blocks.items():
+            for date, values in zip(market.open_dates, rows):
+                market.market_info[date][name] = values
+        # 更新修改时间, 用于按最久未使用淘汰
+        os.utime(path)
+        return True
+
+    def save(self, market, key):
+        """
+        保存market, 之后按max_bytes淘汰旧的缓存文件
+        """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        arrays = {"infos": np.asarray(json.dumps(market.infos), dtype=str),
+                  "traded": market.traded}
+        for name in PRICE_COLUMNS:
+            arrays["prices/" + name] = market.prices[name]
+        for name, codes in self.get_history_codes(market):
+            history = getattr(market, name)
+            for part, array in dfs_to_arrays(
+                    [history[code] for code in codes]).items():
+                arrays["%s/%s" % (name, part)] = array
+        for name in market.infos:
+            arrays["market_info/" + name] = np.array(
+                [market.market_info[date][name]
+                 for date in market.open_dates], dtype=np.float64)
+        path = self.get_path(key)
+        # 先写入临时文件再改名, 其他进程不会读到写了一半的文件
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        self.remove_stale(key)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        总大小超过max_bytes时, 按修改时间从旧到新删除缓存文件, 不删除keep
+        """
+        paths = glob.glob(self.get_path("*.npz"))
+        entries = sorted((os.stat(p).st_mtime_ns, os.path.getsize(p), p)
+                         for p in paths)
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if os.path.basename(path) == keep:
+                continue
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for path in glob.glob(self.get_path("*.npz")):
+            os.remove(path)
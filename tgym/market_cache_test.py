@@ -0,0 +1,113 @@
+# -*- coding:utf-8 -*-
+
+import glob
+import os
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from tgym.market_cache import MarketCache
+from tgym.market_test import MarketTestCase
+
+
+class TestMarketCache(MarketTestCase):
+    indexs = ["000001.SH", "399001.SZ"]
+
+    def setUp(self):
+        super().setUp()
+        self.cache = MarketCache(os.path.join(self.data_dir, "cache"))
+
+    def make_market(self, **kwargs):
+        return super().make_market(offline=True, **kwargs)
+
+    def get_cache_files(self):
+        return glob.glob(os.path.join(self.cache.cache_dir, "*.npz"))
+
+    def assertMarketEqual(self, expected, m):
+        self.assertEqual(expected.open_dates, m.open_dates)
+        self.assertEqual(expected.code_ids, m.code_ids)
+        self.assertEqual(expected.infos, m.infos)
+        self.assertEqual(expected.market_info, m.market_info)
+        for name in ["codes_history", "indexs_history"]:
+            self.assertEqual(list(getattr(expected, name)),
+                             list(getattr(m, name)))
+            for code, df in getattr(expected, name).items():
+                pd.testing.assert_frame_equal(df, getattr(m, name)[code])
+        for name in expected.prices:
+            np.testing.assert_array_equal(expected.prices[name],
+                                          m.prices[name])
+        for name in ["traded", "buyable", "sellable"]:
+            np.testing.assert_array_equal(getattr(expected, name),
+                                          getattr(m, name))
+        for name in expected.infos:
+            self.assertEqual(expected.get_info_size(name),
+                             m.get_info_size(name))
+
+    def test_hit(self):
+        expected = self.make_market()
+        self.make_market(cache=self.cache)
+        key = self.cache.get_key(expected)
+        self.assertEqual([self.cache.get_path(key)], self.get_cache_files())
+        m = self.make_market(cache=self.cache)
+        self.assertMarketEqual(expected, m)
+        # 从缓存读取之后, 技术指标与ST期间仍然可用
+        used_infos = ["equities_hfq_info", "indexs_info", "return_rank_5"]
+        expected.add_features(used_infos)
+        m.add_features(used_infos)
+        np.testing.assert_array_equal(
+            expected.get_market_info_array(used_infos),
+            m.get_market_info_array(used_infos))
+        m.set_st_periods({"000002.SZ": [("20190111", "20190331")]})
+        self.assertTrue(m.st[-1, 1])
+
+    def test_infos(self):
+        infos = {"equities_hfq_info": ["close_hfq"]}
+        self.make_market(cache=self.cache, infos=infos)
+        m = self.make_market(cache=self.cache, infos=infos)
+        self.assertMarketEqual(self.make_market(infos=infos), m)
+        self.assertEqual(1, len(self.get_cache_files()))
+        # 不同的infos为不同的缓存
+        self.make_market(cache=self.cache)
+        self.assertEqual(2, len(self.get_cache_files()))
+
+    def test_stale(self):
+        self.make_market(cache=self.cache)
+        old_files = self.get_cache_files()
+        path = os.path.join(self.data_dir, "000001.SZ",
+                            "20190101-20190331.csv")
+        df = pd.read_csv(path, dtype={"trade_date": str})
+        df["close_hfq"] *= 2
+        df.to_csv(path, index=False)
+        m = self.make_market(cache=self.cache)
+        expected = self.make_market()
+        self.assertMarketEqual(expected, m)
+        # 同一配置下旧的缓存文件已删除
+        files = self.get_cache_files()
+        self.assertEqual(1, len(files))
+        self.assertNotEqual(old_files, files)
+        self.assertMarketEqual(expected, self.make_market(cache=self.cache))
+
+    def test_evict(self):
+        self.make_market(cache=self.cache)
+        size = os.path.getsize(self.get_cache_files()[0])
+        self.cache.max_bytes = int(size * 1.5)
+        time.sleep(0.01)
+        infos = {"equities_hfq_info": ["close_hfq"]}
+        self.make_market(cache=self.cache, infos=infos)
+        files = self.get_cache_files()
+        self.assertEqual(
+            [self.cache.get_path(self.cache.get_key(
+                self.make_market(), infos))], files)
+
+    def test_no_cache(self):
+        # 数据在内存中时不使用缓存
+        self.make_market(codes_history=self.m.codes_history,
+                         indexs_history=self.m.indexs_history,
+                         cache=self.cache)
+        self.assertEqual([], self.get_cache_files())
+
+
+if __name__ == '__main__':
+    unittest.main()
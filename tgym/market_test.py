@@ -2,9 +2,18 @@
 
 import logging
 import os
+import shutil
+import tempfile
+import threading
 import unittest
 
-from tgym.market import Market
+import numpy as np
+import pandas as pd
+
+from tgym.envs.multi_vol import MultiVolEnv
+from tgym.envs.simple import SimpleEnv
+from tgym.generator import DEFAULT_INDEXS, generate_market, write_history
+from tgym.market import TRADE_MASKS, Market
 
 logging.root.setLevel(logging.ERROR)
 
@@ -96,5 +105,392 @@ class TestMarket(unittest.TestCase):
         self.assertEqual(16.43, price)
 
 
+def make_open_dates(start, end):
+    return [d.strftime("%Y%m%d") for d in pd.bdate_range(start, end)]
+
+
+def make_code_history(dates, price=10.0, adj_factor=1.0, seed=0):
+    """
+    本地替代tushare的数据源, 格式与Market.codes_history一致
+    """
+    rng = np.random.RandomState(seed)
+    closes = price * np.cumprod(1 + rng.uniform(-0.05, 0.05, len(dates)))
+    pre_closes = np.concatenate(([price], closes[:-1]))
+    bfq = pd.DataFrame({
+        "open": pre_closes,
+        "high": np.maximum(pre_closes, closes) * 1.01,
+        "low": np.minimum(pre_closes, closes) * 0.99,
+        "close": closes,
+        "pre_close": pre_closes,
+        "change": closes - pre_closes,
+        "pct_chg": (closes / pre_closes - 1) * 100,
+        "vol": rng.randint(1000, 10000, len(dates)).astype(float),
+        "amount": closes * 1000})
+    hfq = bfq * adj_factor
+    hfq[["change", "pct_chg", "vol"]] = bfq[["change", "pct_chg", "vol"]]
+    hfq.columns = [c + "_hfq" for c in hfq.columns]
+    df = pd.concat([bfq, hfq], axis=1)
+    df.insert(0, "adj_factor", adj_factor)
+    df.index = pd.Index(dates, name="trade_date")
+    return df
+
+
+def make_index_history(dates, point=3000.0, seed=0):
+    df = make_code_history(dates, price=point, seed=seed)
+    return df[["close", "open", "high", "low", "pre_close", "change",
+               "pct_chg", "vol", "amount"]]
+
+
+def make_history(start, end, codes, indexs=DEFAULT_INDEXS):
+    """
+    本地替代tushare的数据, 返回: codes_history, indexs_history
+    """
+    dates = make_open_dates(start, end)
+    codes_history = {code: make_code_history(dates, seed=i)
+                     for i, code in enumerate(codes)}
+    indexs_history = {code: make_index_history(dates, seed=i)
+                      for i, code in enumerate(indexs)}
+    return codes_history, indexs_history
+
+
+class MarketTestCase(unittest.TestCase):
+    """
+    测试基类: setUp在临时目录data_dir中按Market的格式写入make_history的数据
+    (Market加载时不需要访问tushare)并创建self.m, tearDown删除临时目录
+    子类可以修改start, end, codes与indexs(传给Market, 总是写入默认的指数)
+    """
+    start = "20190101"
+    end = "20190331"
+    codes = ["000001.SZ", "000002.SZ"]
+    indexs = []
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        indexs = DEFAULT_INDEXS + [code for code in self.indexs
+                                   if code not in DEFAULT_INDEXS]
+        write_history(self.data_dir, self.start, self.end,
+                      *make_history(self.start, self.end, self.codes, indexs))
+        self.m = self.make_market()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def make_market(self, **kwargs):
+        kwargs.setdefault("indexs", self.indexs)
+        return Market(start=self.start, end=self.end, codes=self.codes,
+                      data_dir=self.data_dir, **kwargs)
+
+
+class SuspendedTestCase(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        # 000002.SZ 在20190110停牌
+        path = os.path.join(self.data_dir, "000002.SZ",
+                            "20190101-20190331.csv")
+        df = pd.read_csv(path, dtype={"trade_date": str})
+        # 20190111 收盘价为ST的5%涨停价, 一字板
+        i = np.nonzero(df["trade_date"] == "20190111")[0][0]
+        price = round(df.loc[i, "pre_close"] * 1.05, 2)
+        df.loc[i, ["open", "high", "low", "close"]] = price
+        df[df["trade_date"] != "20190110"].to_csv(path, index=False)
+        self.m = self.make_market()
+
+
+class TestMarketDateIds(SuspendedTestCase):
+
+    def test_calendar(self):
+        self.assertIs(self.m.open_dates, self.m.calendar.dates)
+        self.assertEqual(self.m.open_dates.index("20190110"),
+                         self.m.calendar.get_id("20190110"))
+        self.assertEqual(1, self.m.code_ids["000002.SZ"])
+
+    def test_prices(self):
+        df = self.m.codes_history["000002.SZ"]
+        date_id = self.m.calendar.get_id("20190110")
+        self.assertTrue(self.m.is_suspended("000002.SZ", "20190110"))
+        self.assertTrue(self.m.is_suspended_by_id(1, date_id))
+        self.assertFalse(self.m.is_suspended_by_id(0, date_id))
+        # 停牌日使用前一开市日的数据
+        self.assertEqual(df.loc["20190109", "close"],
+                         self.m.get_close_price_by_id(1, date_id))
+        self.assertEqual(df.loc["20190109", "pre_close"],
+                         self.m.get_pre_close_price("000002.SZ", "20190110"))
+        # 周六使用前一开市日(周五)的数据
+        self.assertEqual(df.loc["20190104", "close"],
+                         self.m.get_close_price("000002.SZ", "20190105"))
+        self.assertTrue(self.m.is_suspended("000002.SZ", "20190105"))
+        self.assertEqual(df.loc["20190102", "adj_factor"],
+                         self.m.get_pre_adj_factor("000002.SZ", "20190103"))
+        # 第一个开市日之前没有数据, 不在codes中的股票也没有
+        for fn in [self.m.get_close_price, self.m.get_pre_close_price,
+                   self.m.get_adj_factor]:
+            with self.assertRaises(Exception):
+                fn("000002.SZ", "20181231")
+            with self.assertRaises(Exception):
+                fn("600000.SH", "20190110")
+        with self.assertRaises(Exception):
+            self.m.get_pre_adj_factor("000002.SZ", "20190101")
+        with self.assertRaises(Exception):
+            self.m.get_pre_adj_factor("600000.SH", "20190110")
+        self.assertEqual(1.0, self.m.get_divide_rate("000002.SZ", "20190111"))
+        ok, _ = self.m.buy_check_by_id(1, date_id, bid_price=100)
+        self.assertFalse(ok)
+        low = df.loc["20190114", "low"]
+        ok, price = self.m.sell_check("000002.SZ", "20190114",
+                                      bid_price=low - 1)
+        self.assertTrue(ok)
+        self.assertEqual(low, price)
+
+    def test_trade_masks(self):
+        date_id = self.m.calendar.get_id("20190111")
+        self.assertTrue(self.m.suspended[date_id - 1, 1])
+        # 不是ST时, 5%不是涨停
+        self.assertFalse(self.m.limit_up_locked[date_id, 1])
+        ok, _ = self.m.buy_check("000002.SZ", "20190111", bid_price=100)
+        self.assertTrue(ok)
+        # 周末开始, 周一结束的ST期间
+        self.m.set_st_periods({"000002.SZ": [("20190105", "20190114")]})
+        c = self.m.calendar
+        st = self.m.st[c.get_id("20190104"): c.get_id("20190115") + 1, 1]
+        self.assertEqual([False] + [True] * 6 + [False], st.tolist())
+        self.assertFalse(self.m.st[:, 0].any())
+        self.assertTrue(self.m.limit_up_locked[date_id, 1])
+        self.assertFalse(self.m.limit_down_locked[date_id, 1])
+        self.assertFalse(self.m.buyable[date_id, 1])
+        self.assertTrue(self.m.sellable[date_id, 1])
+        ok, _ = self.m.buy_check("000002.SZ", "20190111", bid_price=100)
+        self.assertFalse(ok)
+
+
+class TestMarketInfos(SuspendedTestCase):
+    def test_infos(self):
+        m = self.make_market(
+            indexs=["399001.SZ"],
+            infos={"equities_hfq_info": ["close_hfq", "vol_hfq"],
+                   "indexs_info": ["close"]})
+        self.assertEqual(["equities_hfq_info", "indexs_info"],
+                         list(m.market_info["20190110"].keys()))
+        # 每支股票2列 + 开盘标志
+        self.assertEqual(6, m.equity_hfq_info_size)
+        self.assertEqual(1, m.indexs_info_size)
+        df = m.codes_history["000002.SZ"]
+        # 停牌日使用前一开盘日的数据
+        self.assertEqual(df.loc["20190109", ["close_hfq", "vol_hfq"]].tolist()
+                         + [0], m.market_info["20190110"][
+                             "equities_hfq_info"][3:])
+        # 与构建全部列时一致
+        full = self.m.market_info["20190110"]["equities_hfq_info"]
+        self.assertEqual([full[3], full[7], full[9]],
+                         m.market_info["20190110"]["equities_hfq_info"][:3])
+        env = SimpleEnv(m, look_back_days=5, reward_fn="daily_return")
+        self.assertEqual(7, env.market_info_size)
+        with self.assertRaises(Exception):
+            SimpleEnv(m, look_back_days=5,
+                      used_infos=["equities_bfq_info"])
+        m = self.make_market(infos=["equities_hfq_info"])
+        self.assertEqual(full, m.market_info["20190110"]["equities_hfq_info"])
+        with self.assertRaises(Exception):
+            self.make_market(infos={"equities_hfq_info": ["close"]})
+
+    def test_indexs_block(self):
+        m = self.make_market(indexs=["399001.SZ"])
+        block = m.get_indexs_block(["close"])
+        self.assertEqual((len(m.open_dates), len(m.indexs)), block.shape)
+        # 指数缺少开市日的数据时抛出KeyError, 而不是填充nan
+        df = m.indexs_history["399001.SZ"]
+        m.indexs_history["399001.SZ"] = df.drop("20190110")
+        with self.assertRaises(KeyError):
+            m.get_indexs_block(["close"])
+
+
+class TestMarketAppendDays(MarketTestCase):
+    indexs = ["000001.SH", "399001.SZ"]
+
+    def setUp(self):
+        super().setUp()
+        # 本地替代tushare的增量数据
+        self.codes_feed, self.indexs_feed = make_history(
+            "20190101", "20190430", self.codes, self.indexs)
+
+    def test_append_days(self):
+        open_dates = self.m.open_dates
+        n_dates = len(open_dates)
+        new_dates = self.m.append_days("20190430", self.codes_feed,
+                                       self.indexs_feed)
+        self.assertEqual(make_open_dates("20190401", "20190430"), new_dates)
+        self.assertIs(open_dates, self.m.open_dates)
+        self.assertEqual(n_dates + len(new_dates), len(self.m.open_dates))
+        self.assertEqual("20190430", self.m.end)
+        self.assertEqual(len(self.m.open_dates),
+                         len(self.m.codes_history["000001.SZ"]))
+        # 与一次性加载的结果一致
+        date = new_dates[-1]
+        expected = self.codes_feed["000002.SZ"].loc[date].tolist()
+        self.assertEqual(expected[10:] + [1],
+                         self.m.market_info[date]["equities_hfq_info"][10:])
+        self.assertEqual(self.m.equity_hfq_info_size,
+                         len(self.m.market_info[date]["equities_hfq_info"]))
+        # 已经存在的日期不会重复追加
+        self.assertEqual([], self.m.append_days("20190430", self.codes_feed,
+                                                self.indexs_feed))
+        # 以新的end保存了数据文件
+        m = Market(start="20190101", end="20190430", codes=self.codes,
+                   indexs=self.indexs, data_dir=self.data_dir)
+        self.assertEqual(self.m.open_dates, m.open_dates)
+
+    def test_append_days_suspended(self):
+        # 新增数据中停牌的股票使用前一开盘日信息
+        feed = dict(self.codes_feed)
+        feed["000002.SZ"] = feed["000002.SZ"].loc[:"20190410"]
+        self.m.append_days("20190430", feed, self.indexs_feed)
+        info = self.m.market_info["20190430"]["equities_hfq_info"]
+        pre_info = self.m.market_info["20190410"]["equities_hfq_info"]
+        self.assertEqual(pre_info[10:-1], info[10:-1])
+        self.assertEqual(0, info[-1])
+        self.assertTrue(self.m.is_suspended("000002.SZ", "20190430"))
+        self.assertEqual(self.m.codes_history["000002.SZ"].loc[
+            "20190410", "close"],
+            self.m.get_close_price("000002.SZ", "20190430"))
+
+    def test_append_days_incremental(self):
+        # 分两次增量追加, 与在全部数据上一次性构建的结果一致
+        features = ["ma_5", "ema_12", "atr_14", "rsi_14", "volatility_20",
+                    "return_rank_5", "volume_zscore_20", "rs_sh_5"]
+        self.m.add_features(features)
+        self.m.set_st_periods({"000001.SZ": [("20190320", "20190410")]})
+        used_infos = ["equities_hfq_info", "ma_5"]
+        self.m.get_market_info_array(used_infos)
+        feed = dict(self.codes_feed)
+        feed["000002.SZ"] = feed["000002.SZ"].loc[:"20190410"]
+        self.m.append_days("20190415", feed, self.indexs_feed)
+        self.m.append_days("20190430", feed, self.indexs_feed)
+        m = Market(start="20190101", end="20190430", codes=self.codes,
+                   indexs=self.indexs, data_dir=None,
+                   codes_history=self.m.codes_history,
+                   indexs_history=self.m.indexs_history)
+        m.add_features(features)
+        m.set_st_periods(self.m.st_periods)
+        self.assertEqual(m.open_dates, self.m.open_dates)
+        for name in m.prices:
+            np.testing.assert_array_equal(m.prices[name], self.m.prices[name])
+        for name in TRADE_MASKS:
+            np.testing.assert_array_equal(getattr(m, name),
+                                          getattr(self.m, name))
+        for date in m.open_dates:
+            for name in m.infos:
+                self.assertEqual(m.market_info[date][name],
+                                 self.m.market_info[date][name])
+            for name in features:
+                np.testing.assert_allclose(m.market_info[date][name],
+                                           self.m.market_info[date][name],
+                                           rtol=1e-9, atol=1e-12)
+        np.testing.assert_allclose(m.get_market_info_array(used_infos),
+                                   self.m.get_market_info_array(used_infos),
+                                   rtol=1e-6)
+
+    def test_env_resume(self):
+        env = SimpleEnv(self.m, look_back_days=5,
+                        reward_fn="daily_return")
+        env.reset()
+        done = False
+        while not done:
+            _, _, done, _, _ = env.step([0, 0.1])
+        self.assertFalse(env.resume())
+        n_steps = len(env.portfolio_value_logs)
+        self.m.append_days("20190430", self.codes_feed, self.indexs_feed)
+        self.assertTrue(env.resume())
+        self.assertEqual("20190401", env.current_date)
+        done = False
+        while not done:
+            _, _, done, _, _ = env.step([0, 0.1])
+        self.assertEqual("20190430", env.current_date)
+        self.assertEqual(n_steps + 22, len(env.portfolio_value_logs))
+
+
+class TestMarketFreeze(unittest.TestCase):
+    def setUp(self):
+        self.used_infos = ["equities_hfq_info", "indexs_info", "ma_5"]
+        self.m = generate_market(
+            "20190101", "20191231", ["000001.SZ", "300750.SZ", "600000.SH"],
+            seed=5, suspend_prob=0.01).freeze(self.used_infos)
+
+    def run_episode(self, market, seed):
+        env = MultiVolEnv(market, look_back_days=10,
+                          used_infos=self.used_infos,
+                          reward_fn="daily_return")
+        rng = np.random.RandomState(seed)
+        env.reset()
+        done = False
+        while not done:
+            action = rng.uniform(-1, 1, env.action_space.shape)
+            _, _, done, _, _ = env.step(action)
+        return env.portfolio_value_logs
+
+    def test_read_only(self):
+        self.assertFalse(self.m.prices["close"].flags.writeable)
+        self.assertFalse(self.m.buyable.flags.writeable)
+        with self.assertRaises(ValueError):
+            self.m.prices["close"][0, 0] = 1
+        with self.assertRaises(TypeError):
+            self.m.market_info[self.m.open_dates[0]]["ma_5"] = []
+        with self.assertRaises(Exception):
+            self.m.codes = ["000002.SZ"]
+        with self.assertRaises(Exception):
+            self.m.append_days("20200131")
+        with self.assertRaises(Exception):
+            self.m.set_st_periods({"000001.SZ": [("20190101", "20190301")]})
+        with self.assertRaises(Exception):
+            self.m.add_features(["rsi_14"])
+        # 历史数据不能增删, 修改访问得到的DataFrame不改变Market
+        code = self.m.codes[0]
+        date = self.m.open_dates[0]
+        close = self.m.codes_history[code].loc[date, "close"]
+        with self.assertRaises(TypeError):
+            self.m.codes_history[code] = None
+        with self.assertRaises(TypeError):
+            del self.m.indexs_history["000001.SH"]
+        df = self.m.codes_history[code]
+        df.loc[date, "close"] = 0
+        df["open"] = 0
+        self.assertEqual(close, self.m.codes_history[code].loc[date, "close"])
+        self.assertTrue((self.m.codes_history[code]["open"] > 0).all())
+        self.assertEqual(3, len(self.m.codes_history))
+        # 已经计算过的指标可以重复请求
+        self.m.add_features(["ma_5"])
+        view = self.m.window("20190301", "20190630")
+        self.assertTrue(view.frozen)
+        self.assertFalse(view.prices["close"].flags.writeable)
+        with self.assertRaises(Exception):
+            view.start = "20190101"
+
+    def test_threads(self):
+        n_threads = 8
+        expected = [self.run_episode(self.m, seed)
+                    for seed in range(n_threads)]
+        results = [None] * n_threads
+        errors = []
+        barrier = threading.Barrier(n_threads)
+
+        def run(i):
+            try:
+                barrier.wait()
+                # 视图与market_info数组的缓存也在多个线程中同时创建
+                market = self.m.window(self.m.open_dates[0],
+                                       self.m.open_dates[-1])
+                results[i] = self.run_episode(market, i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(n_threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        for i in range(n_threads):
+            np.testing.assert_array_equal(expected[i], results[i])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,18 +2,24 @@
 
 import logging
 
+import numpy as np
+
 
 class Portfolio:
     """
     NOTE: 考虑到不同的类型的资产commission并不一样, 所以Portfolio需要commission相关的参
     数
     divide_rate_threshold: 是否有拆分判断阀值
+    fee_schedule: 按日期生效的费率表, 见tgym/fees.py, 不为None时代替
+        buy/sell_commission_rate与min_commission, 按update_before_trade传入的
+        日期计算交易费
     """
 
     def __init__(self,
                  buy_commission_rate=0.001, sell_commission_rate=0.0015,
                  min_commission=5.0, round_lot=100,
-                 divide_rate_threshold=1.005, code="000001.SZ"):
+                 divide_rate_threshold=1.005, code="000001.SZ",
+                 fee_schedule=None):
         # 市值
         self.market_value = 0.0
         # 持仓量
@@ -52,6 +58,9 @@ class Portfolio:
         self.round_lot = round_lot
         self.divide_rate_threshold = divide_rate_threshold
         self.code = code
+        self.fee_schedule = fee_schedule
+        # 当前交易日, fee_schedule按该日期的费率计算交易费
+        self.date = None
 
     def update_value_percent(self, total_value):
         """
@@ -62,6 +71,12 @@ class Portfolio:
         else:
             self.value_percent = self.market_value / total_value
 
+    def get_fee_date(self):
+        if self.date is None:
+            raise Exception(u"使用fee_schedule时需要在update_before_trade中"
+                            u"传入当天的日期")
+        return self.date
+
     def _buy_fee(self, amount):
         # 1.印花税：由卖方出
         # 2.证管费：约为成交金额的0.00002收取
@@ -70,8 +85,10 @@ class Portfolio:
         # 4.过户费: 按成交金额的0.002%收取。
         # 5.券商交易佣金：最高不超过成交金额的3‰，最低5元起，单笔交易佣金不满5元按5元收取。
         # NOTE: 实际操作费率约： 0.0010775285
-        return round(max(self.min_commission,
-                         amount * self.buy_commission_rate), 2)
+        if self.fee_schedule is not None:
+            return self.fee_schedule.buy_fee(amount, self.get_fee_date())
+        return np.round(max(self.min_commission,
+                            amount * self.buy_commission_rate), 2)
 
     def _sell_fee(self, amount):
         # 1.印花税：成交金额的 0.001, 2008年9月19日至今由向双边征收改为向出让方单边征收
@@ -80,7 +97,9 @@ class Portfolio:
         # A股2、3项收费合计称为交易规费，合计收取成交金额的0.00896%，包含在券商交易佣金中。
         # 4.过户费: 按成交金额的0.002%收取。
         # 实际操作费率： 0.00126019
-        return round(amount * self.sell_commission_rate, 2)
+        if self.fee_schedule is not None:
+            return self.fee_schedule.sell_fee(amount, self.get_fee_date())
+        return np.round(amount * self.sell_commission_rate, 2)
 
     def buy(self, price, volume):
         # 买入
@@ -102,7 +121,9 @@ class Portfolio:
         # 拆分判断, 有拆分返回 True, 否则 False
         return divide_rate > self.divide_rate_threshold
 
-    def update_before_trade(self, divide_rate):
+    def update_before_trade(self, divide_rate, date=None):
+        # date: 当前交易日, 使用fee_schedule时需要
+        self.date = date
         # 如果有拆分
         if self.is_divide(divide_rate):
             logging.debug("update_before_trade: %s divide_rate: %.3f" % (
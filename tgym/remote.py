@@ -0,0 +1,393 @@
+# -*- coding:utf-8 -*-
+"""
+远程rollout: RolloutServer在一个进程中托管一组env, 通过TCP或Unix socket以紧凑
+的二进制协议提供批量reset/step, RemoteEnvs是对应的客户端, 接口与gym类似
+
+协议: 每个消息为 4字节消息体长度(uint32, little-endian) + 消息体
+    请求: 1字节命令 + uint32 env数量n + n个int32 env id + 数据
+        STEP的数据: [n, action_size] float32 action
+    返回: 1字节状态 + 数据; 状态为ERROR时数据是utf-8编码的异常信息, 客户端
+        抛出异常, 连接仍然可以继续使用; 状态为OK时的数据:
+        INFO: int32 [n_envs, look_back_days, input_size, action_size, n_codes]
+        RESET: [n, look_back_days, input_size] float32 observation
+        STEP: [n, input_size] float32 最新一天的observation,
+              [n] float64 reward, [n] uint8 done, [n] float64 portfolio_value,
+              [n, n_codes] float64 每支股票的reward
+NOTE(wen): observation窗口由客户端维护, 每步只传输最新的一行
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+from gym import spaces
+
+INFO, RESET, STEP, CLOSE = 0, 1, 2, 3
+# 返回的状态
+OK, ERROR = 0, 1
+HEADER = struct.Struct("<I")
+REQUEST = struct.Struct("<BI")
+
+
+def make_socket(address):
+    """
+    address: (host, port)使用TCP, 字符串(文件路径)使用Unix socket
+    """
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # 小消息不等待合并, 降低延迟
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class Connection:
+    """
+    按"长度 + 消息体"收发消息, 接收使用可复用的缓冲区
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray(4096)
+
+    def _recv_into(self, view):
+        while len(view) > 0:
+            n = self.sock.recv_into(view)
+            if n == 0:
+                raise ConnectionError(u"连接已关闭")
+            view = view[n:]
+
+    def send(self, *parts):
+        size = sum(len(part) for part in parts)
+        self.sock.sendall(b"".join((HEADER.pack(size),) + parts))
+
+    def recv(self):
+        """
+        返回消息体的memoryview, 在下一次recv之前有效
+        """
+        header = bytearray(HEADER.size)
+        self._recv_into(memoryview(header))
+        size = HEADER.unpack(header)[0]
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+        view = memoryview(self.buffer)[:size]
+        self._recv_into(view)
+        return view
+
+    def close(self):
+        self.sock.close()
+
+
+class RolloutServer:
+    """
+    envs: env列表, 需要有相同的look_back_days, input_size, action_size与股票数量
+    address: 监听地址, (host, port)或Unix socket路径; TCP端口为0时自动选择,
+        实际地址见self.address
+    每个连接使用一个线程, 对env的操作用锁串行执行
+    """
+
+    def __init__(self, envs, address=("127.0.0.1", 0)):
+        self.envs = envs
+        env = envs[0]
+        self.input_size = env.input_size
+        self.action_size = env.action_size
+        self.n_codes = env.n
+        self.info = np.array([len(envs), env.look_back_days, env.input_size,
+                              env.action_size, env.n], dtype=np.int32)
+        self.sock = make_socket(address)
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+        self.sock.bind(address)
+        self.sock.listen(16)
+        self.sock.settimeout(0.2)
+        self.address = self.sock.getsockname()
+        self.lock = threading.Lock()
+        self.running = False
+
+    def serve_forever(self):
+        self.running = True
+        while self.running:
+            try:
+                sock, _ = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            sock.settimeout(None)
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self.handle,
+                                      args=(Connection(sock),))
+            thread.daemon = True
+            thread.start()
+
+    def start(self):
+        """
+        在后台线程中运行serve_forever, 返回线程
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def close(self):
+        self.running = False
+        self.sock.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def handle(self, conn):
+        try:
+            while True:
+                body = conn.recv()
+                cmd, n = REQUEST.unpack_from(body)
+                if cmd == CLOSE:
+                    break
+                try:
+                    ids = np.frombuffer(body, np.int32, n, REQUEST.size)
+                    data = body[REQUEST.size + ids.nbytes:]
+                    with self.lock:
+                        reply = [bytes([OK])] + self.dispatch(cmd, ids, data)
+                except Exception as e:
+                    # 返回异常信息, 由客户端抛出, 不断开连接
+                    # NOTE(wen): 批量step时出错之前的env已经step
+                    message = u"%s: %s" % (type(e).__name__, e)
+                    reply = [bytes([ERROR]), message.encode("utf-8")]
+                conn.send(*reply)
+        except ConnectionError:
+            pass
+        finally:
+            conn.close()
+
+    def dispatch(self, cmd, ids, data):
+        if cmd == INFO:
+            return [self.info.tobytes()]
+        if cmd == RESET:
+            obs = np.stack([self.envs[i].reset() for i in ids])
+            return [obs.astype(np.float32, copy=False).tobytes()]
+        if cmd == STEP:
+            return self.step(ids, data)
+        raise ValueError(u"未知命令: %d" % cmd)
+
+    def step(self, ids, data):
+        n = len(ids)
+        actions = np.frombuffer(data, np.float32).reshape(n, self.action_size)
+        obs_rows = np.empty((n, self.input_size), dtype=np.float32)
+        rewards = np.empty(n, dtype=np.float64)
+        dones = np.empty(n, dtype=np.uint8)
+        values = np.empty(n, dtype=np.float64)
+        code_rewards = np.empty((n, self.n_codes), dtype=np.float64)
+        for k, i in enumerate(ids):
+            env = self.envs[i]
+            obs, reward, done, _, env_rewards = env.step(actions[k].tolist())
+            obs_rows[k] = obs[-1]
+            rewards[k] = reward
+            dones[k] = done
+            values[k] = env.portfolio_value
+            code_rewards[k] = env_rewards
+        return [obs_rows.tobytes(), rewards.tobytes(), dones.tobytes(),
+                values.tobytes(), code_rewards.tobytes()]
+
+
+class RemoteEnvs:
+    """
+    RolloutServer的客户端, 每次调用可以批量reset/step多个env
+    ids: env id列表, 为None时表示全部env
+    """
+
+    def __init__(self, address):
+        sock = make_socket(address)
+        sock.connect(address)
+        self.conn = Connection(sock)
+        info = np.frombuffer(self.request(INFO, []), np.int32).tolist()
+        (self.n_envs, self.look_back_days, self.input_size,
+         self.action_size, self.n_codes) = info
+        # 每个env的observation窗口
+        self.obs = np.zeros((self.n_envs, self.look_back_days,
+                             self.input_size), dtype=np.float32)
+        self.action_space = spaces.Box(low=-1.0, high=1.0,
+                                       shape=(self.action_size,),
+                                       dtype=np.float32)
+        self.observation_space = spaces.Box(
+            low=-np.inf, high=np.inf,
+            shape=(self.look_back_days, self.input_size), dtype=np.float32)
+
+    def request(self, cmd, ids, data=b""):
+        """
+        返回数据部分的memoryview; 服务端出错时抛出异常
+        """
+        ids = np.asarray(ids, dtype=np.int32)
+        self.conn.send(REQUEST.pack(cmd, len(ids)), ids.tobytes(), data)
+        body = self.conn.recv()
+        if body[0] == ERROR:
+            raise Exception(u"RolloutServer出错: %s" %
+                            bytes(body[1:]).decode("utf-8"))
+        return body[1:]
+
+    def _get_ids(self, ids):
+        if ids is None:
+            return np.arange(self.n_envs, dtype=np.int32)
+        return np.asarray(ids, dtype=np.int32)
+
+    def reset(self, ids=None):
+        """
+        返回: [n, look_back_days, input_size]
+        """
+        ids = self._get_ids(ids)
+        body = self.request(RESET, ids)
+        obs = np.frombuffer(body, np.float32).reshape(
+            len(ids), self.look_back_days, self.input_size)
+        self.obs[ids] = obs
+        return self.obs[ids]
+
+    def step(self, actions, ids=None):
+        """
+        actions: [n, action_size]
+        返回: obs, rewards, dones, portfolio_values, 每支股票的rewards,
+            第一维均为n
+        """
+        ids = self._get_ids(ids)
+        n = len(ids)
+        actions = np.asarray(actions, dtype=np.float32).reshape(
+            n, self.action_size)
+        body = self.request(STEP, ids, actions.tobytes())
+        offset = 0
+        arrays = []
+        for dtype, count in [(np.float32, n * self.input_size),
+                             (np.float64, n), (np.uint8, n), (np.float64, n),
+                             (np.float64, n * self.n_codes)]:
+            arrays.append(np.frombuffer(body, dtype, count, offset))
+            offset += arrays[-1].nbytes
+        rows, rewards, dones, values, code_rewards = arrays
+        obs = self.obs[ids]
+        obs[:, :-1] = obs[:, 1:]
+        obs[:, -1] = rows.reshape(n, self.input_size)
+        self.obs[ids] = obs
+        # 复制一份, 消息缓冲区会被下一次接收覆盖
+        return (obs, rewards.copy(), dones.astype(bool), values.copy(),
+                code_rewards.reshape(n, self.n_codes).copy())
+
+    def env(self, env_id):
+        return RemoteEnv(self, env_id)
+
+    def close(self):
+        try:
+            self.conn.send(REQUEST.pack(CLOSE, 0))
+        finally:
+            self.conn.close()
+
+
+class RemoteEnv:
+    """
+    单个远程env, 接口与BaseEnv一致: step返回obs, reward, done, info, rewards
+    """
+
+    def __init__(self, client, env_id):
+        self.client = client
+        self.ids = [env_id]
+        self.action_space = client.action_space
+        self.observation_space = client.observation_space
+
+    def reset(self):
+        return self.client.reset(self.ids)[0]
+
+    def step(self, action):
+        obs, rewards, dones, values, code_rewards = self.client.step(
+            [action], self.ids)
+        info = {"portfolio_value": values[0]}
+        return (obs[0], rewards[0], bool(dones[0]), info,
+                code_rewards[0].tolist())
+
+
+def make_envs(n_envs, n_codes, scenario="average", look_back_days=10,
+              seed=0):
+    from tgym.generator import generate_market
+    from tgym.scenario import make_env
+    codes = ["%06d.SZ" % (i + 1) for i in range(n_codes)]
+    market = generate_market("20150101", "20191231", codes, seed=seed)
+    return [make_env(scenario, market, 100000.0, look_back_days,
+                     ["equities_hfq_info", "indexs_info"], "daily_return")
+            for _ in range(n_envs)]
+
+
+def run_server(address, n_envs, n_codes, scenario, ready):
+    server = RolloutServer(make_envs(n_envs, n_codes, scenario), address)
+    ready.put(server.address)
+    server.serve_forever()
+
+
+def get_random_actions(rng, n, action_size):
+    return rng.uniform(-1, 1, (n, action_size)).astype(np.float32)
+
+
+def benchmark(n_envs=8, n_codes=10, n_steps=500, scenario="average",
+              address=("127.0.0.1", 0)):
+    """
+    对比进程内step与通过socket远程step的吞吐(steps/sec)与每次批量step的延迟
+    服务端运行在子进程中, 与客户端不竞争GIL
+    """
+    rng = np.random.RandomState(0)
+    envs = make_envs(n_envs, n_codes, scenario)
+    for env in envs:
+        env.reset()
+    action_size = envs[0].action_size
+    start = time.time()
+    for _ in range(n_steps):
+        actions = get_random_actions(rng, n_envs, action_size)
+        for env, action in zip(envs, actions):
+            _, _, done, _, _ = env.step(action.tolist())
+            if done:
+                env.reset()
+    local_time = time.time() - start
+
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=run_server, args=(address, n_envs, n_codes, scenario, ready))
+    process.daemon = True
+    process.start()
+    client = RemoteEnvs(ready.get())
+    client.reset()
+    latencies = np.empty(n_steps)
+    for t in range(n_steps):
+        actions = get_random_actions(rng, n_envs, action_size)
+        step_start = time.time()
+        _, _, dones, _, _ = client.step(actions)
+        latencies[t] = time.time() - step_start
+        if dones.any():
+            client.reset(np.nonzero(dones)[0])
+    client.close()
+    process.terminate()
+    process.join()
+
+    remote_time = latencies.sum()
+    return {
+        "n_envs": n_envs, "n_codes": n_codes, "n_steps": n_steps,
+        "local_steps_per_sec": n_envs * n_steps / local_time,
+        "remote_steps_per_sec": n_envs * n_steps / remote_time,
+        "remote_latency_ms_mean": latencies.mean() * 1000,
+        "remote_latency_ms_p50": np.percentile(latencies, 50) * 1000,
+        "remote_latency_ms_p99": np.percentile(latencies, 99) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=u"远程rollout性能测试")
+    parser.add_argument("--n_envs", type=int, default=8)
+    parser.add_argument("--n_codes", type=int, default=10)
+    parser.add_argument("--n_steps", type=int, default=500)
+    parser.add_argument("--scenario", default="average")
+    parser.add_argument("--unix", default="",
+                        help=u"Unix socket路径, 不设置时使用TCP")
+    args = parser.parse_args()
+    address = args.unix or ("127.0.0.1", 0)
+    result = benchmark(args.n_envs, args.n_codes, args.n_steps,
+                       args.scenario, address)
+    for key, value in result.items():
+        print("%s: %.2f" % (key, value))
+
+
+if __name__ == '__main__':
+    main()
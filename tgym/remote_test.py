@@ -0,0 +1,91 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tgym.remote import RemoteEnvs, RolloutServer, make_envs
+
+logging.root.setLevel(logging.ERROR)
+
+
+class TestRemote(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.local_envs = make_envs(3, 2, look_back_days=5)
+        self.server_envs = make_envs(3, 2, look_back_days=5)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def check_server(self, address):
+        server = RolloutServer(self.server_envs, address)
+        server.start()
+        client = RemoteEnvs(server.address)
+        self.assertEqual(3, client.n_envs)
+        self.assertEqual((4,), client.action_space.shape)
+        self.assertEqual(self.local_envs[0].observation_space.shape,
+                         client.observation_space.shape)
+
+        obs = client.reset()
+        for i, env in enumerate(self.local_envs):
+            np.testing.assert_array_equal(env.reset(), obs[i])
+        rng = np.random.RandomState(0)
+        for _ in range(20):
+            actions = rng.uniform(-1, 1, (2, 4)).astype(np.float32)
+            # 只step部分env
+            obs, rewards, dones, values, code_rewards = client.step(
+                actions, ids=[2, 0])
+            for k, i in enumerate([2, 0]):
+                env = self.local_envs[i]
+                env_obs, reward, done, _, env_rewards = env.step(
+                    actions[k].tolist())
+                np.testing.assert_array_equal(env_obs, obs[k])
+                self.assertEqual(reward, rewards[k])
+                self.assertEqual(done, dones[k])
+                self.assertEqual(env.portfolio_value, values[k])
+                self.assertEqual(env_rewards, code_rewards[k].tolist())
+        np.testing.assert_array_equal(self.local_envs[1].obs, client.obs[1])
+
+        # 单个env的gym接口
+        env = client.env(1)
+        obs, reward, done, info, rewards = env.step(np.zeros(4))
+        self.assertEqual((5, client.input_size), obs.shape)
+        self.assertEqual(self.server_envs[1].portfolio_value,
+                         info["portfolio_value"])
+        self.assertEqual(2, len(rewards))
+        client.close()
+        server.close()
+
+    def test_tcp(self):
+        self.check_server(("127.0.0.1", 0))
+
+    def test_error(self):
+        server = RolloutServer(self.server_envs)
+        server.start()
+        client = RemoteEnvs(server.address)
+        client.reset()
+        # 服务端的异常返回给客户端抛出, 连接可以继续使用
+        with self.assertRaises(Exception) as cm:
+            client.step(np.zeros((1, 4)), ids=[5])
+        self.assertIn("IndexError", str(cm.exception))
+        with self.assertRaises(Exception) as cm:
+            client.request(9, [])
+        self.assertIn(u"未知命令", str(cm.exception))
+        _, _, dones, _, _ = client.step(np.zeros((3, 4)))
+        self.assertEqual(3, len(dones))
+        client.close()
+        server.close()
+
+    def test_unix(self):
+        path = os.path.join(self.tmp_dir, "tgym.sock")
+        self.check_server(path)
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
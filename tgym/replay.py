@@ -0,0 +1,173 @@
+# -*- coding:utf-8 -*-
+"""
+预分配的环形replay buffer, env直接写入transition(见BaseEnv.set_replay_buffer)
+NOTE(wen): 相邻两步的obs只有最新的几天不同, 所以obs按天保存为一行, 每个回合开始
+    时保存look_back_days行, 之后每步只保存新增的行; 采样时再按位置拼出
+    [look_back_days, input_size]的obs与next_obs, 每个transition占用的内存约为
+    直接保存obs与next_obs的1 / (2 * look_back_days)
+数组可以放在multiprocessing.shared_memory中, 由一个进程写入, 其他进程通过
+ReplayBuffer.attach读取与采样
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 计数器: 已写入的行数, 已写入的transition数, 最早一个有效transition的序号
+ROWS, END, START = 0, 1, 2
+
+
+def get_transition_dtype(action_size):
+    return np.dtype([
+        ("action", np.float32, (action_size,)),
+        ("reward", np.float64),
+        ("done", np.bool_),
+        # next_obs与obs最后一行的序号(写入rows的总序号, 不取模)
+        ("row", np.int64),
+        ("prev_row", np.int64)])
+
+
+class ReplayBuffer:
+    """
+    capacity: 最多保存的transition数
+    look_back_days, input_size, action_size: 与env一致
+    row_capacity: 最多保存的行数, 默认为capacity + 64 * look_back_days;
+        行被覆盖时, 用到这些行的transition也随之失效
+    shared: 为True时数组放在共享内存中, 见attach
+    names: 已有共享内存的名字, 由attach传入
+    """
+
+    def __init__(self, capacity, look_back_days, input_size, action_size,
+                 obs_dtype=np.float32, row_capacity=None, shared=False,
+                 names=None):
+        self.capacity = capacity
+        self.look_back_days = look_back_days
+        self.input_size = input_size
+        self.action_size = action_size
+        self.obs_dtype = np.dtype(obs_dtype)
+        self.row_capacity = row_capacity or capacity + 64 * look_back_days
+        self.shared = shared
+        self.shms = []
+        specs = [("rows", (self.row_capacity, input_size), self.obs_dtype),
+                 ("transitions", (capacity,),
+                  get_transition_dtype(action_size)),
+                 ("counters", (3,), np.dtype(np.int64))]
+        for i, (name, shape, dtype) in enumerate(specs):
+            setattr(self, name, self.alloc(
+                shape, dtype, None if names is None else names[i]))
+
+    def alloc(self, shape, dtype, name=None):
+        if not self.shared:
+            return np.zeros(shape, dtype=dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        if name is None:
+            shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+        self.shms.append(shm)
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        if name is None:
+            array[...] = 0
+        return array
+
+    def get_meta(self):
+        """
+        在其他进程中attach需要的参数
+        """
+        if not self.shared:
+            raise Exception(u"ReplayBuffer: 只有shared=True时可以attach")
+        return {"capacity": self.capacity,
+                "look_back_days": self.look_back_days,
+                "input_size": self.input_size,
+                "action_size": self.action_size,
+                "obs_dtype": self.obs_dtype.str,
+                "row_capacity": self.row_capacity,
+                "names": [shm.name for shm in self.shms]}
+
+    @classmethod
+    def attach(cls, meta):
+        """
+        在其他进程中打开get_meta对应的共享内存
+        NOTE(wen): 只有一个进程写入, 读取的进程只采样
+        """
+        meta = dict(meta)
+        return cls(shared=True, **meta)
+
+    def close(self, unlink=False):
+        # unlink: 由创建共享内存的进程在最后调用, 释放共享内存
+        for name in ["rows", "transitions", "counters"]:
+            setattr(self, name, None)
+        for shm in self.shms:
+            shm.close()
+            if unlink:
+                shm.unlink()
+        self.shms = []
+
+    def __len__(self):
+        return int(self.counters[END] - self.counters[START])
+
+    def add_rows(self, rows):
+        """
+        追加obs的行, 被覆盖的行所在的transition失效
+        """
+        counters = self.counters
+        n_rows = int(counters[ROWS])
+        ids = np.arange(n_rows, n_rows + len(rows)) % self.row_capacity
+        self.rows[ids] = rows
+        n_rows += len(rows)
+        counters[ROWS] = n_rows
+        # 保留的最早一行
+        first_row = n_rows - self.row_capacity
+        start, end = int(counters[START]), int(counters[END])
+        while start < end and self.transitions["prev_row"][
+                start % self.capacity] - self.look_back_days + 1 < first_row:
+            start += 1
+        counters[START] = start
+
+    def add_episode(self, obs):
+        """
+        回合开始: 保存reset返回的obs的所有行
+        """
+        self.add_rows(obs)
+
+    def add(self, new_rows, action, reward, done):
+        """
+        保存一步: new_rows为step之后obs中新增的行(repeat > 1时可以有多行)
+        """
+        prev_row = int(self.counters[ROWS]) - 1
+        self.add_rows(new_rows)
+        counters = self.counters
+        end = int(counters[END])
+        t = self.transitions[end % self.capacity]
+        t["action"] = action
+        t["reward"] = reward
+        t["done"] = done
+        t["row"] = counters[ROWS] - 1
+        t["prev_row"] = prev_row
+        counters[END] = end + 1
+        if end + 1 - counters[START] > self.capacity:
+            counters[START] = end + 1 - self.capacity
+
+    def get_obs(self, rows):
+        # rows: [batch], obs最后一行的序号 -> [batch, look_back_days, size]
+        offsets = np.arange(1 - self.look_back_days, 1)
+        return self.rows[(rows[:, None] + offsets) % self.row_capacity]
+
+    def get(self, ids):
+        """
+        ids: transition的序号(在[START, END)之间, 不取模)
+        返回: obs, action, reward, next_obs, done
+        """
+        t = self.transitions[np.asarray(ids) % self.capacity]
+        return (self.get_obs(t["prev_row"]), t["action"], t["reward"],
+                self.get_obs(t["row"]), t["done"])
+
+    def sample(self, batch_size, rng=None):
+        """
+        均匀采样batch_size个有效的transition, 返回同get
+        rng: np.random.Generator, 为None时使用np.random.default_rng()
+        """
+        if len(self) == 0:
+            raise Exception(u"ReplayBuffer: 没有可采样的transition")
+        rng = rng or np.random.default_rng()
+        start, end = int(self.counters[START]), int(self.counters[END])
+        return self.get(rng.integers(start, end, batch_size))
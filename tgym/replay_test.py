@@ -0,0 +1,128 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from tgym.envs.multi_vol import MultiVolEnv
+from tgym.generator import generate_market
+from tgym.replay import ReplayBuffer
+
+logging.root.setLevel(logging.ERROR)
+
+
+def sample_in_child(meta, ids, queue):
+    buffer = ReplayBuffer.attach(meta)
+    obs, _, reward, next_obs, _ = buffer.get(ids)
+    queue.put((obs.copy(), reward.copy(), next_obs.copy()))
+    buffer.close()
+
+
+class TestReplayBuffer(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.m = generate_market("20190101", "20190630",
+                                 ["000001.SZ", "600000.SH"], seed=3,
+                                 suspend_prob=0.0)
+
+    def make_env(self):
+        env = MultiVolEnv(self.m, look_back_days=5, reward_fn="daily_return")
+        env.seed(0)
+        env.set_episode_days(20)
+        return env
+
+    def run_env(self, env, n_episodes, repeat=1):
+        # 返回每步的(obs, action, reward, next_obs, done)
+        transitions = []
+        for _ in range(n_episodes):
+            obs = env.reset()
+            done = False
+            while not done:
+                action = env.get_random_action()
+                next_obs, reward, done, _, _ = env.step(action, repeat=repeat)
+                transitions.append((obs, action, reward, next_obs, done))
+                obs = next_obs
+        return transitions
+
+    def assertTransitions(self, expected, actual):
+        obs, action, reward, next_obs, done = actual
+        for i, t in enumerate(expected):
+            np.testing.assert_array_equal(t[0], obs[i])
+            np.testing.assert_allclose(t[1], action[i], rtol=1e-6)
+            self.assertEqual(t[2], reward[i])
+            np.testing.assert_array_equal(t[3], next_obs[i])
+            self.assertEqual(t[4], done[i])
+
+    def test_env(self):
+        env = self.make_env()
+        buffer = ReplayBuffer(100, 5, env.input_size, env.action_size)
+        env.set_replay_buffer(buffer)
+        expected = self.run_env(env, 3)
+        self.assertEqual(60, len(buffer))
+        self.assertTransitions(expected, buffer.get(np.arange(60)))
+        # 每个transition一行, 每个回合多5行
+        self.assertEqual(60 + 3 * 5, buffer.counters[0])
+        obs, action, reward, next_obs, done = buffer.sample(
+            32, np.random.default_rng(0))
+        self.assertEqual((32, 5, env.input_size), obs.shape)
+        self.assertEqual((32, env.action_size), action.shape)
+        with self.assertRaises(Exception):
+            env.set_replay_buffer(ReplayBuffer(10, 10, env.input_size,
+                                               env.action_size))
+
+    def test_repeat(self):
+        env = self.make_env()
+        buffer = ReplayBuffer(100, 5, env.input_size, env.action_size)
+        env.set_replay_buffer(buffer)
+        # repeat大于look_back_days时next_obs全部是新的行
+        for repeat in [3, 7]:
+            buffer.counters[:] = 0
+            expected = self.run_env(env, 2, repeat)
+            self.assertEqual(len(expected), len(buffer))
+            self.assertTransitions(expected,
+                                   buffer.get(np.arange(len(expected))))
+
+    def test_ring(self):
+        env = self.make_env()
+        buffer = ReplayBuffer(100, 5, env.input_size, env.action_size,
+                              row_capacity=40)
+        env.set_replay_buffer(buffer)
+        expected = self.run_env(env, 4)
+        # 共4 * (5 + 20)行, 只保留最后40行: 最后一个回合的25行与倒数第二个回合
+        # 的最后15行, 倒数第二个回合中obs的5行都还在的transition只有最后10个
+        self.assertEqual(20 + 10, len(buffer))
+        start = int(buffer.counters[2])
+        self.assertEqual(50, start)
+        self.assertTransitions(expected[start:],
+                               buffer.get(np.arange(start, len(expected))))
+        # transition数超过capacity时覆盖最早的
+        buffer = ReplayBuffer(30, 5, env.input_size, env.action_size)
+        env.set_replay_buffer(buffer)
+        expected = self.run_env(env, 4)
+        self.assertEqual(30, len(buffer))
+        self.assertTransitions(expected[50:], buffer.get(np.arange(50, 80)))
+
+    def test_shared(self):
+        env = self.make_env()
+        buffer = ReplayBuffer(100, 5, env.input_size, env.action_size,
+                              shared=True)
+        env.set_replay_buffer(buffer)
+        expected = self.run_env(env, 2)
+        ctx = multiprocessing.get_context("spawn")
+        queue = ctx.Queue()
+        ids = np.arange(0, 40, 3)
+        process = ctx.Process(target=sample_in_child,
+                              args=(buffer.get_meta(), ids, queue))
+        process.start()
+        obs, reward, next_obs = queue.get(timeout=60)
+        process.join()
+        self.assertTransitions(
+            [expected[i] for i in ids],
+            (obs, buffer.get(ids)[1], reward, next_obs, buffer.get(ids)[4]))
+        buffer.close(unlink=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,19 +1,21 @@
 # -*- coding:utf-8 -*-
-from tgym.envs.average import AverageEnv
-from tgym.envs.multi_vol import MultiVolEnv
-from tgym.envs.simple import SimpleEnv
+import numpy as np
 
 
 def make_env(scenario, market, investment, look_back_days,
-             used_infos, reward_fn):
+             used_infos, reward_fn, dtype=np.float32, info_mode="dict"):
+    # 只导入用到的env
     if scenario == "simple":
+        from tgym.envs.simple import SimpleEnv
         return SimpleEnv(market, investment, look_back_days,
-                         used_infos, reward_fn)
+                         used_infos, reward_fn, dtype, info_mode)
     elif scenario == "average":
+        from tgym.envs.average import AverageEnv
         return AverageEnv(market, investment, look_back_days,
-                          used_infos, reward_fn)
+                          used_infos, reward_fn, dtype, info_mode)
     elif scenario == "multi_vol":
+        from tgym.envs.multi_vol import MultiVolEnv
         return MultiVolEnv(market, investment, look_back_days,
-                           used_infos, reward_fn)
+                           used_infos, reward_fn, dtype, info_mode)
     else:
-        raise "Not implement scenario %S" % scenario
+        raise Exception(u"Not implement scenario %s" % scenario)
@@ -0,0 +1,66 @@
+# -*- coding:utf-8 -*-
+from bisect import bisect_left, bisect_right
+
+
+class TradeCalendar:
+    """
+    交易日历: 将开市日期("YYYYMMDD")映射为从0开始连续的整数id
+    Market与env内部都使用整数id, 只在边界(加载数据, info)上使用日期字符串
+    dates: 升序的开市日期列表, 直接使用(不复制), 以便与Market.open_dates保持一致
+    """
+
+    def __init__(self, dates):
+        self.dates = dates
+        self.date_ids = {}
+        for i, date in enumerate(dates):
+            self.date_ids[date] = i
+
+    def __len__(self):
+        return len(self.dates)
+
+    def is_open(self, date):
+        return date in self.date_ids
+
+    def get_id(self, date):
+        # 非开市日返回None
+        return self.date_ids.get(date)
+
+    def get_date(self, date_id):
+        return self.dates[date_id]
+
+    def pre_id(self, date):
+        """
+        date之前(不包括date)最近一个开市日的id, 没有时返回-1
+        """
+        return bisect_left(self.dates, date) - 1
+
+    def next_id(self, date):
+        """
+        date之后(不包括date)最近一个开市日的id, 没有时返回len(self)
+        """
+        return bisect_right(self.dates, date)
+
+    def floor_id(self, date):
+        """
+        date当天或之前最近一个开市日的id, 没有时返回-1
+        """
+        date_id = self.date_ids.get(date)
+        if date_id is not None:
+            return date_id
+        return self.pre_id(date)
+
+    def pre_open_date(self, date):
+        date_id = self.pre_id(date)
+        return self.dates[date_id] if date_id >= 0 else None
+
+    def next_open_date(self, date):
+        date_id = self.next_id(date)
+        return self.dates[date_id] if date_id < len(self.dates) else None
+
+    def append(self, dates):
+        """
+        追加新的开市日期, dates需要晚于已有的日期
+        """
+        for date in dates:
+            self.date_ids[date] = len(self.dates)
+            self.dates.append(date)
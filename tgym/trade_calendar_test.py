@@ -0,0 +1,47 @@
+# -*- coding:utf-8 -*-
+
+import unittest
+
+from tgym.trade_calendar import TradeCalendar
+
+
+class TestTradeCalendar(unittest.TestCase):
+    def setUp(self):
+        # 20190105, 20190106 为周末
+        self.dates = ["20190103", "20190104", "20190107", "20190108"]
+        self.calendar = TradeCalendar(self.dates)
+
+    def test_ids(self):
+        self.assertEqual(4, len(self.calendar))
+        self.assertEqual(2, self.calendar.get_id("20190107"))
+        self.assertIsNone(self.calendar.get_id("20190105"))
+        self.assertTrue(self.calendar.is_open("20190103"))
+        self.assertFalse(self.calendar.is_open("20190106"))
+        self.assertEqual("20190104", self.calendar.get_date(1))
+
+    def test_lookup(self):
+        c = self.calendar
+        self.assertEqual(1, c.pre_id("20190105"))
+        self.assertEqual(1, c.pre_id("20190107"))
+        self.assertEqual(-1, c.pre_id("20190103"))
+        self.assertEqual(2, c.next_id("20190105"))
+        self.assertEqual(3, c.next_id("20190107"))
+        self.assertEqual(4, c.next_id("20190108"))
+        self.assertEqual(2, c.floor_id("20190107"))
+        self.assertEqual(1, c.floor_id("20190106"))
+        self.assertEqual(-1, c.floor_id("20190101"))
+        self.assertEqual("20190104", c.pre_open_date("20190107"))
+        self.assertEqual("20190107", c.next_open_date("20190104"))
+        self.assertIsNone(c.pre_open_date("20190103"))
+        self.assertIsNone(c.next_open_date("20190108"))
+
+    def test_append(self):
+        self.calendar.append(["20190109", "20190110"])
+        self.assertIs(self.dates, self.calendar.dates)
+        self.assertEqual(6, len(self.dates))
+        self.assertEqual(5, self.calendar.get_id("20190110"))
+        self.assertEqual(4, self.calendar.next_id("20190108"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,249 @@
+# -*- coding:utf-8 -*-
+"""
+回合轨迹的二进制存储, 用于离线强化学习与分析
+每个字段一个只追加的二进制文件, 写入时先放在预分配的chunk中, chunk写满后整块追加
+到文件; 读取时使用np.memmap, 不需要把整个文件加载到内存
+NOTE(wen): obs在相邻两步之间只有最新的几天不同, 所以每一步只把obs新增的行
+    (step(repeat=k)时为k行, 最多look_back_days行)追加到rows中, 回合开始时的
+    look_back_days行保存在init_obs中, 读取时再拼出完整的obs
+"""
+import json
+import os
+
+import numpy as np
+
+from tgym.ledger import ORDER_DTYPE as LEDGER_ORDER_DTYPE
+
+# 数据格式的版本, 格式改变时加1, 与已有数据的版本不同时不能追加
+FORMAT_VERSION = 2
+# 在env.ledger订单的基础上增加所在的step
+ORDER_DTYPE = np.dtype([("step", np.int64)] + LEDGER_ORDER_DTYPE.descr)
+
+EPISODE_DTYPE = np.dtype([
+    # 回合第一步在steps中的位置
+    ("start", np.int64),
+    # 回合开始的日期在open_dates中的位置
+    ("time_id", np.int64),
+    # 回合第一步新增的obs行在rows中的位置
+    ("row", np.int64)])
+
+
+def get_step_dtype(action_size):
+    return np.dtype([
+        # 这一步之后rows的行数, 即obs最后一行在rows中的位置 + 1
+        ("row", np.int64),
+        ("action", np.float32, (action_size,)),
+        ("reward", np.float64),
+        ("done", np.bool_),
+        ("portfolio_value", np.float64),
+        ("time_id", np.int64)])
+
+
+class ChunkedFile:
+    """
+    只追加的二进制文件, 记录先写入预分配的chunk, 写满后整块写入文件
+    """
+
+    def __init__(self, path, dtype, chunk_size, inner_shape=()):
+        self.path = path
+        self.chunk = np.zeros((chunk_size,) + inner_shape, dtype=dtype)
+        self.n = 0
+        self.file = open(path, "ab")
+        # 已写入文件的记录数
+        self.n_written = os.path.getsize(path) // (
+            self.chunk.itemsize * int(np.prod(inner_shape)))
+
+    def next_row(self):
+        # 返回下一条记录在chunk中的位置, chunk已满时先写入文件
+        if self.n == len(self.chunk):
+            self.flush()
+        self.n += 1
+        return self.n - 1
+
+    def extend(self, records):
+        """
+        整块追加多条记录, 跨越chunk时分段复制, 不逐条转换
+        """
+        i = 0
+        while i < len(records):
+            if self.n == len(self.chunk):
+                self.flush()
+            k = min(len(records) - i, len(self.chunk) - self.n)
+            self.chunk[self.n: self.n + k] = records[i: i + k]
+            self.n += k
+            i += k
+
+    def flush(self):
+        if self.n > 0:
+            self.chunk[:self.n].tofile(self.file)
+            self.file.flush()
+            self.n_written += self.n
+            self.n = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def size(self):
+        return self.n_written + self.n
+
+
+class TrajectoryRecorder:
+    """
+    包装env, 在reset/step时将轨迹写入path目录, 其他属性直接访问env
+    path已存在时继续追加, 要求env的input_size, action_size等与已有数据一致
+    chunk_size: 每个chunk的记录数, 决定写文件的频率
+    """
+
+    def __init__(self, env, path, chunk_size=4096):
+        self.env = env
+        self.path = path
+        # 当前回合已经写入的env.ledger订单数
+        self.n_orders = 0
+        meta = {
+            "version": FORMAT_VERSION,
+            "codes": list(env.codes),
+            "look_back_days": env.look_back_days,
+            "input_size": env.input_size,
+            "action_size": env.action_size,
+            "obs_dtype": np.dtype(env.dtype).str}
+        if not os.path.exists(path):
+            os.makedirs(path)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f) != meta:
+                    raise Exception(u"%s 中已有数据与env不一致" % path)
+        else:
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+        self.steps = ChunkedFile(os.path.join(path, "steps.bin"),
+                                 get_step_dtype(env.action_size), chunk_size)
+        self.rows = ChunkedFile(os.path.join(path, "rows.bin"), env.dtype,
+                                chunk_size, (env.input_size,))
+        self.orders = ChunkedFile(os.path.join(path, "orders.bin"),
+                                  ORDER_DTYPE, chunk_size)
+        self.episodes = ChunkedFile(os.path.join(path, "episodes.bin"),
+                                    EPISODE_DTYPE, 64)
+        self.init_obs = ChunkedFile(
+            os.path.join(path, "init_obs.bin"), env.dtype, 64,
+            (env.look_back_days, env.input_size))
+
+    def __getattr__(self, name):
+        return getattr(self.env, name)
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        self.n_orders = 0
+        i = self.episodes.next_row()
+        self.episodes.chunk[i]["start"] = self.steps.size()
+        self.episodes.chunk[i]["time_id"] = self.env.current_time_id
+        self.episodes.chunk[i]["row"] = self.rows.size()
+        self.init_obs.chunk[self.init_obs.next_row()] = obs
+        return obs
+
+    def step(self, action, **kwargs):
+        time_id = self.env.current_time_id
+        obs, reward, done, info, rewards = self.env.step(action, **kwargs)
+        step = self.steps.size()
+        i = self.steps.next_row()
+        # step(repeat=k)新增k行(最多look_back_days行)
+        self.rows.extend(obs[-min(self.env.step_days, len(obs)):])
+        row = self.steps.chunk[i]
+        row["row"] = self.rows.size()
+        row["action"] = action
+        row["reward"] = reward
+        row["done"] = done
+        row["portfolio_value"] = self.env.portfolio_value
+        row["time_id"] = time_id
+        ledger = self.env.ledger
+        new_orders = ledger.orders[self.n_orders:]
+        if len(new_orders) > 0:
+            orders = np.empty(len(new_orders), dtype=ORDER_DTYPE)
+            orders["step"] = step
+            for name in LEDGER_ORDER_DTYPE.names:
+                orders[name] = new_orders[name]
+            self.orders.extend(orders)
+        self.n_orders = len(ledger)
+        return obs, reward, done, info, rewards
+
+    def flush(self):
+        for f in self.get_files():
+            f.flush()
+
+    def close(self):
+        for f in self.get_files():
+            f.close()
+
+    def get_files(self):
+        return [self.steps, self.rows, self.orders, self.episodes,
+                self.init_obs]
+
+
+def load_memmap(path, dtype, inner_shape=()):
+    dtype = np.dtype(dtype)
+    itemsize = dtype.itemsize * int(np.prod(inner_shape))
+    n = os.path.getsize(path) // itemsize if os.path.exists(path) else 0
+    if n == 0:
+        return np.zeros((0,) + inner_shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(n,) + inner_shape)
+
+
+class TrajectoryStore:
+    """
+    以np.memmap只读方式打开TrajectoryRecorder写入的数据
+    steps: 结构化数组, 字段: row(见get_step_dtype), action, reward, done,
+        portfolio_value, time_id
+    rows: [n, input_size], 每一步obs新增的行
+    orders: 结构化数组, 字段: step 以及tgym/ledger.py中ORDER_DTYPE的字段
+    episodes: 结构化数组, 字段: start, time_id
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.codes = self.meta["codes"]
+        self.look_back_days = self.meta["look_back_days"]
+        obs_dtype = np.dtype(self.meta["obs_dtype"])
+        self.steps = load_memmap(os.path.join(path, "steps.bin"),
+                                 get_step_dtype(self.meta["action_size"]))
+        self.rows = load_memmap(os.path.join(path, "rows.bin"), obs_dtype,
+                                (self.meta["input_size"],))
+        self.orders = load_memmap(os.path.join(path, "orders.bin"),
+                                  ORDER_DTYPE)
+        self.episodes = load_memmap(os.path.join(path, "episodes.bin"),
+                                    EPISODE_DTYPE)
+        self.init_obs = load_memmap(
+            os.path.join(path, "init_obs.bin"), obs_dtype,
+            (self.look_back_days, self.meta["input_size"]))
+        # 每一步所属的回合
+        self.step_episodes = np.searchsorted(
+            self.episodes["start"], np.arange(len(self.steps)),
+            side="right") - 1
+
+    def __len__(self):
+        return len(self.steps)
+
+    def episode_slice(self, episode):
+        start = self.episodes["start"][episode]
+        if episode + 1 < len(self.episodes):
+            end = self.episodes["start"][episode + 1]
+        else:
+            end = len(self.steps)
+        return slice(start, end)
+
+    def get_obs(self, step):
+        """
+        返回第step步之后env返回的完整obs: [look_back_days, input_size]
+        """
+        episode = self.step_episodes[step]
+        end = self.steps["row"][step]
+        n = min(end - self.episodes["row"][episode], self.look_back_days)
+        init_obs = self.init_obs[episode][n:]
+        return np.concatenate((init_obs, self.rows[end - n: end]))
+
+    def get_orders(self, episode):
+        s = self.episode_slice(episode)
+        start, end = np.searchsorted(self.orders["step"], [s.start, s.stop])
+        return self.orders[start: end]
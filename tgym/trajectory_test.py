@@ -0,0 +1,104 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import os
+import random
+import unittest
+
+import numpy as np
+
+from tgym.envs.average import AverageEnv
+from tgym.market_test import MarketTestCase
+from tgym.trajectory import TrajectoryRecorder, TrajectoryStore
+
+logging.root.setLevel(logging.ERROR)
+
+
+class TestTrajectory(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.env = AverageEnv(self.m, look_back_days=5,
+                              reward_fn="daily_return")
+        self.path = os.path.join(self.data_dir, "trajectory")
+
+    def run_episode(self, recorder, **kwargs):
+        all_obs, rewards, orders = [], [], []
+        recorder.reset()
+        done = False
+        while not done:
+            action = recorder.get_random_action()
+            obs, reward, done, info, _ = recorder.step(action, **kwargs)
+            all_obs.append(obs)
+            rewards.append(reward)
+            orders.extend(info["orders"])
+        return all_obs, rewards, orders
+
+    def test_record(self):
+        random.seed(0)
+        recorder = TrajectoryRecorder(self.env, self.path, chunk_size=16)
+        all_obs, rewards, orders = self.run_episode(recorder)
+        recorder.close()
+
+        store = TrajectoryStore(self.path)
+        self.assertEqual(len(all_obs), len(store))
+        self.assertEqual(1, len(store.episodes))
+        self.assertIsInstance(store.steps, np.memmap)
+        np.testing.assert_array_equal(rewards, store.steps["reward"])
+        self.assertTrue(store.steps["done"][-1])
+        self.assertEqual(5, store.steps["time_id"][0])
+        for step in [0, 3, 4, 20, len(all_obs) - 1]:
+            np.testing.assert_array_equal(all_obs[step],
+                                          store.get_obs(step))
+        self.assertEqual(len(orders), len(store.orders))
+        self.assertEqual([o[4] for o in orders],
+                         store.orders["volume"].tolist())
+        # 订单按块写入, 跨越多个chunk, 与env.ledger逐字段相同
+        ledger = self.env.ledger.orders
+        self.assertGreater(len(ledger), 16)
+        for name in ledger.dtype.names:
+            np.testing.assert_array_equal(ledger[name], store.orders[name])
+        self.assertEqual(self.env.portfolio_value,
+                         store.steps["portfolio_value"][-1])
+
+    def test_repeat(self):
+        # step(repeat=k)新增k行obs, repeat大于look_back_days时只保留最后几天
+        recorder = TrajectoryRecorder(self.env, self.path, chunk_size=16)
+        episodes = [self.run_episode(recorder, repeat=repeat)[0]
+                    for repeat in [3, 7, 1]]
+        recorder.close()
+        store = TrajectoryStore(self.path)
+        self.assertEqual(3, len(store.episodes))
+        self.assertEqual(sum(len(e) for e in episodes), len(store))
+        for episode, all_obs in enumerate(episodes):
+            start = store.episodes["start"][episode]
+            for step, obs in enumerate(all_obs):
+                np.testing.assert_array_equal(obs,
+                                              store.get_obs(start + step))
+        # 每步的time_id相差repeat天
+        self.assertEqual(3, np.diff(store.steps["time_id"][:2])[0])
+
+    def test_append(self):
+        random.seed(0)
+        recorder = TrajectoryRecorder(self.env, self.path, chunk_size=16)
+        self.run_episode(recorder)
+        recorder.close()
+        n_steps = len(TrajectoryStore(self.path))
+
+        # 再次打开时继续追加
+        recorder = TrajectoryRecorder(self.env, self.path, chunk_size=16)
+        all_obs, _, orders = self.run_episode(recorder)
+        recorder.flush()
+        store = TrajectoryStore(self.path)
+        self.assertEqual(2, len(store.episodes))
+        self.assertEqual(n_steps, store.episodes["start"][1])
+        np.testing.assert_array_equal(all_obs[2], store.get_obs(n_steps + 2))
+        self.assertEqual(len(orders), len(store.get_orders(1)))
+        recorder.close()
+
+        env = AverageEnv(self.m, look_back_days=6)
+        with self.assertRaises(Exception):
+            TrajectoryRecorder(env, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding:utf-8 -*-
+"""
+Walk-forward评估: 在一组连续滚动的[训练, 测试]窗口上, 用训练窗口得到策略, 在紧接着
+的测试窗口上运行, 最后把各测试窗口的权益曲线拼接为一条样本外(out-of-sample)曲线
+完整的历史只加载一次, 每个窗口使用Market.window()返回的视图, 不复制数据;
+多个窗口在多个进程中并行运行(fork, 子进程共享已加载的Market)
+"""
+import multiprocessing
+
+import numpy as np
+
+from tgym.scenario import make_env
+
+# 并行运行时子进程通过fork继承, 避免序列化Market
+_walk_forward = None
+
+
+def make_windows(dates, train_days, test_days, step_days=None):
+    """
+    dates: 开市日期列表, 如market.open_dates
+    train_days/test_days: 训练/测试窗口的交易日数
+    step_days: 相邻窗口之间间隔的交易日数, 默认为test_days, 测试窗口首尾相接
+    返回: [(train_start, train_end, test_start, test_end)]
+    """
+    step_days = step_days or test_days
+    windows = []
+    i = 0
+    while i + train_days + test_days <= len(dates):
+        windows.append((dates[i], dates[i + train_days - 1],
+                        dates[i + train_days],
+                        dates[i + train_days + test_days - 1]))
+        i += step_days
+    return windows
+
+
+class WalkForward:
+    """
+    market: 加载了全部历史的Market
+    windows: make_windows的返回值
+    make_policy: make_policy(train_market) -> policy, policy(obs) -> action;
+        train_market为训练窗口的Market视图. 并行运行时, make_policy与policy
+        在子进程中调用
+    其他参数见tgym/scenario.py中的make_env
+    """
+
+    def __init__(self, market, windows, make_policy, scenario="average",
+                 investment=100000.0, look_back_days=10,
+                 used_infos=["equities_hfq_info", "indexs_info"],
+                 reward_fn="daily_return"):
+        self.market = market
+        self.windows = windows
+        self.make_policy = make_policy
+        self.scenario = scenario
+        self.investment = investment
+        self.look_back_days = look_back_days
+        self.used_infos = used_infos
+        self.reward_fn = reward_fn
+
+    def get_test_market(self, test_start, test_end):
+        # 向前多取look_back_days天, 使第一次step就在test_start
+        first = self.market.calendar.pre_id(test_start) + 1
+        if first < self.look_back_days:
+            raise Exception(u"walk_forward: %s之前的数据不足%d天" % (
+                test_start, self.look_back_days))
+        start = self.market.open_dates[first - self.look_back_days]
+        return self.market.window(start, test_end)
+
+    def run_window(self, i):
+        """
+        运行第i个窗口, 返回: dict, 包括测试窗口每一步的日期与权益
+        """
+        train_start, train_end, test_start, test_end = self.windows[i]
+        policy = self.make_policy(self.market.window(train_start, train_end))
+        test_market = self.get_test_market(test_start, test_end)
+        env = make_env(self.scenario, test_market, self.investment,
+                       self.look_back_days, self.used_infos, self.reward_fn)
+        obs = env.reset()
+        dates = []
+        done = False
+        while not done:
+            dates.append(env.current_date)
+            obs, _, done, _, _ = env.step(policy(obs))
+        return {"window": self.windows[i], "dates": dates,
+                "portfolio_values": np.array(env.portfolio_value_logs)}
+
+    def run(self, n_jobs=None):
+        """
+        n_jobs: 进程数, 默认为CPU核数; 为1时在当前进程中依次运行
+        返回: 每个窗口的结果, 与windows顺序一致
+        """
+        global _walk_forward
+        n_jobs = n_jobs or multiprocessing.cpu_count()
+        n_jobs = min(n_jobs, len(self.windows))
+        if n_jobs <= 1:
+            return [self.run_window(i) for i in range(len(self.windows))]
+        # 子进程fork时继承当前的Market与make_policy, 技术指标与market_info
+        # 数组先在完整的Market上计算好, 各子进程共用
+        self.market.add_features(self.used_infos)
+        self.market.get_market_info_array(self.used_infos)
+        _walk_forward = self
+        try:
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(n_jobs) as pool:
+                return pool.map(_run_window, range(len(self.windows)))
+        finally:
+            _walk_forward = None
+
+
+def _run_window(i):
+    return _walk_forward.run_window(i)
+
+
+def stitch(results, investment=100000.0):
+    """
+    将各测试窗口的权益曲线按日收益率首尾相接, 得到一条样本外权益曲线
+    results: WalkForward.run的返回值, 测试窗口不能重叠
+    返回: dates, portfolio_values
+    """
+    dates, returns = [], []
+    for result in results:
+        values = result["portfolio_values"]
+        pre_values = np.concatenate(([investment], values[:-1]))
+        if dates and result["dates"][0] <= dates[-1]:
+            raise Exception(u"stitch: 测试窗口%s与之前的窗口重叠" %
+                            result["dates"][0])
+        dates.extend(result["dates"])
+        returns.append(values / pre_values)
+    if not returns:
+        return dates, np.zeros(0)
+    return dates, investment * np.cumprod(np.concatenate(returns))
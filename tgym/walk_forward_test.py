@@ -0,0 +1,97 @@
+# -*- coding:utf-8 -*-
+
+import logging
+import unittest
+
+import numpy as np
+
+from tgym.generator import generate_market
+from tgym.walk_forward import WalkForward, make_windows, stitch
+
+logging.root.setLevel(logging.ERROR)
+
+
+def make_policy(train_market):
+    # 训练窗口内收益率为正的股票买入, 否则卖出
+    close = train_market.prices["close"]
+    buy = np.where(close[-1] > close[0], 1.0, -1.0)
+    action = np.zeros(2 * len(buy))
+    action[1::2] = buy * 0.1
+    return lambda obs: action
+
+
+class TestWalkForward(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.m = generate_market("20170101", "20181231",
+                                 ["000001.SZ", "600000.SH"], seed=5)
+
+    def test_window(self):
+        view = self.m.window("20180101", "20180630")
+        self.assertEqual("20180101", view.open_dates[0])
+        self.assertEqual(self.m.open_dates.index("20180629") + 1,
+                         view.window_start + len(view.open_dates))
+        self.assertEqual(1, view.calendar.get_id("20180102"))
+        self.assertTrue(np.shares_memory(view.prices["close"],
+                                         self.m.prices["close"]))
+        array = view.get_market_info_array(["equities_hfq_info"])
+        self.assertTrue(np.shares_memory(
+            array, self.m.get_market_info_array(["equities_hfq_info"])))
+        self.assertEqual(len(view.open_dates), len(array))
+        # 视图上计算技术指标, 使用完整的历史
+        view.add_features(["ma_20"])
+        self.assertIn("ma_20", self.m.features)
+        np.testing.assert_allclose(
+            self.m.market_info["20180101"]["ma_20"],
+            view.get_market_info_array(["ma_20"], np.float64)[0])
+        sub = view.window("20180201", "20180228")
+        self.assertIs(self.m, sub.parent)
+        self.assertEqual(self.m.open_dates.index("20180201"),
+                         sub.window_start)
+        with self.assertRaises(Exception):
+            view.append_days("20190101")
+
+    def test_window_divide_rate(self):
+        m = generate_market("20170101", "20181231", ["000001.SZ"], seed=5,
+                            split_prob=0.02)
+        rates = m.prices["adj_factor"][1:, 0] / m.prices["adj_factor"][:-1, 0]
+        date_id = int(np.nonzero(rates > 1)[0][0]) + 1
+        date = m.open_dates[date_id]
+        # 视图第一天的拆分使用完整Market中前一天的复权因子
+        view = m.window(date, "20181231")
+        self.assertEqual(date, view.open_dates[0])
+        self.assertEqual(m.get_divide_rate_by_id(0, date_id),
+                         view.get_divide_rate_by_id(0, 0))
+        self.assertGreater(view.get_divide_rate("000001.SZ", date), 1)
+        np.testing.assert_array_equal(m.get_divide_rates_by_id(date_id),
+                                      view.get_divide_rates_by_id(0))
+        self.assertEqual(1.0, m.get_divide_rate_by_id(0, 0))
+
+    def test_run(self):
+        windows = make_windows(self.m.open_dates, 120, 60)
+        self.assertEqual(6, len(windows))
+        self.assertEqual(windows[0][3], self.m.open_dates[179])
+        self.assertEqual(windows[1][2], self.m.open_dates[180])
+        wf = WalkForward(self.m, windows, make_policy, look_back_days=10)
+        results = wf.run(n_jobs=1)
+        parallel = wf.run(n_jobs=3)
+        for r1, r2 in zip(results, parallel):
+            self.assertEqual(r1["dates"], r2["dates"])
+            np.testing.assert_array_equal(r1["portfolio_values"],
+                                          r2["portfolio_values"])
+        self.assertEqual(windows[0][2], results[0]["dates"][0])
+        self.assertEqual(windows[0][3], results[0]["dates"][-1])
+        self.assertEqual(60, len(results[0]["portfolio_values"]))
+
+        dates, values = stitch(results)
+        self.assertEqual(self.m.open_dates[120: 480], dates)
+        # 每个窗口的收益率相乘
+        total = np.prod([r["portfolio_values"][-1] / 100000.0
+                         for r in results])
+        self.assertAlmostEqual(total, values[-1] / 100000.0)
+        with self.assertRaises(Exception):
+            stitch(results + results[-1:])
+
+
+if __name__ == '__main__':
+    unittest.main()